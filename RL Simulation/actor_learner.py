@@ -0,0 +1,112 @@
+import multiprocessing
+import numpy as np
+import torch
+from constants import *
+from rl_agent import AntRLAgent
+
+# Actor-learner training: rollout worker processes play episodes with a copy of the policy and send
+# back their rewarded decisions; the learner (the calling process) trains its AntRLAgent on them and
+# republishes the weights.
+
+
+class SharedPolicy:
+    # The learner's policy weights in shared memory, flattened to float32, with a version number that
+    # goes up on every publish. Workers reload their copy only when the version has changed.
+    def __init__(self, policy_net):
+        state_dict = policy_net.state_dict()
+        self.shapes = [(name, tuple(tensor.shape)) for name, tensor in state_dict.items()]
+        self.weights = multiprocessing.Array('f', sum(tensor.numel() for tensor in state_dict.values()), lock=False)
+        self.version = multiprocessing.Value('q', 0, lock=False)
+        self.lock = multiprocessing.Lock()
+
+    def publish(self, policy_net):
+        flat = np.concatenate([tensor.detach().cpu().numpy().ravel() for tensor in policy_net.state_dict().values()])
+        with self.lock:
+            np.frombuffer(self.weights, dtype=np.float32)[:] = flat
+            self.version.value += 1
+
+    def fetch(self, policy_net, version):
+        # Load the published weights into policy_net unless it already has `version`; returns the
+        # version it has now
+        if self.version.value == version:
+            return version
+        with self.lock:
+            flat = np.frombuffer(self.weights, dtype=np.float32).copy()
+            version = self.version.value
+        state_dict = {}
+        offset = 0
+        for name, shape in self.shapes:
+            size = int(np.prod(shape))
+            state_dict[name] = torch.from_numpy(flat[offset:offset + size].reshape(shape))
+            offset += size
+        policy_net.load_state_dict(state_dict)
+        return version
+
+
+def rollout_worker(shared_policy, tasks, results, input_size, episode_length, run_episode):
+    # Play the episodes numbered in `tasks` until a None arrives, each with the newest published weights
+    torch.set_num_threads(1)  # Every worker gets one core
+    agent = AntRLAgent(input_size)
+    version = 0
+    for episode in iter(tasks.get, None):
+        version = shared_policy.fetch(agent.policy_net, version)
+        row = run_episode(agent, episode, episode_length, seed=TRAINING_SEED + episode)
+        results.put((episode, version, agent.memory.export(), row))
+        agent.memory.clear()
+
+
+def train(shared_agent, input_size, num_episodes, episode_length, run_episode, workers,
+          update_episodes=POLICY_UPDATE_EPISODES, max_policy_lag=MAX_POLICY_LAG):
+    # Generator: plays num_episodes episodes on `workers` processes while training shared_agent on
+    # them, and yields each episode's row (from run_episode) in episode order. shared_agent is updated
+    # after every `update_episodes` episodes received; episodes whose weights are more than
+    # `max_policy_lag` updates behind at that point only count towards the statistics.
+    shared_policy = SharedPolicy(shared_agent.policy_net)
+    shared_policy.publish(shared_agent.policy_net)
+    tasks = multiprocessing.Queue()
+    results = multiprocessing.Queue()
+    processes = [
+        multiprocessing.Process(target=rollout_worker, args=(shared_policy, tasks, results, input_size, episode_length, run_episode), daemon=True)
+        for _ in range(workers)
+    ]
+    for process in processes:
+        process.start()
+
+    # Keep one episode queued per worker besides the one it is playing, so none sits idle but
+    # episodes are not handed out long before they start
+    next_episode = min(2 * workers, num_episodes)
+    for episode in range(next_episode):
+        tasks.put(episode)
+
+    finished_rows = {}  # Key: episode, Value: row waiting for earlier episodes to finish
+    next_row = 0
+    received = 0
+    try:
+        for _ in range(num_episodes):
+            episode, version, trajectory, row = results.get()
+            if next_episode < num_episodes:
+                tasks.put(next_episode)
+                next_episode += 1
+
+            lag = shared_policy.version.value - version
+            if lag <= max_policy_lag:
+                shared_agent.memory.extend(trajectory)
+            else:
+                print(f"[Debug] Episode {episode + 1} played with weights {lag} updates old; not training on it.")
+            received += 1
+            if received % update_episodes == 0 and shared_agent.update_policy():
+                shared_policy.publish(shared_agent.policy_net)
+
+            finished_rows[episode] = row
+            while next_row in finished_rows:
+                yield finished_rows.pop(next_row)
+                next_row += 1
+    finally:
+        # Workers stop at a None once every episode is done; if training stopped early, stop them now
+        for process in processes:
+            if next_row < num_episodes:
+                process.terminate()
+            else:
+                tasks.put(None)
+        for process in processes:
+            process.join()
@@ -1,28 +1,73 @@
-import random
 import math
 import pygame
 from constants import *
-import collections  # Import collections module for OrderedDict
 import numpy as np 
+from population import AntPopulation, population_field
+from knowledge import CHARACTERISTIC_CODES, KnowledgeBase, LocationRegistry
+from rng_streams import RandomStreams
 
 class Ant:
-    def __init__(self, x, y, agent, ant_id, is_false_broadcaster=False):
+    # Per-tick state is stored in the shared AntPopulation arrays (see population.py)
+    x = population_field('x')
+    y = population_field('y')
+    direction = population_field('direction')
+    health = population_field('health')
+    lifespan = population_field('lifespan')
+    target = population_field('target')
+    is_false_broadcaster = population_field('is_false_broadcaster')
+    action_in_progress = population_field('action_in_progress')
+    arrived_at_target = population_field('arrived_at_target')
+    has_reached_target = population_field('has_reached_target')
+    is_exploring_target = population_field('is_exploring_target')
+
+    # Everything else an ant holds; no per-instance __dict__
+    __slots__ = (
+        'population', 'index', 'knowledge', 'rng', 'id', 'agent', 'sugarscape', 'current_time',
+        'turn_angle', 'initial_health', 'max_health', 'current_broadcast_characteristic',
+        'mean_interval', 'std_deviation', 'target_selection_interval', 'next_target_selection_time',
+        'confirmed_false_locations', 'confirmed_true_locations', 'false_broadcast_location',
+        'target_patch_center', 'just_ate_sugar', 'just_visited_false_location', 'just_reached_true_target',
+        'just_reached_false_target', 'own_false_locations', 'previous_health', 'cumulative_reward',
+        'frames_since_arrival', 'max_arrival_frames', 'total_episode_reward', 'health_at_action_start',
+        'current_action_type', 'selected_action_characteristics', 'action_start_time', 'action_duration',
+        'start_x', 'start_y', 'last_location', 'prev_state', 'prev_action', 'prev_log_prob', 'last_broadcasts',
+    )
+
+    def __init__(self, x, y, agent, ant_id, is_false_broadcaster=False, population=None, knowledge=None, rng=None):
+        self.population = population if population is not None else AntPopulation(1)
+        self.index = self.population.add()  # Slot in the population arrays
+        # communicated_targets and what this ant has sent to others live in the shared KnowledgeBase (see knowledge.py)
+        self.knowledge = knowledge if knowledge is not None else KnowledgeBase(LocationRegistry(), 1, track_time_received=True)
+        self.knowledge.ensure_ant(self.index)
         self.id = ant_id  # Unique identifier for the ant
+        self.agent = agent
+        self.sugarscape = None  # Reference to the Sugarscape instance
+
+        self.confirmed_false_locations = set()  # List to store confirmed false locations
+        self.confirmed_true_locations = set()  # List to store confirmed true locations
+        # Track false locations created by this ant if it is a false broadcaster
+        self.own_false_locations = set()
+        self.selected_action_characteristics = []  # Used for evaluation
+        # Key: location, Value: (characteristic, sim_time, whether everyone in reach was told) of the
+        # last broadcast of it that was actually sent
+        self.last_broadcasts = {}
+
+        self.reset(x, y, is_false_broadcaster, rng)
+
+    def reset(self, x, y, is_false_broadcaster=False, rng=None):
+        # Start a new episode at (x, y). SugarScape.reset calls this on the ants of the previous episode,
+        # which keep their population slot and containers.
+        self.rng = rng if rng is not None else RandomStreams()  # The SugarScape's random streams (see rng_streams.py)
         self.is_false_broadcaster = is_false_broadcaster
         self.current_time = 0
         self.x = x
         self.y = y
-        self.direction = random.uniform(0, 2 * math.pi)
+        self.direction = self.rng.spawn.uniform(0, 2 * math.pi)
         self.turn_angle = math.pi / 8
         self.health = INITIAL_HEALTH
         self.initial_health = INITIAL_HEALTH
         self.max_health = MAX_HEALTH
         self.target = None
-         # Use OrderedDict for communicated_targets to maintain order
-        self.communicated_targets = collections.OrderedDict()
-        # Key: (x, y), Value: {'accepted': count, 'rejected': count, 'confirmed': count, 'time_received': sim_time}
-
-        self.already_communicated = {}  # Key: other_ant, Value: {location: characteristic}
         self.current_broadcast_characteristic = None  # Track current broadcast characteristic
 
         self.lifespan = 0
@@ -34,14 +79,14 @@ class Ant:
         # Use a normal distribution for the first target selection interval
         self.target_selection_interval = max(
                     300,  # Minimum interval of 30 frames (~500 ms)
-                    int(random.gauss(self.mean_interval, self.std_deviation))
+                    int(self.rng.spawn.gauss(self.mean_interval, self.std_deviation))
                 ) 
         self.next_target_selection_time = self.target_selection_interval
 
-        self.confirmed_false_locations = set()  # List to store confirmed false locations
-        self.confirmed_true_locations = set()  # List to store confirmed true locations
+        self.confirmed_false_locations.clear()
+        self.confirmed_true_locations.clear()
+        self.last_broadcasts.clear()
 
-        self.sugarscape = None  # Reference to the Sugarscape instance
         self.false_broadcast_location = None  # Store the current false location being broadcast
         self.target_patch_center = None  # Store the center of the sugar patch for broadcasting
 
@@ -51,10 +96,7 @@ class Ant:
         self.just_reached_true_target = False  # Initialize the new flag
         self.just_reached_false_target = False  # Initialize the new flag
 
-        # Track false locations created by this ant if it is a false broadcaster
-        self.own_false_locations = set()
-
-        self.agent = agent
+        self.own_false_locations.clear()
 
         self.has_reached_target = False  # Add this line
 
@@ -73,23 +115,29 @@ class Ant:
 
         self.current_action_type = None
 
-        self.selected_action_characteristics = []  # Used for evaluation
+        self.selected_action_characteristics.clear()
         self.action_start_time = 0
 
         self.start_x = x
         self.start_y = y
 
         self.last_location = None
+
+        # A new ant only has these once it has acted (calculate_reward checks for action_duration)
+        for name in ('action_duration', 'prev_state', 'prev_action', 'prev_log_prob'):
+            if hasattr(self, name):
+                delattr(self, name)
         
     def detect_sugar(self, sugar_patches):
         closest_sugar = None
         closest_distance = float('inf')
         target_changed = False
+        x, y = self.x, self.y
 
-        for sugar in sugar_patches:
+        for sugar in sugar_patches.near(self.index):  # Patches close enough to be worth the exact check
             if sugar['count'] > 0:  # Only consider patches with sugar
-                dx = sugar['x'] - self.x
-                dy = sugar['y'] - self.y
+                dx = sugar['x'] - x
+                dy = sugar['y'] - y
                 distance = math.hypot(dx, dy)
 
                 if distance < DETECTION_RADIUS and distance < closest_distance:
@@ -107,6 +155,12 @@ class Ant:
         return False, False
 
     def select_new_target(self, sugarscape, sim_time):
+        state, possible_actions = self.candidate_actions(sim_time)
+        action_index, log_prob = self.agent.select_action(self.id, state, possible_actions)
+        self.take_action(sugarscape, sim_time, state, possible_actions, action_index, log_prob)
+
+    def candidate_actions(self, sim_time):
+        # First half of select_new_target: the state and the actions the policy chooses from
         self.has_reached_target = False
         self.health_at_action_start = self.health  # Record health at action start
         self.action_start_time = sim_time  # Record action start time
@@ -114,7 +168,7 @@ class Ant:
         state = self.get_state()
         # N = 10  # Number of communicated targets to consider
         target_items = list(self.communicated_targets.items())
-        random.shuffle(target_items)
+        self.rng.policy.shuffle(target_items)
         # target_items = target_items[:N]
         possible_actions = []
         for location, counts in target_items:
@@ -178,8 +232,10 @@ class Ant:
             }
         }
         possible_actions.append(explore_action)
+        return state, possible_actions
 
-        action_index, log_prob = self.agent.select_action(self.id, state, possible_actions)
+    def take_action(self, sugarscape, sim_time, state, possible_actions, action_index, log_prob):
+        # Second half of select_new_target: start the action the policy picked
         self.prev_state = state
         self.prev_action = action_index
         self.prev_log_prob = log_prob
@@ -194,7 +250,7 @@ class Ant:
             self.is_exploring_target = False
             self.broadcast_sugar_location('accepted')
 
-            if selected_action['location'] in [(patch['x'], patch['y']) for patch in sugarscape.sugar_patches]:
+            if sugarscape.sugar_patches.has_center(selected_action['location']):
                 sugarscape.true_positives += 1
             elif selected_action['location'] in sugarscape.historical_false_locations:
                 sugarscape.false_positives +=1 
@@ -274,58 +330,68 @@ class Ant:
             else:
                 return  # No valid location to broadcast
 
+        # Broadcasts only go out when they change something: a repeat of the last one is dropped
+        # unless an ant that may not have heard it has come within reach since
         location = (broadcast_x, broadcast_y)
+        last = self.last_broadcasts.get(location)
+        if last is not None and last[0] == characteristic and last[2] and self.sugarscape.nobody_new_in_reach(self.index, last[1]):
+            return
+
+        location_id = self.knowledge.locations.intern(location)
+        if self.sugarscape.message_queue is not None:
+            # Delivered when the tick ends; until then no broadcast of the location is a repeat
+            self.last_broadcasts.pop(location, None)
+            self.sugarscape.message_queue.add(self, location_id, location, characteristic)
+        else:
+            self.deliver_broadcast(location, location_id, characteristic, self.current_time)
+
+    def deliver_broadcast(self, location, location_id, characteristic, sim_time):
+        code = CHARACTERISTIC_CODES[characteristic]
+        if self.sugarscape.bulletin_board is not None:
+            # Everyone is in range: post once, receivers pick it up from the board
+            self.sugarscape.bulletin_board.post(self.index, location_id, code, sim_time)
+            self.last_broadcasts[location] = (characteristic, sim_time, True)
+            return
+
+        # Broadcast to other ants within the communication radius, skipping the ones that confirmed
+        # the location false or were already told the same characteristic by this ant
+        receivers = self.sugarscape.indices_near(self, COMMUNICATION_RADIUS)
+        self.knowledge.send(self.index, receivers, location_id, code, sim_time)
+        self.last_broadcasts[location] = (characteristic, sim_time, self.sugarscape.told_all_in_reach(self.index, location_id, code))
+
+    @property
+    def communicated_targets(self):
+        # Read-only view, {(x, y): {'accepted': count, 'rejected': count, 'confirmed': count, 'time_received': sim_time}}
+        self.receive_pending_broadcasts()
+        return self.knowledge.view(self.index)
+
+    def receive_pending_broadcasts(self):
+        # Catch up on messages posted to the bulletin board since this ant last looked
+        if self.sugarscape is not None and self.sugarscape.bulletin_board is not None:
+            self.sugarscape.bulletin_board.deliver(self.index)
 
-        # Broadcast to other ants within the communication radius
-        for other_ant in self.sugarscape.ants:
-            if other_ant != self:
-                dx = other_ant.x - self.x
-                dy = other_ant.y - self.y
-                dist = math.hypot(dx, dy)
-
-                if dist <= COMMUNICATION_RADIUS:
-                    if location in other_ant.confirmed_false_locations:
-                        continue  # Skip this location
-                    # Initialize 'already_communicated' entry for other_ant if not present
-                    if other_ant not in self.already_communicated:
-                        self.already_communicated[other_ant] = {}
-                    # Check if we've previously communicated this location to this ant
-                    previous_characteristic = self.already_communicated[other_ant].get(location)
-                    if previous_characteristic == characteristic:
-                        # Already communicated this characteristic to this ant for this location
-                        continue
-                    else:
-                        # Update other_ant's communicated_targets
-                        # Decrement count for previous characteristic if any
-                        if previous_characteristic:
-                            if location in other_ant.communicated_targets:
-                                if previous_characteristic in other_ant.communicated_targets[location]:
-                                    other_ant.communicated_targets[location][previous_characteristic] -= 1
-                                    if other_ant.communicated_targets[location][previous_characteristic] <= 0:
-                                        del other_ant.communicated_targets[location][previous_characteristic]
-                                    if not other_ant.communicated_targets[location]:
-                                        # Remove the location from communicated_targets
-                                        del other_ant.communicated_targets[location]
-                        # Increment count for new characteristic
-                        if location in other_ant.communicated_targets:
-                            # Update counts
-                            counts = other_ant.communicated_targets[location]
-                            counts[characteristic] = counts.get(characteristic, 0) + 1
-                            # Move the location to the end to reflect recent communication
-                            other_ant.communicated_targets.move_to_end(location)
-                        else:
-                            # Add new location
-                            other_ant.communicated_targets[location] = {characteristic: 1, 'time_received': self.current_time}
-                            # Ensure communicated_targets remains within size limit
-                            # if len(other_ant.communicated_targets) > 10:
-                            #     # Remove the oldest item
-                            #     other_ant.communicated_targets.popitem(last=False)
-                        # Update 'already_communicated'
-                        self.already_communicated[other_ant][location] = characteristic
-                        
-
-    
     def move(self, sugar_patches, sugarscape, sim_time):
+        self.think(sugar_patches, sugarscape, sim_time)
+        self.advance()
+
+    def think(self, sugar_patches, sugarscape, sim_time):
+        # Everything in a tick except the position/health update, which SugarScape can batch
+        if self.observe(sugar_patches, sugarscape, sim_time):
+            # if self.communicated_targets:
+            self.select_new_target(sugarscape, sim_time)
+            # else:
+                # No viable targets; explore
+                # self.explore()
+                # sugarscape.explore_count += 1
+            self.action_in_progress = True
+
+            # self.target_selection_interval = max(300, random.gauss(self.mean_interval, self.std_deviation))
+            # self.next_target_selection_time = self.current_time + self.target_selection_interval
+        self.steer(sim_time)
+
+    def observe(self, sugar_patches, sugarscape, sim_time):
+        # First part of think: detection, action bookkeeping and broadcasts. Returns whether the ant
+        # has to select a new target before steering
         self.current_time = sim_time
 
         # Store the previous target before detecting sugar
@@ -385,18 +451,11 @@ class Ant:
                 while not valid_location_found and attempts < max_attempts:
                     # Generate a random location within the game area with padding
                     candidate_location = (
-                        random.randint(padding, GAME_WIDTH - padding),
-                        random.randint(padding, HEIGHT - padding),
+                        self.rng.patches.randint(padding, GAME_WIDTH - padding),
+                        self.rng.patches.randint(padding, HEIGHT - padding),
                     )
-                    valid_location = True
-                    # Check distance to all sugar patches
-                    for sugar in self.sugarscape.sugar_patches:
-                        dx = sugar['x'] - candidate_location[0]
-                        dy = sugar['y'] - candidate_location[1]
-                        distance = math.hypot(dx, dy)
-                        if distance < 150:   # Minimum distance away from any sugar patch
-                            valid_location = False
-                            break  # No need to check other sugar patches
+                    # Minimum distance away from any sugar patch
+                    valid_location = not self.sugarscape.sugar_patches.any_within(candidate_location[0], candidate_location[1], 150)
 
                     if valid_location:
                         valid_location_found = True
@@ -415,11 +474,14 @@ class Ant:
             else:
                 if self.current_time >= self.sugarscape.broadcast_times[self]:
                     # Reset communication for the old false location
-                    for other_ant in list(self.already_communicated.keys()):
-                        if self.false_broadcast_location in self.already_communicated[other_ant]:
-                            del self.already_communicated[other_ant][self.false_broadcast_location]
-                            if not self.already_communicated[other_ant]:
-                                del self.already_communicated[other_ant]
+                    location_id = self.knowledge.locations.intern(self.false_broadcast_location)
+                    if self.sugarscape.bulletin_board is not None:
+                        self.sugarscape.bulletin_board.retract(self.index, location_id)
+                    else:
+                        self.knowledge.forget_sent(self.index, location_id)
+                    if self.sugarscape.message_queue is not None:
+                        self.sugarscape.message_queue.discard(self.index, location_id)
+                    self.last_broadcasts.pop(self.false_broadcast_location, None)
                     self.false_broadcast_location = None  # Reset to generate a new false location in the next frame
                 else:
                     # Continue broadcasting the current false location
@@ -428,20 +490,11 @@ class Ant:
                 self.broadcast_sugar_location('confirmed', false_location=True)
 
         # Movement logic that might change self.target
-        if not sugar_detected and not self.target and self.needs_to_eat() and not self.action_in_progress:
-            if self.current_time >= self.next_target_selection_time:
-                # if self.communicated_targets:
-                self.select_new_target(sugarscape, sim_time)
-                # else:
-                    # No viable targets; explore
-                    # self.explore()
-                    # sugarscape.explore_count += 1
-                self.action_in_progress = True
-
-                # self.target_selection_interval = max(300, random.gauss(self.mean_interval, self.std_deviation))
-                # self.next_target_selection_time = self.current_time + self.target_selection_interval
-
+        return (not sugar_detected and not self.target and self.needs_to_eat() and not self.action_in_progress
+                and self.current_time >= self.next_target_selection_time)
 
+    def steer(self, sim_time):
+        # Last part of think: head for the target (or wander) and handle arrival
         if self.target:
             dx = self.target[0] - self.x
             dy = self.target[1] - self.y
@@ -452,32 +505,33 @@ class Ant:
                 found_sugar = False
 
                 # Check if ant is within any sugar patch
-                for sugar in self.sugarscape.sugar_patches:
-                    dx = sugar['x'] - self.x
-                    dy = sugar['y'] - self.y
-                    distance_to_sugar = math.hypot(dx, dy)
-
-                    if distance_to_sugar <= sugar['radius'] and sugar['count'] > 0:
-                        found_sugar = True
-                        self.confirmed_true_locations.add(self.target)
-                        # print("Ant ", self.id, "arrived at a True location")
+                sugar = self.sugarscape.sugar_patches.patch_at(self.index, self.x, self.y)
+                if sugar is not None:
+                    found_sugar = True
+                    self.confirmed_true_locations.add(self.target)
+                    # print("Ant ", self.id, "arrived at a True location")
 
 
-                        if not self.is_exploring_target and not self.has_reached_target:
-                            self.just_reached_true_target = True
-
-                        if self.needs_to_eat():
-                            sugar['count'] -= 1
-                            if sugar['count'] <= 0:
-                                # Optionally remove or mark the sugar patch as depleted
-                                pass
+                    if not self.is_exploring_target and not self.has_reached_target:
+                        self.just_reached_true_target = True
+
+                    sugar_left = sugar['count']
+                    if self.needs_to_eat():
+                        sugar_left = self.sugarscape.sugar_patches.take(sugar, self)
+                        if sugar_left <= 0:
+                            # Optionally remove or mark the sugar patch as depleted
+                            pass
+                        if not self.sugarscape.double_buffered:
+                            # Otherwise SugarScape.commit feeds the ant if the unit is granted, so it
+                            # stays on the patch until it finds itself full
                             self.eat_sugar()
                             self.just_ate_sugar = True
-                        break
 
                 if not found_sugar:
                     # print("Ant ", self.id, "arrived at a false location")
+                    self.receive_pending_broadcasts()  # Messages posted before this point still count for this location
                     self.confirmed_false_locations.add(self.target)
+                    self.knowledge.confirm_false(self.index, self.knowledge.locations.intern(self.target))
                     if not self.is_exploring_target and not self.has_reached_target:
                         self.just_reached_false_target = True
                     self.just_visited_false_location = True
@@ -488,7 +542,7 @@ class Ant:
 
                 # **Modified Logic:**
                 if found_sugar:
-                    if self.health >= self.initial_health or sugar['count'] <= 0:
+                    if self.health >= self.initial_health or sugar_left <= 0:
                         # Ant's health is replenished or sugar is depleted
                         self.last_location = self.target
                         self.target = None
@@ -516,7 +570,7 @@ class Ant:
             else:
                 self.direction = math.atan2(dy, dx)
         else:
-            self.direction += random.uniform(-self.turn_angle, self.turn_angle)
+            self.direction += self.rng.movement.uniform(-self.turn_angle, self.turn_angle)
             self.direction %= 2 * math.pi  # Ensure direction stays within 0 to 2π
 
 
@@ -538,6 +592,8 @@ class Ant:
 
                     self.next_target_selection_time = self.current_time + self.target_selection_interval
 
+    def advance(self):
+        # Scalar version of AntPopulation.advance
         self.x += ANT_SPEED * math.cos(self.direction)
         self.y += ANT_SPEED * math.sin(self.direction)
         self.x = max(0, min(self.x, GAME_WIDTH))
@@ -571,15 +627,15 @@ class Ant:
     def is_alive(self):
         return self.health > 0
     
+    def ants_within(self, radius):
+        # Ants in sugarscape.ants within `radius` of this ant (itself included), via its neighbour structure
+        return self.sugarscape.ants_near(self, radius)
+
     def count_nearby_ants(self):
         count = 0
-        for other_ant in self.sugarscape.ants:
+        for other_ant in self.ants_within(DETECTION_RADIUS):
             if other_ant != self:
-                dx = other_ant.x - self.x
-                dy = other_ant.y - self.y
-                distance = math.hypot(dx, dy)
-                if distance <= DETECTION_RADIUS:
-                    count += 1
+                count += 1
         return count   
 
     #RL stuff
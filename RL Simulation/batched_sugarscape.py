@@ -0,0 +1,71 @@
+import numpy as np
+from constants import *
+from sugarscape import SugarScape
+from population import StackedPopulation
+from sugar_patches import StackedPatches
+
+
+class BatchedSugarScape:
+    # Several independent SugarScape worlds advanced in lockstep. Their population and patch arrays are
+    # stacked along a world axis, so every world's ants move in one batched update and find the patches
+    # near them in one distance computation; with batched_decisions, the ants of all worlds that pick a
+    # new target in a tick are scored in one policy call. Each world keeps the policy stream its seed
+    # gives it, so world w plays the episode SugarScape(shared_agent, vectorized=True, seed=seeds[w])
+    # plays with the same batched_decisions, up to the rounding of the batched forward pass.
+    def __init__(self, shared_agent, seeds, bulletin_board=BULLETIN_BOARD, batched_decisions=BATCHED_DECISIONS):
+        self.shared_agent = shared_agent
+        self.batched_decisions = batched_decisions
+        self.population = StackedPopulation(len(seeds), NUM_ANTS)
+        self.sugar_patches = StackedPatches(len(seeds))
+        self.worlds = []
+        self.generators = []  # Each world's policy stream, which the agent samples from during its turns
+        for world, seed in enumerate(seeds):
+            self.worlds.append(SugarScape(
+                shared_agent, vectorized=True, bulletin_board=bulletin_board, batched_decisions=batched_decisions, seed=seed,
+                population=self.population.worlds[world], sugar_patches=self.sugar_patches.worlds[world], first_ant_id=world * NUM_ANTS))
+            self.generators.append(getattr(shared_agent, 'generator', None))  # As the world's reset started it
+        self.active = np.ones(len(self.worlds), dtype=bool)  # Worlds with ants left; the others are no longer updated
+
+    def reset(self, seeds):
+        # Start a new episode in every world, reusing their ants and arrays
+        for world, seed in enumerate(seeds):
+            self.worlds[world].reset(seed)
+            self.generators[world] = getattr(self.shared_agent, 'generator', None)
+        self.active[:] = True
+
+    def __len__(self):
+        return len(self.worlds)
+
+    def update(self, sim_time):
+        active = np.flatnonzero(self.active).tolist()
+        # Finished worlds have no ants left, so they add nothing to the batches
+        self.sugar_patches.find_nearby([world.ant_indices for world in self.worlds], self.population.arrays['x'], self.population.arrays['y'])
+        pending_decisions = []
+        for world in active:
+            self.shared_agent.generator = self.generators[world]  # Ants that decide during their turn
+            pending_decisions.append(self.worlds[world].start_tick(sim_time, find_nearby=False))
+
+        requests = [(ant.id, state, possible_actions) for pending in pending_decisions for ant, state, possible_actions in pending]
+        if requests:
+            streams = [(len(pending), self.generators[world]) for world, pending in zip(active, pending_decisions) if pending]
+            decisions = self.shared_agent.select_actions(requests, streams)
+            start = 0
+            for world, pending in zip(active, pending_decisions):
+                if pending:
+                    self.worlds[world].resolve_decisions(pending, sim_time, decisions[start:start + len(pending)])
+                    start += len(pending)
+
+        for world in active:
+            self.worlds[world].remove_dead()
+        self.population.advance([world.ant_indices for world in self.worlds])
+        for world in active:
+            self.worlds[world].end_tick(sim_time)
+
+        self.active &= np.array([len(world.ants) > 0 for world in self.worlds])
+
+    def done(self):
+        return not self.active.any()
+
+    def get_analytics_data(self):
+        # One analytics dict per world, as SugarScape.get_analytics_data returns
+        return [world.get_analytics_data() for world in self.worlds]
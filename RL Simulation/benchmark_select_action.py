@@ -0,0 +1,57 @@
+import time
+import numpy as np
+import torch
+from rl_agent import AntRLAgent
+from policy_network import device
+
+# Decision latency of AntRLAgent.select_action against the number of candidate actions, next to the
+# old one-forward-pass-per-candidate loop for reference
+
+CANDIDATE_COUNTS = [1, 2, 5, 10, 20, 50, 100, 200, 400]
+REPEATS = 200
+
+
+def select_action_per_candidate(agent, state, possible_actions):
+    # The previous select_action: one forward pass per candidate
+    state_tensor = torch.FloatTensor(state).to(device)
+    action_logits = []
+    for action in possible_actions:
+        input_tensor = torch.cat([state_tensor, torch.FloatTensor(action['features']).to(device)])
+        action_logits.append(agent.policy_net(input_tensor))
+    action_logits = torch.stack(action_logits).squeeze(-1)
+    if agent.is_eval:
+        return torch.argmax(action_logits).item(), None
+    action_distribution = torch.distributions.Categorical(torch.softmax(action_logits, dim=0))
+    action_index = action_distribution.sample()
+    return action_index, action_distribution.log_prob(action_index)
+
+
+def time_decisions(select, agent, state, possible_actions):
+    select(agent, state, possible_actions)  # Warm up
+    start = time.perf_counter()
+    for _ in range(REPEATS):
+        select(agent, state, possible_actions)
+    agent.memory.clear()
+    return (time.perf_counter() - start) / REPEATS * 1e6
+
+
+def main():
+    state_size = 4  # Ant's own state features
+    action_feature_size = 5  # Features per action (communicated target)
+    agent = AntRLAgent(state_size + action_feature_size)
+    rng = np.random.default_rng(0)
+    state = rng.random(state_size).astype(np.float32)
+
+    for is_eval in (True, False):
+        agent.is_eval = is_eval
+        print(f"\n{'Evaluation' if is_eval else 'Training'} mode, microseconds per decision")
+        print(f"{'candidates':>10} {'batched':>10} {'per-candidate':>14} {'speedup':>8}")
+        for count in CANDIDATE_COUNTS:
+            possible_actions = [{'features': rng.random(action_feature_size).astype(np.float32)} for _ in range(count)]
+            batched = time_decisions(lambda a, s, p: a.select_action(0, s, p), agent, state, possible_actions)
+            looped = time_decisions(select_action_per_candidate, agent, state, possible_actions)
+            print(f"{count:>10} {batched:>10.1f} {looped:>14.1f} {looped / batched:>7.1f}x")
+
+
+if __name__ == "__main__":
+    main()
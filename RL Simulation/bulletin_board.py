@@ -0,0 +1,48 @@
+class BulletinBoard:
+    # Shared message log used when the communication radius covers the whole world. Every broadcast
+    # would reach every other ant, so instead of updating each receiver a sender posts a message once,
+    # and only when its characteristic for a location changes. Receivers replay the messages they have
+    # not seen yet whenever they read their communicated targets.
+    # Ants are identified by their KnowledgeBase rows and locations by their LocationRegistry ids.
+    def __init__(self, knowledge, rows):
+        self.knowledge = knowledge
+        self.entries = []  # (sender, location_id, previous_code, code, sim_time)
+        self.offset = 0  # Log position of entries[0]
+        self.posted = {}  # Key: (sender, location_id), Value: characteristic code; the board's KnowledgeBase.sent
+        self.cursors = {row: 0 for row in rows}  # Key: receiver, Value: log position of its next message
+
+    def post(self, sender, location_id, code, sim_time):
+        key = (sender, location_id)
+        previous_code = self.posted.get(key, 0)
+        if previous_code == code:
+            return  # Every receiver already has this characteristic from this sender
+        self.posted[key] = code
+        self.entries.append((sender, location_id, previous_code, code, sim_time))
+
+    def retract(self, sender, location_id):
+        # Forget that the location was posted by `sender`, so a later post counts as a new message
+        self.posted.pop((sender, location_id), None)
+
+    def deliver(self, row):
+        # Apply the messages `row` has not seen yet, in the order they were posted
+        cursor = self.cursors.get(row)
+        end = self.offset + len(self.entries)
+        if cursor is None or cursor == end:
+            return
+        knowledge = self.knowledge
+        for sender, location_id, previous_code, code, sim_time in self.entries[cursor - self.offset:]:
+            if sender != row and not knowledge.is_confirmed_false(row, location_id):
+                knowledge.receive_one(row, location_id, previous_code, code, sim_time)
+        self.cursors[row] = end
+
+    def unsubscribe(self, row):
+        # Called when an ant leaves the simulation: it keeps what was posted while it was listening
+        self.deliver(row)
+        del self.cursors[row]
+
+    def trim(self):
+        # Drop the messages every listening ant has already applied
+        oldest = min(self.cursors.values(), default=self.offset + len(self.entries))
+        if oldest > self.offset:
+            del self.entries[:oldest - self.offset]
+            self.offset = oldest
@@ -1,5 +1,6 @@
 # constants.py
 import math
+import os
 
 
 GAME_WIDTH, HEIGHT = 750, 750
@@ -20,9 +21,40 @@ NEW_SUGAR_INTERVAL = int(10000 / MILLISECONDS_PER_FRAME)
 
 COMMUNICATION_RADIUS = 8000   # Change this to 80 for the face-to-face simulation
 DETECTION_RADIUS = 70
+WORLD_DIAGONAL = math.hypot(GAME_WIDTH, HEIGHT)  # Largest possible distance between two ants
 
 TARGET_SELECTION_INTERVAL = int(8000 / MILLISECONDS_PER_FRAME)
 
+# Engine settings
+VECTORIZED_ENGINE = False   # Move all ants with batched NumPy updates after they have all thought, instead of each right after its own turn; in face-to-face mode the others are then seen where they started the tick, changes results
+GRID_CELL_SIZE = DETECTION_RADIUS   # Cell size of the spatial grid used for communication/detection radius queries
+GRID_MIN_ANTS = 64   # Below this many ants radius queries scan every ant instead of using the grid
+NUMBA_KERNELS = True   # Run the array loops of a tick as numba-compiled kernels (kernels.py) when numba is installed; results are the same either way
+BULLETIN_BOARD = True   # Post broadcasts to a shared log when COMMUNICATION_RADIUS covers the whole world
+BATCHED_DECISIONS = False   # Score every ant choosing a new target this tick in one policy forward pass; those ants finish their tick after the others, changes results
+INFERENCE_BACKEND = 'numpy'   # Policy backend for evaluating trained models: 'numpy' (torch is never imported) or 'torch'
+EVENT_SCHEDULER = False   # Ants walking to a fixed target skip their turns until their next event (event_scheduler.py); they keep their heading meanwhile, changes results
+EVENT_SCHEDULER_VALIDATE = False   # With EVENT_SCHEDULER, still give every ant every turn and check the sleeping ones met no event and kept to their course
+MESSAGE_QUEUE = False   # Hold broadcasts until the end of the tick and deliver them together (message_queue.py); changes results
+DOUBLE_BUFFERED = False   # Two-phase tick: ants decide from the state the tick started with, then their moves, meals and broadcasts are committed together; implies VECTORIZED_ENGINE and MESSAGE_QUEUE, changes results
+INTENT_THREADS = min(4, os.cpu_count() or 1)   # Threads that build the neighbour structures of a DOUBLE_BUFFERED tick from its snapshot; needs NUMBA_KERNELS, whose kernels release the GIL
+PARALLEL_MIN_ANTS = 128   # Below this many ants those structures are built on one thread
+
+# Evaluation settings
+EVALUATION_WORKERS = 1   # Processes the evaluation scripts spread episodes over; 1 runs in-process, 0 uses every core
+EVALUATION_SEED = 0   # Episode e of an evaluation is seeded with EVALUATION_SEED + e
+EVALUATION_WORLDS = 1   # Episodes each evaluation process plays in lockstep (batched_sugarscape.py); 1 plays them one at a time
+INFERENCE_SERVER = False   # Evaluation workers send their decisions to one batched inference server (inference_server.py) instead of each loading the model
+INFERENCE_MAX_BATCH = 4096   # Most decisions the inference server scores in one forward pass
+INFERENCE_DEADLINE = 0.001   # Seconds the inference server waits for more requests before scoring a batch
+
+# Training settings
+TRAINING_WORKERS = 1   # Rollout processes for train_RL.py; 1 trains in-process, 0 uses every core
+POLICY_UPDATE_EPISODES = 1   # Episodes the learner collects between policy updates
+MAX_POLICY_LAG = 2   # Episodes played with weights more than this many updates old are not trained on
+TRAINING_SEED = 0   # With rollout workers, episode e is seeded with TRAINING_SEED + e
+
+
 
 
 grid_size = int(math.sqrt(SUGAR_MAX))  # Grid size for sugar patch
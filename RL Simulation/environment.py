@@ -0,0 +1,86 @@
+import sys
+import pygame
+from constants import *
+from sugarscape import SugarScape
+
+
+def open_display(caption="SugarScape Simulation with Analytics"):
+    # Open the window and return the (screen, clock, font) display SugarScapeEnv.render draws on
+    pygame.init()
+    screen = pygame.display.set_mode((WIDTH, HEIGHT))
+    pygame.display.set_caption(caption)
+    clock = pygame.time.Clock()
+    font = pygame.font.Font(None, 24)
+    return screen, clock, font
+
+
+def handle_events():
+    # Exit when the window is closed
+    for event in pygame.event.get():
+        if event.type == pygame.QUIT:
+            pygame.quit()
+            sys.exit()
+
+
+class SugarScapeEnv:
+    # The episode loop of the simulation scripts around a SugarScape: reset(seed) starts a new episode
+    # and step() plays one tick. The ants act through their own agent, so rather than observations and
+    # rewards step() returns (terminated, truncated): whether fewer than min_ants ants are left, and
+    # whether episode_length ticks have been played. Positional and other keyword arguments are passed
+    # on to SugarScape. One SugarScape serves every episode, reset in place.
+    reused = {}  # Key: constructor arguments, Value: the env shared() returns for them
+
+    def __init__(self, *args, episode_length=None, min_ants=1, **kwargs):
+        self.args = args
+        self.kwargs = kwargs
+        self.episode_length = episode_length
+        self.min_ants = min_ants
+        self.sugarscape = None
+        self.sim_time = 0
+
+    @classmethod
+    def shared(cls, *args, **kwargs):
+        # An env with these arguments that is reused by every call in this process, so a script
+        # building one per episode still recycles the same SugarScape
+        key = (args, tuple(sorted(kwargs.items())))
+        if key not in cls.reused:
+            cls.reused[key] = cls(*args, **kwargs)
+        return cls.reused[key]
+
+    def reset(self, seed=None):
+        if self.sugarscape is None:
+            self.sugarscape = SugarScape(*self.args, seed=seed, **self.kwargs)
+        else:
+            self.sugarscape.reset(seed)
+        self.sim_time = 0
+        return self.sugarscape
+
+    def step(self):
+        self.sim_time += 1
+        self.sugarscape.update(self.sim_time)
+        terminated = len(self.sugarscape.ants) < self.min_ants
+        truncated = self.episode_length is not None and self.sim_time >= self.episode_length
+        return terminated, truncated
+
+    def render(self, display, fps):
+        # Draw the world and the analytics panel on an open_display() display
+        screen, clock, font = display
+        game_surface = pygame.Surface((GAME_WIDTH, HEIGHT))
+        self.sugarscape.draw(game_surface)
+        screen.blit(game_surface, (0, 0))
+
+        analytics_surface = pygame.Surface((ANALYTICS_WIDTH, HEIGHT))
+        analytics_surface.fill(WHITE)
+        pygame.draw.line(analytics_surface, GRAY, (0, 0), (0, HEIGHT), 3)
+
+        analytics_data = self.sugarscape.get_analytics_data()
+        y_offset = 20
+        for key, value in analytics_data.items():
+            text = font.render(f"{key}: {value}", True, BLACK)
+            analytics_surface.blit(text, (10, y_offset))
+            y_offset += 30
+
+        screen.blit(analytics_surface, (GAME_WIDTH, 0))
+
+        pygame.display.flip()
+        clock.tick(fps)
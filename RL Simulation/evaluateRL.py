@@ -1,36 +1,163 @@
 import pygame
-import sys
 import time
+import multiprocessing
 from constants import *
-from sugarscape import SugarScape
+from environment import SugarScapeEnv, open_display, handle_events
+from batched_sugarscape import BatchedSugarScape
 import matplotlib.pyplot as plt
 from rl_agent import AntRLAgent
+from inference_server import InferenceServer, RemoteAgent
 import os
 import numpy as np
 from sklearn.linear_model import LinearRegression
 from collections import Counter
 import csv  # Import csv module
+import functools
+import itertools
 
 def moving_average(data, window_size):
     return np.convolve(data, np.ones(window_size)/window_size, mode='valid')
 
-def main(render=False):
-    if render:
-        pygame.init()
-        screen = pygame.display.set_mode((WIDTH, HEIGHT))
-        pygame.display.set_caption("SugarScape Simulation with Analytics")
-        clock = pygame.time.Clock()
-        font = pygame.font.Font(None, 24)
+FIELDNAMES = ['Episode', 'Average Reward', 'Average Lifespan', 'True Location Selections', 'False Location Selections', 'Explore Actions', 'Target Actions']
+
+worker_agent = None  # Agent of an evaluation worker process, loaded once by init_worker
 
+
+def load_agent(trained_model_path):
     # Initialize the RL agent
     state_size = 4  # Ant's own state features
     action_feature_size = 5  # Features per action (communicated target)
     input_size = state_size + action_feature_size
-    shared_agent = AntRLAgent(input_size)
+    shared_agent = AntRLAgent(input_size, backend=INFERENCE_BACKEND)
 
     # Load the trained model
-    trained_model_path = "F_trained_fixed_4.pth"  # Replace with your model filename
     shared_agent.load_model(trained_model_path)
+    return shared_agent
+
+
+def run_episode(shared_agent, episode, num_episodes, episode_length, display=None):
+    # Run one evaluation episode and return its CSV row. `display` is (screen, clock, font) when rendering
+    print(f"Starting Evaluation Episode {episode + 1}/{num_episodes}")
+
+    # Start timing the episode
+    episode_start_time = time.time()
+
+    # Initialize the environment for each episode, with its own seed so the result does not depend on
+    # which process runs it or when
+    env = SugarScapeEnv.shared(shared_agent, episode_length=episode_length)
+    sugarscape = env.reset(EVALUATION_SEED + episode)
+
+    terminated = truncated = False
+    while not (terminated or truncated):
+        if display:
+            handle_events()
+
+        terminated, truncated = env.step()
+
+        if display:
+            env.render(display, 500)
+
+    # Early termination condition: the episode ended because no ants remain
+    if terminated:
+        print("All ants have died. Ending episode early.")
+
+    return episode_row(sugarscape, episode, env.sim_time, time.time() - episode_start_time)
+
+
+def episode_row(sugarscape, episode, sim_time, episode_duration):
+    # CSV row of a finished episode
+    # Collect rewards for all ants after the episode ends
+    total_rewards = []
+    for ant in sugarscape.all_ants:
+        total_rewards.append(ant.total_episode_reward)
+
+    # Collect action characteristics from all ants
+    action_characteristics_list = []
+    for ant in sugarscape.all_ants:
+        action_characteristics_list.extend(ant.selected_action_characteristics)
+        ant.selected_action_characteristics = []  # Reset for next episode
+
+    # No policy update during evaluation
+
+    # Compute the average reward for the episode
+    if total_rewards:
+        average_reward = sum(total_rewards) / len(total_rewards)
+    else:
+        average_reward = 0
+
+    print(f"Episode {episode + 1}; Duration: {episode_duration:.2f} seconds; Average Reward: {average_reward:.2f}")
+
+    # Collect and print other metrics
+    analytics_data = sugarscape.get_analytics_data()
+    average_lifespan = analytics_data.get('Average Lifespan', 0)
+    true_positives = analytics_data.get('True Positives', 0)
+    false_positives = analytics_data.get('False Positives', 0)
+
+    print(f"Episode Time: {sim_time}")
+    print(f"Average Lifespan: {average_lifespan:.2f}")
+
+    # Count explore and target actions
+    total_actions = len(action_characteristics_list)
+    explore_actions = sum(1 for action in action_characteristics_list if action.get('type') == 'explore')
+    target_actions = total_actions - explore_actions
+
+    return {
+        'Episode': episode + 1,
+        'Average Reward': average_reward,
+        'Average Lifespan': average_lifespan,
+        'True Location Selections': true_positives,
+        'False Location Selections': false_positives,
+        'Explore Actions': explore_actions,
+        'Target Actions': target_actions
+    }
+
+
+def run_episodes(shared_agent, episodes, num_episodes, episode_length):
+    # run_episode for several episodes at once, played in lockstep by a BatchedSugarScape; returns
+    # their rows in the same order
+    for episode in episodes:
+        print(f"Starting Evaluation Episode {episode + 1}/{num_episodes}")
+    episode_start_time = time.time()
+    sugarscapes = BatchedSugarScape(shared_agent, [EVALUATION_SEED + episode for episode in episodes])
+    end_times = [episode_length] * len(episodes)  # Tick each episode ended on
+    sim_time = 0
+    while sim_time < episode_length and not sugarscapes.done():
+        sim_time += 1
+        was_active = sugarscapes.active.copy()
+        sugarscapes.update(sim_time)
+        for world in np.flatnonzero(was_active & ~sugarscapes.active):
+            print("All ants have died. Ending episode early.")
+            end_times[world] = sim_time
+    episode_duration = time.time() - episode_start_time
+    return [episode_row(sugarscape, episode, end_time, episode_duration) for sugarscape, episode, end_time in zip(sugarscapes.worlds, episodes, end_times)]
+
+
+def init_worker(trained_model_path, server_address=None):
+    # With an inference server the worker holds no model, only a connection to the server
+    global worker_agent
+    if server_address is not None:
+        worker_agent = RemoteAgent(server_address)
+        return
+    if INFERENCE_BACKEND == 'torch':
+        import torch
+        torch.set_num_threads(1)  # The pool already keeps every core busy
+    worker_agent = load_agent(trained_model_path)
+
+
+def evaluate_episode(args):
+    # Pool task: one episode with the worker's agent
+    return run_episode(worker_agent, *args)
+
+
+def evaluate_episodes(args):
+    # Pool task: several episodes in lockstep with the worker's agent
+    return run_episodes(worker_agent, *args)
+
+
+def main(render=False, workers=EVALUATION_WORKERS, worlds=EVALUATION_WORLDS):
+    display = open_display() if render else None
+
+    trained_model_path = "F_trained_fixed_4.pth"  # Replace with your model filename
 
     num_episodes = 500  # Define the number of evaluation episodes
     episode_length = 30000  # Define the length of each episode in time steps
@@ -38,125 +165,47 @@ def main(render=False):
     episode_rewards = []
     episode_lifespans = []  # For tracking average lifespans
 
-    action_characteristics_list = []
-
     # Set the CSV filename based on the model being evaluated
     csv_filename = 'F_RL_evaluation_fixed_4.csv'  # You can change 'model1' to reflect your model's name
 
-    # Open the CSV file and write the headers
+    # Rendering runs in this process; otherwise episodes are shared out over a process pool. Either
+    # way rows come back in episode order. With worlds > 1 each task is that many episodes, played in
+    # lockstep (batched_sugarscape.py).
+    workers = workers or os.cpu_count()
+    worlds = 1 if render else worlds
+    if worlds > 1:
+        tasks = [(range(first, min(first + worlds, num_episodes)), num_episodes, episode_length) for first in range(0, num_episodes, worlds)]
+        run_task, pool_task = run_episodes, evaluate_episodes
+    else:
+        tasks = [(episode, num_episodes, episode_length) for episode in range(num_episodes)]
+        run_task, pool_task = functools.partial(run_episode, display=display), evaluate_episode
+    pool = None
+    server = None
+    if render or workers == 1:
+        shared_agent = load_agent(trained_model_path)
+        results = (run_task(shared_agent, *task) for task in tasks)
+    else:
+        if INFERENCE_SERVER:
+            server = InferenceServer(load_agent(trained_model_path)).start()
+        pool = multiprocessing.Pool(workers, initializer=init_worker, initargs=(trained_model_path, server and server.address))
+        results = pool.imap(pool_task, tasks)
+    rows = itertools.chain.from_iterable(results) if worlds > 1 else results
+
+    # Write the headers, then each episode's row as soon as it and all earlier episodes are done
     with open(csv_filename, mode='w', newline='') as csv_file:
-        fieldnames = ['Episode', 'Average Reward', 'Average Lifespan', 'True Location Selections', 'False Location Selections', 'Explore Actions', 'Target Actions']
-        writer = csv.DictWriter(csv_file, fieldnames=fieldnames)
+        writer = csv.DictWriter(csv_file, fieldnames=FIELDNAMES)
         writer.writeheader()
-
-    for episode in range(num_episodes):
-        print(f"Starting Evaluation Episode {episode + 1}/{num_episodes}")
-
-        # Start timing the episode
-        episode_start_time = time.time()
-
-        # Initialize the environment for each episode
-        sugarscape = SugarScape(shared_agent)
-        sim_time = 0  # Initialize simulation time
-
-        running = True
-        while running and sim_time < episode_length:
-            if render:
-                for event in pygame.event.get():
-                    if event.type == pygame.QUIT:
-                        running = False
-                        pygame.quit()
-                        sys.exit()
-
-            sim_time += 1
-
-            sugarscape.update(sim_time)
-
-            if render:
-                game_surface = pygame.Surface((GAME_WIDTH, HEIGHT))
-                sugarscape.draw(game_surface)
-                screen.blit(game_surface, (0, 0))
-
-                analytics_surface = pygame.Surface((ANALYTICS_WIDTH, HEIGHT))
-                analytics_surface.fill(WHITE)
-                pygame.draw.line(analytics_surface, GRAY, (0, 0), (0, HEIGHT), 3)
-
-                analytics_data = sugarscape.get_analytics_data()
-                y_offset = 20
-                for key, value in analytics_data.items():
-                    text = font.render(f"{key}: {value}", True, BLACK)
-                    analytics_surface.blit(text, (10, y_offset))
-                    y_offset += 30
-
-                screen.blit(analytics_surface, (GAME_WIDTH, 0))
-
-                pygame.display.flip()
-                clock.tick(500)  # Limit the frame rate to 60 FPS
-
-            # Early termination condition: End the episode if fewer than 'min_ants_alive' remain
-            if len(sugarscape.ants) == 0:
-                print("All ants have died. Ending episode early.")
-                break
-
-        # Collect rewards for all ants after the episode ends
-        total_rewards = []
-        for ant in sugarscape.all_ants:
-            total_rewards.append(ant.total_episode_reward)
-
-        # Collect action characteristics from all ants
-        for ant in sugarscape.all_ants:
-            action_characteristics_list.extend(ant.selected_action_characteristics)
-            ant.selected_action_characteristics = []  # Reset for next episode
-
-        # No policy update during evaluation
-
-        # End of episode timing
-        episode_end_time = time.time()
-        episode_duration = episode_end_time - episode_start_time
-
-        # Compute the average reward for the episode
-        if total_rewards:
-            average_reward = sum(total_rewards) / len(total_rewards)
-        else:
-            average_reward = 0
-
-        print(f"Episode {episode + 1}; Duration: {episode_duration:.2f} seconds; Average Reward: {average_reward:.2f}")
-
-        # Store the average reward for this episode
-        episode_rewards.append(average_reward)
-
-        # Collect and print other metrics
-        analytics_data = sugarscape.get_analytics_data()
-        average_lifespan = analytics_data.get('Average Lifespan', 0)
-        true_positives = analytics_data.get('True Positives', 0)
-        false_positives = analytics_data.get('False Positives', 0)
-
-        print(f"Episode Time: {sim_time}")
-        print(f"Average Lifespan: {average_lifespan:.2f}")
-
-        episode_lifespans.append(average_lifespan)
-
-
-        # Count explore and target actions
-        total_actions = len(action_characteristics_list)
-        explore_actions = sum(1 for action in action_characteristics_list if action.get('type') == 'explore')
-        target_actions = total_actions - explore_actions
-
-        # Append the data to the CSV file
-        with open(csv_filename, mode='a', newline='') as csv_file:
-            writer = csv.DictWriter(csv_file, fieldnames=fieldnames)
-            writer.writerow({
-                'Episode': episode + 1,
-                'Average Reward': average_reward,
-                'Average Lifespan': average_lifespan,
-                'True Location Selections': true_positives,
-                'False Location Selections': false_positives,
-                'Explore Actions': explore_actions,
-                'Target Actions': target_actions
-            })
-
-        # Reset action_characteristics_list for the next episode
-        action_characteristics_list = []
+        for row in rows:
+            writer.writerow(row)
+            csv_file.flush()
+            episode_rewards.append(row['Average Reward'])
+            episode_lifespans.append(row['Average Lifespan'])
+
+    if pool is not None:
+        pool.close()
+        pool.join()
+    if server is not None:
+        server.close()
 
     # Compute and print the overall average reward and lifespan
     total_average_reward = sum(episode_rewards) / len(episode_rewards)
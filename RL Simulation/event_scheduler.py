@@ -0,0 +1,116 @@
+import heapq
+import math
+import numpy as np
+from constants import *
+from knowledge import CHARACTERISTIC_CODES
+
+
+class EventScheduler:
+    # Lets ants skip the ticks in which nothing can happen to them. An ant walking to a fixed target
+    # goes in a straight line at ANT_SPEED, so once its broadcast is a repeat that changes nobody's
+    # knowledge it is put to sleep until its next event, kept with its tick in a heap:
+    #   - arriving, whose tick follows in closed form from its distance to the target;
+    #   - the end of the explore action it detected its target during;
+    #   - another ant coming within its communication radius (SugarScape.track_reach), which its
+    #     next broadcast would reach.
+    # A sleeping ant does not take its turn at all: it keeps the heading it fell asleep with and the
+    # population moves it along it, decays its health and finds it dead as usual. Taking its turn
+    # would aim it at the target again every tick, which differs from the kept heading in the last
+    # bits, so episodes come out slightly different from the per-tick engine.
+    # Wandering ants draw from the shared movement stream every tick and are never put to sleep.
+    # With validate, every ant still takes every turn, so the episode is the per-tick engine's, and
+    # end_tick checks that the sleeping ants met no event and stayed on their closed-form course.
+    def __init__(self, capacity, validate=EVENT_SCHEDULER_VALIDATE):
+        self.validate = validate
+        self.asleep = np.zeros(capacity, dtype=bool)  # By population index
+        self.wake_times = []  # Heap of (tick, population index) of the sleeping ants; may hold ants woken early
+        self.previous_targets = np.empty(capacity, dtype=object)  # Targets as of the start of the tick
+        self.courses = {}  # With validate, key: population index, Value: (tick, x, y, direction) it fell asleep with
+        self.expected = []  # (ant, target, next_target_selection_time) checked by end_tick
+
+    def clear(self):
+        self.asleep[:] = False
+        self.wake_times.clear()
+        self.courses.clear()
+        self.expected.clear()
+
+    def start_tick(self, sugarscape, alive, sim_time):
+        # Wake the ants whose event is due and return the mask over sugarscape.ants of the ants that
+        # take their turn. Called once track_reach has seen who came into whose reach this tick.
+        while self.wake_times and self.wake_times[0][0] <= sim_time:
+            _, index = heapq.heappop(self.wake_times)
+            self.asleep[index] = False
+        indices = sugarscape.ant_indices
+        if sugarscape.reach_changed is not None:
+            self.asleep[indices[sugarscape.reach_changed[indices] == sim_time]] = False
+        self.previous_targets[indices] = sugarscape.population.target[indices]
+        awake = alive & ~self.asleep[indices]
+        if not self.validate:
+            return awake
+
+        for ant, is_alive, is_awake in zip(sugarscape.ants, alive, awake):
+            if is_alive and not is_awake:
+                if not self.repeats_broadcast(sugarscape, ant):
+                    self.diverged(ant, sim_time, "its broadcast would reach someone new")
+                self.expected.append((ant, ant.target, ant.next_target_selection_time))
+        return alive
+
+    def end_tick(self, sugarscape, sim_time):
+        # Put the ants that walked on to an unchanged target this tick to sleep until their next event.
+        # Called once the survivors have moved.
+        if self.validate:
+            for ant, target, next_target_selection_time in self.expected:
+                if ant.target != target or ant.arrived_at_target or ant.next_target_selection_time != next_target_selection_time:
+                    self.diverged(ant, sim_time, "it reached an event while asleep")
+                tick, x, y, direction = self.courses[ant.index]
+                steps = (sim_time - tick) * ANT_SPEED
+                if abs(x + steps * math.cos(direction) - ant.x) > 1e-6 or abs(y + steps * math.sin(direction) - ant.y) > 1e-6:
+                    self.diverged(ant, sim_time, "it left its course")
+            self.expected.clear()
+
+        indices = sugarscape.ant_indices
+        population = sugarscape.population
+        targets = population.target[indices]
+        settled = ~self.asleep[indices] & (targets != None) & (targets == self.previous_targets[indices])
+        settled &= ~population.arrived_at_target[indices] & ~population.is_false_broadcaster[indices]
+
+        for position in np.flatnonzero(settled).tolist():
+            ant = sugarscape.ants[position]
+            if not self.broadcast_settled(sugarscape, ant):
+                continue
+            target = ant.target
+            # The ant gets ANT_SPEED closer per tick and takes the target once it is less than ANT_SPEED
+            # away, which is distance // ANT_SPEED + 1 ticks from now; it wakes a tick before that so
+            # rounding on the way cannot make it miss the target
+            wake_time = sim_time + int(math.hypot(target[0] - ant.x, target[1] - ant.y) // ANT_SPEED)
+            if ant.action_in_progress and ant.current_action_type == 'explore':
+                wake_time = min(wake_time, math.ceil(ant.next_target_selection_time))
+            if wake_time > sim_time + 1:
+                heapq.heappush(self.wake_times, (wake_time, ant.index))
+                self.asleep[ant.index] = True
+                if self.validate:
+                    self.courses[ant.index] = (sim_time, ant.x, ant.y, ant.direction)
+
+    def broadcast_settled(self, sugarscape, ant):
+        # Whether broadcast_sugar_location will drop the ant's broadcast as a repeat every tick until
+        # someone new comes into its reach, which wakes it
+        if ant.is_exploring_target:
+            return True  # Ants walking to an exploration target do not broadcast
+        last = ant.last_broadcasts.get(ant.target_patch_center or ant.target)  # As broadcast_sugar_location picks it
+        return (last is not None and last[0] == ant.current_broadcast_characteristic and last[2]
+                and sugarscape.nobody_new_in_reach(ant.index, last[1]))
+
+    def repeats_broadcast(self, sugarscape, ant):
+        # Whether the broadcast the ant makes every tick is one every ant in range has already had
+        if ant.is_exploring_target:
+            return True
+        location_id = sugarscape.locations.intern(ant.target_patch_center or ant.target)
+        code = CHARACTERISTIC_CODES[ant.current_broadcast_characteristic]
+        if sugarscape.bulletin_board is not None:
+            return sugarscape.bulletin_board.posted.get((ant.index, location_id)) == code
+        sent = sugarscape.knowledge.sent.get((ant.index, location_id))
+        receivers = sugarscape.indices_near(ant, COMMUNICATION_RADIUS)
+        return sent is not None and bool((sent[receivers] == code).all())
+
+    def diverged(self, ant, sim_time, reason):
+        raise RuntimeError(f"Event scheduler: ant {ant.id} at tick {sim_time} differs from the per-tick engine: {reason}")
@@ -0,0 +1,140 @@
+import os
+import queue
+import tempfile
+import threading
+import time
+from multiprocessing.connection import Listener, Client
+import numpy as np
+from constants import *
+from rl_agent import AntRLAgent
+from trajectory_buffer import TrajectoryBuffer
+
+# One process owns the policy network and scores the decisions of every simulation worker: workers
+# connect a RemoteAgent over a Unix socket, and the server gathers the requests that arrive within a
+# short deadline into one forward pass.
+
+
+def default_address():
+    return os.path.join(tempfile.gettempdir(), f"sugarscape_inference_{os.getpid()}.sock")
+
+
+class InferenceServer:
+    # Serves agent.decide to RemoteAgents from background threads: one thread accepts connections, one
+    # per connection reads its requests, and one batches them through the network and answers
+    def __init__(self, agent, address=None, max_batch=INFERENCE_MAX_BATCH, deadline=INFERENCE_DEADLINE):
+        self.agent = agent
+        self.address = address or default_address()
+        self.max_batch = max_batch
+        self.deadline = deadline
+        self.listener = Listener(self.address, family='AF_UNIX')
+        self.requests = queue.Queue()  # (connection, states, features, counts); None stops the batcher
+        self.connections = 0
+        self.closing = False
+        self.lock = threading.Lock()
+        self.threads = [threading.Thread(target=self.accept, daemon=True), threading.Thread(target=self.batch, daemon=True)]
+
+    def start(self):
+        for thread in self.threads:
+            thread.start()
+        return self
+
+    def close(self):
+        self.closing = True
+        self.requests.put(None)
+        Client(self.address, family='AF_UNIX').close()  # Wakes accept(), which closing the listener would not
+        for thread in self.threads:
+            thread.join()
+
+    def accept(self):
+        while True:
+            connection = self.listener.accept()
+            if self.closing:
+                connection.close()
+                self.listener.close()
+                return
+            connection.send(self.agent.is_eval)
+            with self.lock:
+                self.connections += 1
+            threading.Thread(target=self.receive, args=(connection,), daemon=True).start()
+
+    def receive(self, connection):
+        # A client has at most one request in flight: it waits for the answer before sending another
+        while True:
+            try:
+                states, features, counts = connection.recv()
+            except (EOFError, OSError):
+                break
+            self.requests.put((connection, states, features, counts))
+        with self.lock:
+            self.connections -= 1
+        connection.close()
+
+    def batch(self):
+        while True:
+            batch = [self.requests.get()]
+            if batch[0] is None:
+                return
+            decisions = len(batch[0][3])
+            closes = time.perf_counter() + self.deadline
+            # Wait for more requests until the deadline, the batch is full, or every client is waiting
+            while decisions < self.max_batch and len(batch) < self.connections:
+                try:
+                    request = self.requests.get(timeout=max(closes - time.perf_counter(), 0))
+                except queue.Empty:
+                    break
+                if request is None:
+                    self.requests.put(None)  # Answer this batch, then stop
+                    break
+                batch.append(request)
+                decisions += len(request[3])
+
+            results = self.agent.decide(
+                np.concatenate([states for _, states, _, _ in batch]),
+                np.concatenate([features for _, _, features, _ in batch]),
+                np.concatenate([counts for _, _, _, counts in batch]))
+            start = 0
+            for connection, _, _, counts in batch:
+                end = start + len(counts)
+                answer = [(int(action_index), None if log_prob is None else float(log_prob)) for action_index, log_prob in results[start:end]]
+                start = end
+                try:
+                    connection.send(answer)
+                except OSError:
+                    pass  # The client went away; receive() cleans up
+
+
+class RemoteAgent:
+    # Stands in for an AntRLAgent whose network lives in an InferenceServer. Holds no model: only the
+    # trajectory buffer, so a training worker can still export() its decisions.
+    action_features = AntRLAgent.action_features
+    store_reward = AntRLAgent.store_reward
+
+    def __init__(self, address):
+        self.connection = Client(address, family='AF_UNIX')
+        self.is_eval = self.connection.recv()
+        self.memory = TrajectoryBuffer()
+
+    def start_episode(self, seed=None):
+        # Sampling happens in the server, so the episode's policy stream is not used
+        self.memory.start_episode()
+
+    def select_action(self, ant_id, state, possible_actions):
+        return self.select_actions([(ant_id, state, possible_actions)])[0]
+
+    def select_actions(self, requests, streams=None):
+        # The server samples from its own generator, so `streams` is not used
+        if not requests:
+            return []
+        features = [self.action_features(possible_actions) for _, _, possible_actions in requests]
+        self.connection.send((
+            np.asarray([state for _, state, _ in requests], dtype=np.float32).reshape(len(requests), -1),
+            np.concatenate(features),
+            np.array([len(possible_actions) for _, _, possible_actions in requests])))
+        decisions = self.connection.recv()
+        if not self.is_eval:
+            for (ant_id, state, _), ant_features, (action_index, _) in zip(requests, features, decisions):
+                self.memory.append(ant_id, state, ant_features, action_index)
+        return decisions
+
+    def close(self):
+        self.connection.close()
@@ -0,0 +1,241 @@
+import collections.abc
+import numpy as np
+from constants import *
+
+CHARACTERISTICS = ('accepted', 'rejected', 'confirmed')
+CHARACTERISTIC_CODES = {name: code for code, name in enumerate(CHARACTERISTICS, start=1)}  # 0 means nothing sent yet
+
+
+class LocationRegistry:
+    # Interns (x, y) locations to small integer ids. Equal locations share one id, and the
+    # first tuple seen for a location is the one handed back by lookups.
+    def __init__(self):
+        self.ids = {}  # Key: (x, y), Value: id
+        self.locations = []  # Index: id, Value: (x, y)
+        self.coordinates = np.zeros((64, 2))  # Index: id, Value: x and y as floats, for batched distances
+
+    def intern(self, location):
+        location_id = self.ids.get(location)
+        if location_id is None:
+            location_id = len(self.locations)
+            self.ids[location] = location_id
+            self.locations.append(location)
+            if location_id == len(self.coordinates):
+                self.coordinates = np.concatenate([self.coordinates, np.zeros_like(self.coordinates)])
+            self.coordinates[location_id] = location
+        return location_id
+
+    def __len__(self):
+        return len(self.locations)
+
+    def clear(self):
+        self.ids.clear()
+        self.locations.clear()
+
+
+class KnowledgeBase:
+    # Dense storage for what every ant has been told. Rows are AntPopulation indices, columns are
+    # LocationRegistry ids. An entry is what used to be one communicated_targets item:
+    #   counts[ant, location, code - 1]  number of senders currently saying that characteristic
+    #   time_received[ant, location]     time the entry was created
+    #   present[ant, location]           whether the entry exists at all
+    #   touched[ant, location]           sequence number of its last update, which gives the OrderedDict order
+    def __init__(self, locations, capacity=NUM_ANTS, track_time_received=False):
+        self.locations = locations
+        # Entries that carry a 'time_received' key are never empty, so they are never removed
+        self.track_time_received = track_time_received
+        self.capacity = 0
+        self.location_capacity = 0
+        self.counts = np.zeros((0, 0, len(CHARACTERISTICS)), dtype=np.int32)
+        self.time_received = np.zeros((0, 0), dtype=np.int64)
+        self.present = np.zeros((0, 0), dtype=bool)
+        self.touched = np.zeros((0, 0), dtype=np.int64)
+        self.confirmed_false = np.zeros((0, 0), dtype=bool)  # Mirror of each ant's confirmed_false_locations
+        self.sequence = 0
+        # Key: (sender, location id), Value: int8 array over receivers of the characteristic code last
+        # sent to them (replaces the per-ant already_communicated dicts)
+        self.sent = {}
+        self.resize(capacity, 64)
+
+    def resize(self, capacity, location_capacity):
+        capacity = max(capacity, self.capacity)
+        location_capacity = max(location_capacity, self.location_capacity)
+        for name in ('counts', 'time_received', 'present', 'touched', 'confirmed_false'):
+            array = getattr(self, name)
+            grown = np.zeros((capacity, location_capacity) + array.shape[2:], dtype=array.dtype)
+            grown[:self.capacity, :self.location_capacity] = array
+            setattr(self, name, grown)
+        self.capacity = capacity
+        self.location_capacity = location_capacity
+        # Scalar access (bulletin board replay) goes through memoryviews, see population.py
+        self.views = {
+            name: memoryview(getattr(self, name))
+            for name in ('counts', 'time_received', 'present', 'touched', 'confirmed_false')
+        }
+
+    def clear(self):
+        # Forget everything for a new episode, keeping the arrays allocated
+        for array in (self.counts, self.time_received, self.present, self.touched, self.confirmed_false):
+            array.fill(0)
+        self.sequence = 0
+        self.sent.clear()
+
+    def ensure_ant(self, row):
+        if row >= self.capacity:
+            self.resize(max(row + 1, 2 * self.capacity), self.location_capacity)
+
+    def ensure_location(self, location_id):
+        if location_id >= self.location_capacity:
+            self.resize(self.capacity, max(location_id + 1, 2 * self.location_capacity))
+
+    def confirm_false(self, row, location_id):
+        self.ensure_location(location_id)
+        self.confirmed_false[row, location_id] = True
+
+    def forget_sent(self, sender, location_id):
+        # The sender will treat its next broadcast of this location as new to everyone
+        self.sent.pop((sender, location_id), None)
+
+    def send(self, sender, receivers, location_id, code, sim_time):
+        # One broadcast from `sender` to the ant rows in `receivers`. Receivers that confirmed the
+        # location false, or that this sender already told the same thing, are left alone.
+        told = self.mark_sent(sender, receivers, location_id, code)
+        if told is not None:
+            self.receive(told[0], location_id, told[1], code, sim_time)
+
+    def mark_sent(self, sender, receivers, location_id, code):
+        # The bookkeeping half of send: records that `sender` has told `receivers` `code` and returns
+        # the rows whose entries that changes with the codes they had from it before, or None when
+        # every receiver had already been told
+        sent = self.sent.get((sender, location_id))
+        if sent is None or len(sent) < self.capacity:
+            grown = np.zeros(self.capacity, dtype=np.int8)
+            if sent is not None:
+                grown[:len(sent)] = sent
+            sent = self.sent[(sender, location_id)] = grown
+        previous_codes = sent[receivers]
+        changed = previous_codes != code
+        if not changed.any():
+            return None  # The usual case: everyone in range already heard this
+        self.ensure_location(location_id)
+        # The sender's own slot, and receivers that confirmed the location false (they ignore it for
+        # good), are marked as told without being updated; that keeps them out of the check above
+        sent[receivers[changed]] = code
+        changed &= (receivers != sender) & ~self.confirmed_false[receivers, location_id]
+        return receivers[changed], previous_codes[changed]
+
+    def receive(self, rows, location_id, previous_codes, code, sim_time):
+        # Batched update of communicated_targets[location] for distinct ant rows whose sender changed
+        # its message from previous_codes (0 for none) to code
+        self.sequence += 1
+        self.update_entries(rows, np.full(len(rows), location_id), previous_codes, code, self.sequence, sim_time)
+
+    def receive_all(self, messages, sim_time):
+        # receive() for a list of (rows, location_id, previous_codes, code) messages, in that order,
+        # written into the arrays together. An entry that several of the messages change is updated
+        # once per message: its k-th update goes in the k-th of as many rounds as the most told entry
+        # needs, which keeps the counts and the entry order those of receiving the messages one by one
+        if not messages:
+            return
+        sizes = [len(rows) for rows, _, _, _ in messages]
+        rows = np.concatenate([rows for rows, _, _, _ in messages])
+        location_ids = np.repeat([location_id for _, location_id, _, _ in messages], sizes)
+        previous_codes = np.concatenate([previous_codes for _, _, previous_codes, _ in messages])
+        codes = np.repeat([code for _, _, _, code in messages], sizes)
+        sequences = np.repeat(np.arange(self.sequence + 1, self.sequence + 1 + len(messages)), sizes)
+        self.sequence += len(messages)
+        if not len(rows):
+            return
+        entries = rows * self.location_capacity + location_ids
+        order = np.argsort(entries, kind='stable')
+        firsts = np.flatnonzero(np.r_[True, entries[order][1:] != entries[order][:-1]])
+        rounds = np.empty(len(rows), dtype=np.intp)
+        rounds[order] = np.arange(len(rows)) - np.repeat(firsts, np.diff(np.r_[firsts, len(rows)]))
+        for update_round in range(rounds.max() + 1):
+            updates = rounds == update_round
+            self.update_entries(rows[updates], location_ids[updates], previous_codes[updates], codes[updates], sequences[updates], sim_time)
+
+    def update_entries(self, rows, location_ids, previous_codes, codes, sequences, sim_time):
+        # Update the entries (rows[i], location_ids[i]), all different, whose sender changed its
+        # message from previous_codes[i] (0 for none) to codes[i]. A code or sequence number given
+        # once applies to every row
+        counts = self.counts
+        present = self.present[rows, location_ids]
+
+        # Take back the previous characteristic, dropping entries that end up empty
+        decrement = present & (previous_codes > 0)
+        decrement[decrement] = counts[rows[decrement], location_ids[decrement], previous_codes[decrement] - 1] > 0
+        counts[rows[decrement], location_ids[decrement], previous_codes[decrement] - 1] -= 1
+        if not self.track_time_received:
+            emptied = decrement & ~counts[rows, location_ids].any(axis=1)
+            self.present[rows[emptied], location_ids[emptied]] = False
+            present &= ~emptied
+
+        # Count the new characteristic, creating the entry if needed, and move it to the end
+        created = ~present
+        self.present[rows[created], location_ids[created]] = True
+        self.time_received[rows[created], location_ids[created]] = sim_time
+        counts[rows, location_ids, codes - 1] += 1
+        self.touched[rows, location_ids] = sequences
+
+    def receive_one(self, row, location_id, previous_code, code, sim_time):
+        # Scalar version of receive() for a single ant
+        self.ensure_location(location_id)
+        self.sequence += 1
+        counts = self.views['counts']
+        present = self.views['present']
+        if previous_code and present[row, location_id] and counts[row, location_id, previous_code - 1] > 0:
+            counts[row, location_id, previous_code - 1] -= 1
+            if not self.track_time_received and not any(counts[row, location_id, i] for i in range(len(CHARACTERISTICS))):
+                present[row, location_id] = False
+        if not present[row, location_id]:
+            present[row, location_id] = True
+            self.views['time_received'][row, location_id] = sim_time
+        counts[row, location_id, code - 1] += 1
+        self.views['touched'][row, location_id] = self.sequence
+
+    def is_confirmed_false(self, row, location_id):
+        return location_id < self.location_capacity and self.views['confirmed_false'][row, location_id]
+
+    def entry(self, row, location_id):
+        # The dict communicated_targets used to hold for this entry
+        entry = {
+            name: count
+            for name, count in zip(CHARACTERISTICS, self.counts[row, location_id].tolist())
+            if count > 0
+        }
+        if self.track_time_received:
+            entry['time_received'] = int(self.time_received[row, location_id])
+        return entry
+
+    def view(self, row):
+        return KnowledgeView(self, row)
+
+
+class KnowledgeView(collections.abc.Mapping):
+    # Read-only OrderedDict-like view of one ant's communicated_targets:
+    # {(x, y): {'accepted': count, 'rejected': count, 'confirmed': count, ...}} in update order
+    def __init__(self, knowledge, row):
+        self.knowledge = knowledge
+        self.row = row
+
+    def location_ids(self):
+        present = np.flatnonzero(self.knowledge.present[self.row])
+        return present[np.argsort(self.knowledge.touched[self.row, present], kind='stable')]
+
+    def __getitem__(self, location):
+        location_id = self.knowledge.locations.ids.get(location)
+        if location_id is None or location_id >= self.knowledge.location_capacity or not self.knowledge.present[self.row, location_id]:
+            raise KeyError(location)
+        return self.knowledge.entry(self.row, location_id)
+
+    def __iter__(self):
+        locations = self.knowledge.locations.locations
+        return iter([locations[location_id] for location_id in self.location_ids().tolist()])
+
+    def __len__(self):
+        return int(np.count_nonzero(self.knowledge.present[self.row]))
+
+    def items(self):
+        locations = self.knowledge.locations.locations
+        return [(locations[location_id], self.knowledge.entry(self.row, location_id)) for location_id in self.location_ids().tolist()]
@@ -0,0 +1,101 @@
+import collections
+import pickle
+import zipfile
+import numpy as np
+
+# Inference-only copy of rl_agent.PolicyNetwork that runs on NumPy, for evaluation and visualisation
+# runs that never train. Model files are read without importing torch.
+
+POLICY_LAYERS = ('fc1', 'fc2', 'fc3', 'fc4')
+STORAGE_DTYPES = {
+    'DoubleStorage': np.float64,
+    'FloatStorage': np.float32,
+    'HalfStorage': np.float16,
+    'LongStorage': np.int64,
+    'IntStorage': np.int32,
+    'ShortStorage': np.int16,
+    'CharStorage': np.int8,
+    'ByteStorage': np.uint8,
+    'BoolStorage': np.bool_,
+}
+
+
+def rebuild_tensor(storage, storage_offset, size, stride, *args):
+    # Stand-in for torch._utils._rebuild_tensor_v2: a view of the storage with the saved shape and strides
+    itemsize = storage.dtype.itemsize
+    return np.lib.stride_tricks.as_strided(
+        storage[storage_offset:], shape=tuple(size), strides=tuple(step * itemsize for step in stride)
+    ).copy()
+
+
+def rebuild_parameter(data, *args):
+    return data
+
+
+class StateDictUnpickler(pickle.Unpickler):
+    # Unpickles the data.pkl of a torch.save zip archive, turning tensors into NumPy arrays
+    def __init__(self, file, archive, prefix, byteorder):
+        super().__init__(file)
+        self.archive = archive
+        self.prefix = prefix
+        self.byteorder = byteorder
+        self.storages = {}  # Key: storage key, Value: flat array
+
+    def find_class(self, module, name):
+        if module == 'torch._utils' and name == '_rebuild_tensor_v2':
+            return rebuild_tensor
+        if module == 'torch._utils' and name == '_rebuild_parameter':
+            return rebuild_parameter
+        if module == 'torch' and name in STORAGE_DTYPES:
+            return name
+        if module == 'collections' and name == 'OrderedDict':
+            return collections.OrderedDict
+        raise pickle.UnpicklingError(f"Unsupported object in model file: {module}.{name}")
+
+    def persistent_load(self, saved_id):
+        # ('storage', storage type, key, location, numel); the data lives in data/<key>
+        _, storage_type, key, _, _ = saved_id
+        if key not in self.storages:
+            dtype = np.dtype(STORAGE_DTYPES[storage_type]).newbyteorder('<' if self.byteorder == 'little' else '>')
+            self.storages[key] = np.frombuffer(self.archive.read(f"{self.prefix}data/{key}"), dtype=dtype)
+        return self.storages[key]
+
+
+def load_state_dict(file_path):
+    # {name: array} from a state dict saved with torch.save (zip format)
+    with zipfile.ZipFile(file_path) as archive:
+        pickle_name = next(name for name in archive.namelist() if name.endswith('data.pkl'))
+        prefix = pickle_name[:-len('data.pkl')]
+        byteorder_name = prefix + 'byteorder'
+        byteorder = archive.read(byteorder_name).decode() if byteorder_name in archive.namelist() else 'little'
+        with archive.open(pickle_name) as file:
+            return StateDictUnpickler(file, archive, prefix, byteorder).load()
+
+
+class NumpyPolicyNetwork:
+    # Same layers and forward pass as rl_agent.PolicyNetwork, in float32
+    def __init__(self, input_size):
+        # Random weights with nn.Linear's default ranges until a model is loaded; a private generator
+        # keeps the simulation's random streams untouched
+        rng = np.random.default_rng()
+        sizes = [input_size, 128, 128, 128, 1]
+        self.weights = []
+        self.biases = []
+        for fan_in, fan_out in zip(sizes[:-1], sizes[1:]):
+            bound = 1 / np.sqrt(fan_in)
+            self.weights.append(rng.uniform(-bound, bound, (fan_in, fan_out)).astype(np.float32))
+            self.biases.append(rng.uniform(-bound, bound, fan_out).astype(np.float32))
+
+    def load_state_dict(self, state_dict):
+        # Weights are stored transposed, so forward is x @ W + b
+        self.weights = [np.ascontiguousarray(state_dict[f"{layer}.weight"].T, dtype=np.float32) for layer in POLICY_LAYERS]
+        self.biases = [np.asarray(state_dict[f"{layer}.bias"], dtype=np.float32) for layer in POLICY_LAYERS]
+
+    def load(self, file_path):
+        self.load_state_dict(load_state_dict(file_path))
+
+    def __call__(self, x):
+        # Logits for each row of x, shape (rows, 1)
+        for weight, bias in zip(self.weights[:-1], self.biases[:-1]):
+            x = np.maximum(x @ weight + bias, 0)
+        return x @ self.weights[-1] + self.biases[-1]
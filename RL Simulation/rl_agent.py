@@ -1,140 +1,212 @@
-import torch
-import torch.nn as nn
-import torch.optim as optim
 import random
 import numpy as np
+from numpy_policy import NumpyPolicyNetwork, load_state_dict
+from trajectory_buffer import TrajectoryBuffer, discounted_returns
 
-# Set up the device
-device = torch.device("cuda" if torch.cuda.is_available() else "cpu")
-print("device: ", device)
-
-class PolicyNetwork(nn.Module):
-    def __init__(self, input_size):
-        super(PolicyNetwork, self).__init__()
-        self.fc1 = nn.Linear(input_size, 128)
-        self.fc2 = nn.Linear(128, 128)
-        self.fc3 = nn.Linear(128, 128)
-        self.fc4 = nn.Linear(128, 1)  # Output a scalar logit
-        
-    def forward(self, x):
-        x = torch.relu(self.fc1(x))
-        x = torch.relu(self.fc2(x))
-        x = torch.relu(self.fc3(x))
-        logit = self.fc4(x)
-        return logit
+# torch is imported when the first torch-backed agent is created, so agents on the NumPy backend
+# never load it
+torch = None
+device = None
+PolicyNetwork = None
+
+
+def import_torch():
+    global torch, device, PolicyNetwork
+    if torch is None:
+        import torch as torch_module
+        import policy_network
+        torch = torch_module
+        device = policy_network.device
+        PolicyNetwork = policy_network.PolicyNetwork
 
 
 class AntRLAgent:
-    def __init__(self, input_size):
-        self.is_eval = False
-        self.policy_net = PolicyNetwork(input_size).to(device)
-        self.optimizer = optim.Adam(self.policy_net.parameters(), lr=1e-4)
-        self.memory = {}  # Use a dictionary to store experiences per ant
+    def __init__(self, input_size, backend='torch'):
+        # backend='numpy' gives an inference-only agent: a NumpyPolicyNetwork, always in evaluation mode
+        self.backend = backend
+        if backend == 'numpy':
+            self.is_eval = True
+            self.policy_net = NumpyPolicyNetwork(input_size)
+            self.optimizer = None
+        else:
+            import_torch()
+            self.is_eval = False
+            self.policy_net = PolicyNetwork(input_size).to(device)
+            self.optimizer = torch.optim.Adam(self.policy_net.parameters(), lr=1e-4)
+        self.memory = TrajectoryBuffer()  # Decisions of every ant since the last policy update
+        self.generator = None  # torch.Generator of the current episode's policy stream, see start_episode
         self.gamma = 0.90
         # self.batch_size = 100
 
+    def action_features(self, possible_actions):
+        # (num_actions x feature_size) matrix of the candidates' features
+        return np.stack([np.asarray(action['features'], dtype=np.float32) for action in possible_actions])
+
+    def action_inputs(self, states, features, counts):
+        # Network input rows: each state repeated once per candidate, next to that candidate's features
+        states = np.asarray(states, dtype=np.float32).reshape(len(counts), -1)
+        return np.concatenate([np.repeat(states, counts, axis=0), features], axis=1)
+
+    def action_logits(self, inputs):
+        # One logit per input row, in a single forward pass
+        if self.backend == 'numpy':
+            return self.policy_net(inputs)[:, 0]
+        return self.policy_net(torch.as_tensor(inputs, device=device)).squeeze(-1)
+
+    def segment_logits(self, flat_logits, counts):
+        # Ragged logits (counts[i] candidates for decision i) laid out one decision per row, padded with
+        # -inf, so row-wise softmax/argmax act on each decision's own candidates
+        rows = torch.as_tensor(np.repeat(np.arange(len(counts)), counts), device=device)
+        columns = torch.as_tensor(np.concatenate([np.arange(count) for count in counts]), device=device)
+        padded = torch.full((len(counts), int(max(counts))), float('-inf'), device=device)
+        return padded.index_put((rows, columns), flat_logits)
+
     def select_action(self, ant_id, state, possible_actions):
-        state_tensor = torch.FloatTensor(state).to(device)
-        action_logits = []
-        for action in possible_actions:
-            action_features = action['features']
-            input_tensor = torch.cat([state_tensor, torch.FloatTensor(action_features).to(device)])
-            logit = self.policy_net(input_tensor)
-            action_logits.append(logit)
-        action_logits = torch.stack(action_logits).squeeze(-1)
-        action_probs = torch.softmax(action_logits, dim=0)
+        # All candidate actions are scored in a single forward pass
+        features = self.action_features(possible_actions)
+        inputs = self.action_inputs(state, features, [len(possible_actions)])
+        if self.backend == 'numpy':
+            return int(np.argmax(self.action_logits(inputs))), None
         if self.is_eval:
             # print(f"[Debug] Ant {ant_id}: Selecting action during evaluation")
 
-            # Select the action with the highest logit (expected value)
-            action_index = torch.argmax(action_logits).item()
+            # Select the action with the highest logit (expected value); no autograd bookkeeping needed
+            with torch.inference_mode():
+                action_logits = self.action_logits(inputs)
+                action_index = torch.argmax(action_logits).item()
             log_prob = None
         else:
-            action_distribution = torch.distributions.Categorical(action_probs)
-            action_index = action_distribution.sample()
-            log_prob = action_distribution.log_prob(action_index)
-            # Store action in the ant's own memory
-            if ant_id not in self.memory:
-                self.memory[ant_id] = []
-            self.memory[ant_id].append({'log_prob': log_prob, 'reward': None})
+            # Sampling needs no graph: update_policy recomputes the log-probs it trains on
+            with torch.inference_mode():
+                action_logits = self.action_logits(inputs)
+                action_probs = torch.softmax(action_logits, dim=0)
+                action_distribution = torch.distributions.Categorical(action_probs)
+                action_index = self.sample(action_distribution)
+                log_prob = action_distribution.log_prob(action_index)
+            # Store the decision in the trajectory buffer
+            self.memory.append(ant_id, state, features, action_index.item())
             # print(f"[Debug] Ant {ant_id}: Stored action {action_index} with log_prob {log_prob.item():.4f}")
         return action_index, log_prob
 
+    def select_actions(self, requests, streams=None):
+        # Batched select_action for several ants: `requests` is a list of (ant_id, state, possible_actions)
+        # and the result a list of (action_index, log_prob) in the same order. Every (ant, candidate) pair
+        # is scored in one forward pass. Each ant gets the distribution select_action would give it, up to
+        # rounding, but the samples are drawn together, so they are not the draws that calling
+        # select_action ant by ant would make. See decide for `streams`.
+        if not requests:
+            return []
+        features = [self.action_features(possible_actions) for _, _, possible_actions in requests]
+        decisions = self.decide([state for _, state, _ in requests], np.concatenate(features), [len(possible_actions) for _, _, possible_actions in requests], streams)
+        if not self.is_eval:
+            for (ant_id, state, _), ant_features, (action_index, _) in zip(requests, features, decisions):
+                self.memory.append(ant_id, state, ant_features, int(action_index))
+        return decisions
+
+    def decide(self, states, features, counts, streams=None):
+        # (action_index, log_prob) of each decision, without recording it: decision i is taken in
+        # states[i] between the next counts[i] rows of `features`. With streams, a list of
+        # (decisions, generator), the decisions are split into runs of those lengths and each run is
+        # sampled from its own generator, as if it had been decided on its own (BatchedSugarScape)
+        inputs = self.action_inputs(states, features, counts)
+        if self.backend == 'numpy':
+            action_logits = self.action_logits(inputs)
+            return [(int(np.argmax(logits)), None) for logits in np.split(action_logits, np.cumsum(counts)[:-1])]
+
+        with torch.inference_mode():
+            action_logits = self.segment_logits(self.action_logits(inputs), counts)
+            if self.is_eval:
+                return [(action_index, None) for action_index in torch.argmax(action_logits, dim=1).tolist()]
+            action_log_probs = torch.log_softmax(action_logits, dim=1)
+            if streams is None:
+                action_indices = self.sample(torch.distributions.Categorical(logits=action_log_probs))
+            else:
+                runs = []
+                start = 0
+                for decisions, generator in streams:
+                    # Without the padding the other runs need, so the draws are those of the run alone
+                    run_log_probs = action_log_probs[start:start + decisions, :int(max(counts[start:start + decisions]))]
+                    runs.append(self.sample(torch.distributions.Categorical(logits=run_log_probs), generator))
+                    start += decisions
+                action_indices = torch.cat(runs)
+            log_probs = action_log_probs[torch.arange(len(counts), device=device), action_indices]
+        return list(zip(action_indices, log_probs))
+
+    def start_episode(self, seed=None):
+        # Called by SugarScape for every new episode: ant ids start over, so do trajectories. With a
+        # seed (the episode's policy stream), sampling uses its own generator instead of torch's global one
+        self.memory.start_episode()
+        self.generator = None
+        if seed is not None and self.backend == 'torch':
+            self.generator = torch.Generator(device=device).manual_seed(seed)
+
+    def sample(self, distribution, generator=None):
+        # distribution.sample(), drawn from `generator`, by default the episode's
+        probs = distribution.probs.reshape(-1, distribution.probs.shape[-1])
+        return torch.multinomial(probs, 1, True, generator=generator or self.generator).T.reshape(distribution.batch_shape)
+
     def store_reward(self, ant_id, reward):
         if self.is_eval:
             return  # Do not store rewards during evaluation
-        if ant_id in self.memory and self.memory[ant_id] and self.memory[ant_id][-1]['reward'] is None:
-            self.memory[ant_id][-1]['reward'] = reward
-            # print(f"[Debug] Ant {ant_id}: Stored reward {reward} for action at index {len(self.memory[ant_id]) - 1}")
-        # else:
-            # print(f"[Debug] Ant {ant_id}: No action to assign reward to, or the reward is already assigned.")
+        # Only the ant's latest decision can be rewarded, and only once
+        self.memory.store_reward(ant_id, reward)
 
     def update_policy(self):
         if self.is_eval:
             return  # Do not update policy during evaluation
-        
-        # Combine experiences from all ants
-        combined_memory = []
-        for ant_id, ant_memory in self.memory.items():
-            combined_memory.extend(ant_memory)
-        
+
         # Proceed only if there are any experiences
-        if not combined_memory:
+        if not len(self.memory):
             # print("[Debug] No experiences to update policy.")
             return
-            
+
         # Filter out steps with no rewards
-        filtered_memory = [step for step in combined_memory if step['reward'] is not None]
-        if not filtered_memory:
+        steps = self.memory.rewarded_steps()
+        if not len(steps):
             # print("[Debug] No valid experiences with rewards. Skipping update.")
             return  # If no steps have rewards, skip the update
-        
+
         MIN_BATCH_SIZE = 5  # Define a minimum batch size
-        if len(filtered_memory) < MIN_BATCH_SIZE:
+        if len(steps) < MIN_BATCH_SIZE:
             print(f"[Debug] Not enough experiences to update policy. Need at least {MIN_BATCH_SIZE}.")
             return  # Wait until we have enough experiences
 
-        print(f"[Debug] Proceeding with {len(filtered_memory)} valid experiences for policy update.")
-        
-        # Proceed with policy update
-        R = 0
-        returns = []
-        for step in reversed(filtered_memory):
-            R = step['reward'] + self.gamma * R
-            returns.insert(0, R)
-        returns = torch.tensor(returns).to(device)
-        
+        print(f"[Debug] Proceeding with {len(steps)} valid experiences for policy update.")
+
+        # Discounted returns, each ant's trajectory on its own
+        returns = discounted_returns(self.memory.rewards[steps], self.memory.trajectory_ids[steps], self.gamma)
+        returns = torch.as_tensor(returns, dtype=torch.float32, device=device)
+
         # Normalize returns
         returns = (returns - returns.mean()) / (returns.std() + 1e-9)
-        
-        # Compute policy loss
-        policy_loss = []
-        for i, step in enumerate(filtered_memory):
-            log_prob = step['log_prob']
-            if log_prob is not None:
-                R = returns[i]
-                # Make sure log_prob is a 1-dimensional tensor
-                log_prob = log_prob.view(1)
-                policy_loss.append(-log_prob * R)
-        
-        if policy_loss:
-            # Perform policy update
-            self.optimizer.zero_grad()
-            policy_loss = torch.cat(policy_loss).sum()
-            policy_loss.backward()
-            self.optimizer.step()
-            # print(f"[Debug] Policy updated. Loss: {policy_loss.item():.4f}")
-        else:
-            print("[Debug] No valid policy loss to update.")
-        
+
+        # Log-probs of the chosen actions under the current policy, all steps in one forward pass
+        states, features, counts = self.memory.candidates(steps)
+        action_logits = self.segment_logits(self.action_logits(self.action_inputs(states, features, counts)), counts)
+        action_log_probs = torch.log_softmax(action_logits, dim=1)
+        chosen = torch.as_tensor(self.memory.chosen[steps], device=device)
+        log_probs = action_log_probs[torch.arange(len(steps), device=device), chosen]
+
+        # Perform policy update
+        self.optimizer.zero_grad()
+        policy_loss = -(log_probs * returns).sum()
+        policy_loss.backward()
+        self.optimizer.step()
+        # print(f"[Debug] Policy updated. Loss: {policy_loss.item():.4f}")
+
         # Clear memory
-        self.memory = {}
+        self.memory.clear()
+        return True  # The policy changed
 
     def save_model(self, file_path):
         torch.save(self.policy_net.state_dict(), file_path)
         print(f"Model saved to {file_path}")
 
     def load_model(self, file_path):
+        if self.backend == 'numpy':
+            self.policy_net.load_state_dict(load_state_dict(file_path))
+            print(f"Model loaded from {file_path}")
+            return
         self.policy_net.load_state_dict(torch.load(file_path, map_location=device))
         self.policy_net.eval()  # Set the network to evaluation mode
         self.is_eval = True  # Set evaluation flag
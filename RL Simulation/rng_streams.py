@@ -0,0 +1,27 @@
+import random
+import numpy as np
+
+# spawn: initial ant positions, headings and selection intervals, and the false broadcaster draw
+# patches: new sugar patches and the false locations broadcasters make up
+# movement: the random turn of wandering ants
+# policy: the choices ants make between targets
+RNG_STREAMS = ('spawn', 'patches', 'movement', 'policy')
+
+
+class RandomStreams:
+    # One random.Random per name in RNG_STREAMS, owned by a SugarScape. Given an episode seed, every
+    # stream gets its own seed derived from it (np.random.SeedSequence), so draws in one part of the
+    # simulation never shift another, and an episode replays the same wherever and whenever it runs.
+    # Without a seed every stream is the global `random` state, which keeps the old behaviour of
+    # seeding `random` before building a SugarScape.
+    def __init__(self, seed=None):
+        self.seed = seed
+        if seed is None:
+            for name in RNG_STREAMS:
+                setattr(self, name, random)  # The module-level functions draw from the global state
+            self.torch_seed = None  # Policy sampling in torch keeps using torch's global generator
+        else:
+            children = np.random.SeedSequence(seed).spawn(len(RNG_STREAMS) + 1)
+            for name, child in zip(RNG_STREAMS, children):
+                setattr(self, name, random.Random(int.from_bytes(child.generate_state(4).tobytes(), 'little')))
+            self.torch_seed = int(children[-1].generate_state(1, dtype=np.uint64)[0] >> 1)  # Seed for a torch.Generator
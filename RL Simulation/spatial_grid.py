@@ -0,0 +1,119 @@
+import numpy as np
+from concurrent.futures import ThreadPoolExecutor
+from constants import *
+import kernels
+
+thread_pool = None  # The pool shared_workers hands out, made on first use
+
+
+class SpatialGrid:
+    # Uniform cell grid over the game area. Points are bucketed by cell so a radius query only
+    # looks at the cells overlapping the query square instead of every point.
+    def __init__(self, cell_size=GRID_CELL_SIZE, width=GAME_WIDTH, height=HEIGHT):
+        self.cell_size = cell_size
+        self.columns = int(width // cell_size) + 1
+        self.rows = int(height // cell_size) + 1
+        self.cells = np.zeros(0, dtype=np.intp)
+        self.order = np.zeros(0, dtype=np.intp)  # Point indices sorted by cell
+        self.cell_starts = np.zeros(self.columns * self.rows + 1, dtype=np.intp)  # Offsets of each cell in self.order
+
+    def rebuild(self, xs, ys):
+        # Re-bucket all points; index i in later queries refers to (xs[i], ys[i])
+        columns = np.clip((xs // self.cell_size).astype(np.intp), 0, self.columns - 1)
+        rows = np.clip((ys // self.cell_size).astype(np.intp), 0, self.rows - 1)
+        cells = rows * self.columns + columns
+        self.cells = cells  # Cell of each point
+        self.order = np.argsort(cells, kind='stable')
+        counts = np.bincount(cells, minlength=self.columns * self.rows)
+        self.cell_starts[1:] = np.cumsum(counts)
+
+    def query(self, x, y, radius):
+        # Sorted indices of the points in every cell that overlaps the square of half-width
+        # `radius` around (x, y). This is a superset of the points within `radius`.
+        first_column = max(int((x - radius) // self.cell_size), 0)
+        last_column = min(int((x + radius) // self.cell_size), self.columns - 1)
+        first_row = max(int((y - radius) // self.cell_size), 0)
+        last_row = min(int((y + radius) // self.cell_size), self.rows - 1)
+
+        if first_column == 0 and first_row == 0 and last_column == self.columns - 1 and last_row == self.rows - 1:
+            return np.sort(self.order)  # The square covers the whole grid
+
+        # Cells of one grid row are contiguous in self.order, so each row is a single slice
+        starts = self.cell_starts
+        parts = [
+            self.order[starts[row * self.columns + first_column]:starts[row * self.columns + last_column + 1]]
+            for row in range(first_row, last_row + 1)
+        ]
+        return np.sort(np.concatenate(parts))
+
+
+def neighbour_lists(xs, ys, radius, workers=None):
+    # Every pair of points within `radius` of each other, as (starts, columns): the points near point i
+    # are columns[starts[i]:starts[i + 1]], in increasing order and including i itself. Few points are
+    # compared all against all; more are only compared with the points in the cells around them.
+    # With a thread pool `workers`, the kernels share out the points between its threads.
+    if kernels.ENABLED:
+        grid_columns = int(GAME_WIDTH // radius) + 1
+        grid_rows = int(HEIGHT // radius) + 1
+        if workers is None or len(xs) < PARALLEL_MIN_ANTS:
+            return kernels.neighbour_lists(xs, ys, float(radius), grid_columns, grid_rows)
+        return parallel_neighbour_lists(xs, ys, float(radius), grid_columns, grid_rows, workers)
+    count = len(xs)
+    if count < GRID_MIN_ANTS:
+        rows, columns = np.nonzero(np.hypot(xs[:, None] - xs, ys[:, None] - ys) <= radius)
+    else:
+        # With cells of side `radius`, a point's neighbours are in its own cell or the eight around it
+        grid = SpatialGrid(cell_size=radius)
+        grid.rebuild(xs, ys)
+        point_columns = grid.cells % grid.columns
+        point_rows = grid.cells // grid.columns
+        row_parts = []
+        column_parts = []
+        for row_offset in (-1, 0, 1):
+            for column_offset in (-1, 0, 1):
+                cell_columns = point_columns + column_offset
+                cell_rows = point_rows + row_offset
+                points = np.flatnonzero((cell_columns >= 0) & (cell_columns < grid.columns) & (cell_rows >= 0) & (cell_rows < grid.rows))
+                cells = cell_rows[points] * grid.columns + cell_columns[points]
+                firsts = grid.cell_starts[cells]
+                counts = grid.cell_starts[cells + 1] - firsts
+                # Pair each of these points with every point of its cell at this offset
+                row_parts.append(np.repeat(points, counts))
+                column_parts.append(grid.order[np.repeat(firsts - (np.cumsum(counts) - counts), counts) + np.arange(counts.sum())])
+        rows = np.concatenate(row_parts)
+        columns = np.concatenate(column_parts)
+        near = np.hypot(xs[rows] - xs[columns], ys[rows] - ys[columns]) <= radius
+        order = np.lexsort((columns[near], rows[near]))
+        rows = rows[near][order]
+        columns = columns[near][order]
+    starts = np.zeros(count + 1, dtype=np.intp)
+    starts[1:] = np.cumsum(np.bincount(rows, minlength=count))
+    return starts, columns
+
+
+def parallel_neighbour_lists(xs, ys, radius, grid_columns, grid_rows, workers):
+    # kernels.neighbour_lists with its rows built in INTENT_THREADS slices on `workers`. The kernels
+    # release the GIL, so the slices run at the same time; joined in order, they give the same result.
+    buckets = kernels.cell_buckets(xs, ys, radius, grid_columns, grid_rows)
+    bounds = np.linspace(0, len(xs), INTENT_THREADS + 1).astype(np.intp).tolist()
+    slices = workers.map(
+        lambda first, last: kernels.neighbour_rows(xs, ys, radius, grid_columns, grid_rows, *buckets, first, last),
+        bounds[:-1], bounds[1:],
+    )
+    starts = [np.zeros(1, dtype=np.intp)]
+    columns = []
+    total = 0
+    for slice_starts, slice_columns in slices:
+        starts.append(slice_starts[1:] + total)
+        columns.append(slice_columns)
+        total += slice_starts[-1]
+    return np.concatenate(starts), np.concatenate(columns)
+
+
+def shared_workers():
+    # The one pool of INTENT_THREADS threads every SugarScape of the process builds its neighbour
+    # structures on, so worlds made for each episode don't each leave their own idle threads behind
+    global thread_pool
+    if thread_pool is None:
+        thread_pool = ThreadPoolExecutor(INTENT_THREADS)
+    return thread_pool
@@ -0,0 +1,238 @@
+import math
+import numpy as np
+from constants import *
+import kernels
+
+PATCH_FIELDS = ('x', 'y', 'radius', 'count')
+
+
+class SugarPatch:
+    # Dict-style view of one patch stored in SugarPatches, so sugar['x'], sugar['count'] -= 1 etc.
+    # keep working on the shared arrays
+    __slots__ = ('patches', 'index')
+
+    def __init__(self, patches, index):
+        self.patches = patches
+        self.index = index
+
+    def __getitem__(self, key):
+        return self.patches.views[key][self.index]
+
+    def __setitem__(self, key, value):
+        if key == 'count':
+            self.patches.set_count(self.index, value)
+        else:
+            self.patches.arrays[key][self.index] = value
+            self.patches.version += 1
+
+    def __repr__(self):
+        return repr({key: self[key] for key in PATCH_FIELDS})
+
+
+class SugarPatches:
+    # Registry of every sugar patch, stored as parallel arrays (x, y, radius, count). Patches are only
+    # ever appended, so a patch's index stays valid for the whole episode. Patches that still have sugar
+    # are kept apart from depleted ones, and `version` changes whenever that split or the set of
+    # patches changes, so derived data can be cached against it.
+    def __init__(self, patches=()):
+        self.size = 0
+        self.capacity = 0
+        self.arrays = {name: np.zeros(0, dtype=np.int64) for name in PATCH_FIELDS}
+        self.patches = []  # SugarPatch views in the order the patches were added
+        self.active = []  # Indices of patches with sugar left, in patch order
+        self.depleted = []  # Indices of empty patches, in the order they ran out
+        self.centers = {}  # Key: (x, y) center, Value: patch
+        self.max_radius = 0
+        self.version = 0
+        self.cached_version = None  # Version the active_* arrays below were built for
+        self.nearby = {}  # Key: population index, Value: patches that ant may detect or step into this tick
+        self.held = None  # (population index, ant, patch index) of the takes since hold(), or None when takes apply at once
+        self.grow(8)
+        for patch in patches:
+            self.append(patch)
+
+    def __getattr__(self, name):
+        # patches.x etc. give the filled part of the arrays
+        try:
+            return self.__dict__['arrays'][name][:self.size]
+        except KeyError:
+            raise AttributeError(name) from None
+
+    def grow(self, capacity):
+        grown_arrays = {}
+        for name, array in self.arrays.items():
+            grown = np.zeros(capacity, dtype=array.dtype)
+            grown[:self.size] = array[:self.size]
+            grown_arrays[name] = grown
+        self.attach(grown_arrays)
+
+    def attach(self, arrays):
+        # Use `arrays` (one per field, all of the same length) as the patches' storage
+        self.arrays = arrays
+        self.views = {name: memoryview(array) for name, array in arrays.items()}  # Cheap scalar reads
+        self.capacity = len(arrays['x'])
+
+    def append(self, patch):
+        # Add a patch given as a {'x', 'y', 'count', 'radius'} dict
+        if self.size == self.capacity:
+            self.grow(2 * self.capacity)
+        index = self.size
+        for name in PATCH_FIELDS:
+            self.arrays[name][index] = patch[name]
+        sugar = SugarPatch(self, index)
+        self.patches.append(sugar)
+        self.centers.setdefault((patch['x'], patch['y']), sugar)
+        self.max_radius = max(self.max_radius, patch['radius'])
+        self.size += 1
+        (self.active if patch['count'] > 0 else self.depleted).append(index)
+        self.version += 1
+
+    def clear(self):
+        # Remove every patch for a new episode, keeping the arrays allocated
+        self.size = 0
+        self.patches.clear()
+        self.active.clear()
+        self.depleted.clear()
+        self.centers.clear()
+        self.max_radius = 0
+        self.version += 1
+        self.nearby = {}
+        self.held = None
+
+    def set_count(self, index, count):
+        was_active = self.arrays['count'][index] > 0
+        self.arrays['count'][index] = count
+        if was_active and count <= 0:
+            self.active.remove(index)
+            self.depleted.append(index)
+            self.version += 1
+        elif not was_active and count > 0:
+            self.depleted.remove(index)
+            self.active.append(index)
+            self.active.sort()
+            self.version += 1
+
+    def take(self, sugar, ant):
+        # One unit of `sugar` eaten by `ant`; returns what is left of it as the ant sees it. While held,
+        # the unit is only asked for and release() decides whether the ant gets it.
+        left = sugar['count'] - 1
+        if self.held is None:
+            sugar['count'] = left
+        else:
+            self.held.append((ant.index, ant, sugar.index))
+        return left
+
+    def hold(self):
+        # Keep every count as it is until release(), so patches read the same to every ant of a tick
+        self.held = []
+
+    def release(self):
+        # Apply the takes since hold() and return the ants that got their unit. When more ants asked a
+        # patch than it had units left, the units go to the first of them in population order.
+        granted = []
+        for _, ant, index in sorted(self.held, key=lambda take: take[0]):
+            count = int(self.arrays['count'][index])
+            if count > 0:
+                self.set_count(index, count - 1)
+                granted.append(ant)
+        self.held = None
+        return granted
+
+    def __len__(self):
+        return self.size
+
+    def __iter__(self):
+        return iter(self.patches)
+
+    def __getitem__(self, index):
+        return self.patches[index]
+
+    def has_center(self, location):
+        # Whether some patch, active or depleted, is centered at `location`
+        return location in self.centers
+
+    def any_within(self, x, y, distance):
+        # Whether any patch center, active or depleted, is closer than `distance` to (x, y)
+        dx = self.x - x
+        dy = self.y - y
+        for index in np.flatnonzero(dx * dx + dy * dy < (distance + 1) ** 2).tolist():
+            sugar = self.patches[index]
+            if math.hypot(sugar['x'] - x, sugar['y'] - y) < distance:
+                return True
+        return False
+
+    def find_nearby(self, indices, xs, ys):
+        # One distance computation over every (ant, active patch) pair. For the ants with population
+        # indices `indices` at (xs, ys), record the patches that may be within DETECTION_RADIUS, or that may
+        # contain the point the ant steps to this tick (an ant moves less than ANT_SPEED when it arrives).
+        # The bound is padded by one unit, so callers repeat the exact check on this short list.
+        self.nearby = {}
+        if self.cached_version != self.version:
+            self.active_indices = np.array(self.active, dtype=np.intp)
+            self.active_x = self.arrays['x'][self.active_indices]
+            self.active_y = self.arrays['y'][self.active_indices]
+            self.cached_version = self.version
+        if len(self.active_indices) == 0:
+            return
+        reach = max(DETECTION_RADIUS, self.max_radius + ANT_SPEED) + 1
+        if kernels.ENABLED:
+            rows, columns = kernels.nearby_patches(xs, ys, self.active_x, self.active_y, reach)
+        else:
+            dx = self.active_x - xs[:, None]
+            dy = self.active_y - ys[:, None]
+            rows, columns = np.nonzero(dx * dx + dy * dy < reach * reach)
+        patches = self.patches
+        for index, patch_index in zip(indices[rows].tolist(), self.active_indices[columns].tolist()):
+            self.nearby.setdefault(index, []).append(patches[patch_index])
+
+    def near(self, index):
+        # Patches find_nearby found close to the ant with population index `index`
+        return self.nearby.get(index, ())
+
+    def patch_at(self, index, x, y):
+        # First non-empty patch (in patch order) whose radius covers (x, y), the point the ant with
+        # population index `index` stepped to this tick; or None
+        for sugar in self.nearby.get(index, ()):
+            if math.hypot(sugar['x'] - x, sugar['y'] - y) <= sugar['radius'] and sugar['count'] > 0:
+                return sugar
+        return None
+
+
+class StackedPatches:
+    # The SugarPatches of several worlds stacked along a world axis, as StackedPopulation stacks their
+    # ants: every field is a (worlds x capacity) array and worlds[w] is a SugarPatches over row w, so
+    # the patches near every world's ants are found in one distance computation. A world that outgrows
+    # the stack gets arrays of its own until the next find_nearby stacks them all again.
+    def __init__(self, worlds, capacity=8):
+        self.worlds = [SugarPatches() for _ in range(worlds)]
+        self.stack(capacity)
+
+    def stack(self, capacity):
+        self.arrays = {name: np.zeros((len(self.worlds), capacity), dtype=np.int64) for name in PATCH_FIELDS}
+        for world, patches in enumerate(self.worlds):
+            for name, array in self.arrays.items():
+                array[world, :patches.size] = patches.arrays[name][:patches.size]
+            patches.attach({name: array[world] for name, array in self.arrays.items()})
+        self.capacity = capacity
+
+    def find_nearby(self, world_indices, xs, ys):
+        # SugarPatches.find_nearby for every world: world_indices[w] are the population indices of the
+        # ants of world w, whose positions are in row w of xs and ys
+        capacity = max(patches.capacity for patches in self.worlds)
+        if capacity > self.capacity:
+            self.stack(capacity)
+        ants = np.zeros(xs.shape, dtype=bool)
+        for world, indices in enumerate(world_indices):
+            ants[world, indices] = True
+        sizes = np.array([patches.size for patches in self.worlds])
+        active = (self.arrays['count'] > 0) & (np.arange(self.capacity) < sizes[:, None])
+        reach = np.array([max(DETECTION_RADIUS, patches.max_radius + ANT_SPEED) + 1 for patches in self.worlds])
+        dx = self.arrays['x'][:, None, :] - xs[:, :, None]
+        dy = self.arrays['y'][:, None, :] - ys[:, :, None]
+        close = (dx * dx + dy * dy < (reach * reach)[:, None, None]) & ants[:, :, None] & active[:, None, :]
+        for patches in self.worlds:
+            patches.nearby = {}
+        # By world, then population index, then patch index, the order of SugarPatches.find_nearby
+        for world, index, patch_index in zip(*(axis.tolist() for axis in np.nonzero(close))):
+            patches = self.worlds[world]
+            patches.nearby.setdefault(index, []).append(patches.patches[patch_index])
@@ -1,19 +1,100 @@
 import pygame
-import sys
 import time  # For timing
 from constants import *
-from sugarscape import SugarScape
+from environment import SugarScapeEnv, open_display, handle_events
 from rl_agent import AntRLAgent  # RL Agent
 import os  # For directory handling
 import csv  # For CSV operations
+import actor_learner  # Parallel rollout workers
 
-def main(render=False):
-    if render:
-        pygame.init()
-        screen = pygame.display.set_mode((WIDTH, HEIGHT))
-        pygame.display.set_caption("SugarScape Simulation with Analytics")
-        clock = pygame.time.Clock()
-        font = pygame.font.Font(None, 24)
+def run_episode(shared_agent, episode, episode_length, display=None, seed=None):
+    # Play one training episode, recording the agent's decisions in its memory, and return its CSV row.
+    # `display` is (screen, clock, font) when rendering
+    # print(f"Starting Episode {episode + 1}/{num_episodes}")
+
+    # Start timing the episode
+    episode_start_time = time.time()
+
+    # Initialize the environment for each episode
+    env = SugarScapeEnv.shared(shared_agent, episode_length=episode_length)
+    sugarscape = env.reset(seed)
+
+    # Track the total reward for all ants
+    total_rewards = []
+
+    terminated = truncated = False
+    while not (terminated or truncated):
+        if display:
+            handle_events()
+
+        terminated, truncated = env.step()
+
+        if display:
+            env.render(display, 80)
+
+    # Early termination condition: the episode ended because no ants remain
+    if terminated:
+        print("All ants have died. Ending episode early.")
+
+    # Collect rewards for all ants after the episode ends
+    total_rewards = [ant.total_episode_reward for ant in sugarscape.all_ants]
+
+    # End of episode timing
+    episode_end_time = time.time()
+    episode_duration = episode_end_time - episode_start_time
+
+    # Compute the average reward for the episode
+    average_reward = sum(total_rewards) / len(total_rewards) if total_rewards else 0
+
+    # Collect action characteristics from all ants
+    action_characteristics_list = []
+    for ant in sugarscape.all_ants:
+        action_characteristics_list.extend(ant.selected_action_characteristics)
+        ant.selected_action_characteristics = []  # Reset for next episode
+
+    # Count explore and target actions
+    total_actions = len(action_characteristics_list)
+    explore_actions = sum(
+        1 for action in action_characteristics_list if action.get('type') == 'explore')
+    target_actions = total_actions - explore_actions
+
+    print(f"Episode {episode + 1}; Duration: {episode_duration:.2f} seconds; Average Reward: {average_reward:.2f}")
+
+    # End of episode processing
+    analytics_data = sugarscape.get_analytics_data()
+    average_lifespan = analytics_data.get('Average Lifespan', 0)
+    true_positives = analytics_data.get('True Positives',0)
+    false_positives = analytics_data.get('False Positives',0)
+    # print(f"Episode Time: {env.sim_time}")
+    print(f"Average Lifespan: {average_lifespan:.2f}")
+    # print(f"True Positives: {true_positives}")
+    # print(f"False Positives: {false_positives}")
+    # print(f"explore actions: {explore_actions}")
+    # print(f"target actions: {target_actions}")
+
+    return {
+        'Episode': episode + 1,
+        'Average Reward': average_reward,
+        'Average Lifespan': average_lifespan,
+        'True Location Count': true_positives,
+        'False Location Count': false_positives,
+        'Explore Actions': explore_actions,
+        'Target Actions': target_actions
+    }
+
+
+def serial_training(shared_agent, num_episodes, episode_length, display=None):
+    # Play every episode in this process, updating the policy after each one
+    for episode in range(num_episodes):
+        row = run_episode(shared_agent, episode, episode_length, display=display)
+
+        # Perform policy update after the episode
+        shared_agent.update_policy()
+        yield row
+
+
+def main(render=False, workers=TRAINING_WORKERS):
+    display = open_display() if render else None
 
     # Initialize the RL agent once
     state_size = 4  # Ant's own state features
@@ -34,8 +115,6 @@ def main(render=False):
     model_checkpoint_dir = "model checkpoints B"
     os.makedirs(model_checkpoint_dir, exist_ok=True)
 
-    action_characteristics_list = []
-
     # Initialize a list to store training data per episode
     training_data = []
 
@@ -50,6 +129,14 @@ def main(render=False):
                    'True Location Count', 'False Location Count',
                    'Explore Actions', 'Target Actions']
 
+    # Rendering trains in this process; otherwise rollout workers play the episodes while this process
+    # learns from them (actor_learner.py). Either way rows come back in episode order.
+    workers = workers or os.cpu_count()
+    if render or workers == 1:
+        rows = serial_training(shared_agent, num_episodes, episode_length, display=display)
+    else:
+        rows = actor_learner.train(shared_agent, input_size, num_episodes, episode_length, run_episode, workers)
+
     # Check if CSV file exists to determine if header needs to be written
     file_exists = os.path.isfile(csv_file)
 
@@ -61,115 +148,13 @@ def main(render=False):
         if not file_exists:
             writer.writeheader()
 
-        for episode in range(num_episodes):
-
-            # print(f"Starting Episode {episode + 1}/{num_episodes}")
-
-            # Start timing the episode
-            episode_start_time = time.time()
-
-            # Initialize the environment for each episode
-            sugarscape = SugarScape(shared_agent)
-            sim_time = 0  # Initialize simulation time
-
-            # Track the total reward for all ants
-            total_rewards = []
-
-            running = True
-            while running and sim_time < episode_length:
-                if render:
-                    for event in pygame.event.get():
-                        if event.type == pygame.QUIT:
-                            running = False
-                            pygame.quit()
-                            sys.exit()
-
-                sim_time += 1
-
-                sugarscape.update(sim_time)
-
-                if render:
-                    game_surface = pygame.Surface((GAME_WIDTH, HEIGHT))
-                    sugarscape.draw(game_surface)
-                    screen.blit(game_surface, (0, 0))
-
-                    analytics_surface = pygame.Surface((ANALYTICS_WIDTH, HEIGHT))
-                    analytics_surface.fill(WHITE)
-                    pygame.draw.line(analytics_surface, GRAY, (0, 0), (0, HEIGHT), 3)
-
-                    analytics_data = sugarscape.get_analytics_data()
-                    y_offset = 20
-                    for key, value in analytics_data.items():
-                        text = font.render(f"{key}: {value}", True, BLACK)
-                        analytics_surface.blit(text, (10, y_offset))
-                        y_offset += 30
-
-                    screen.blit(analytics_surface, (GAME_WIDTH, 0))
-
-                    pygame.display.flip()
-                    clock.tick(80)
-
-                # Early termination condition: End the episode if fewer than 3 ants remain
-                if len(sugarscape.ants) == 0:
-                    print("All ants have died. Ending episode early.")
-                    break
-
-            # Collect rewards for all ants after the episode ends
-            total_rewards = [ant.total_episode_reward for ant in sugarscape.all_ants]
-
-            # Perform policy update after the episode
-            shared_agent.update_policy()
-
-            # End of episode timing
-            episode_end_time = time.time()
-            episode_duration = episode_end_time - episode_start_time
-
-            # Compute the average reward for the episode
-            average_reward = sum(total_rewards) / len(total_rewards) if total_rewards else 0
-
-            # Collect action characteristics from all ants
-            for ant in sugarscape.all_ants:
-                action_characteristics_list.extend(ant.selected_action_characteristics)
-                ant.selected_action_characteristics = []  # Reset for next episode
-
-            # Count explore and target actions
-            total_actions = len(action_characteristics_list)
-            explore_actions = sum(
-                1 for action in action_characteristics_list if action.get('type') == 'explore')
-            target_actions = total_actions - explore_actions
-
-            print(f"Episode {episode + 1}; Duration: {episode_duration:.2f} seconds; Average Reward: {average_reward:.2f}")
-
+        for episode, row in enumerate(rows):
             # Store the average reward for this episode
-            episode_rewards.append(average_reward)
-
-            # End of episode processing
-            analytics_data = sugarscape.get_analytics_data()
-            average_lifespan = analytics_data.get('Average Lifespan', 0)
-            true_positives = analytics_data.get('True Positives',0)
-            false_positives = analytics_data.get('False Positives',0)
-            # print(f"Episode Time: {sim_time}")
-            print(f"Average Lifespan: {average_lifespan:.2f}")
-            # print(f"True Positives: {true_positives}")
-            # print(f"False Positives: {false_positives}")
-            # print(f"explore actions: {explore_actions}")
-            # print(f"target actions: {target_actions}")
-
-            # Reset action_characteristics_list for the next episode
-            action_characteristics_list = []
-
-            episode_lifespans.append(average_lifespan)
+            episode_rewards.append(row['Average Reward'])
+            episode_lifespans.append(row['Average Lifespan'])
 
             # Collect data for CSV
-            training_data.append({
-                'Episode': episode + 1,
-                'Average Reward': average_reward,
-                'Average Lifespan': average_lifespan,
-                'True Location Count': true_positives,
-                'False Location Count': false_positives,
-                'Explore Actions': explore_actions,
-                'Target Actions': target_actions
-            })
+            training_data.append(row)
 
             # Every 500 episodes, write collected data to CSV and clear the list
             if (episode + 1) % 100 == 0:
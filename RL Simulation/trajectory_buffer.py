@@ -0,0 +1,165 @@
+import numpy as np
+
+
+def discounted_returns(rewards, trajectories, gamma):
+    # Return of every step, R[t] = reward[t] + gamma * R[t + 1], restarted at each trajectory. Steps of a
+    # trajectory must be contiguous and in order. Each pass adds the return of the block `shift` steps
+    # further on, doubling how far ahead every step has summed, so this takes log2(steps) array passes.
+    returns = np.asarray(rewards, dtype=np.float64).copy()
+    discount = gamma
+    shift = 1
+    while shift < len(returns):
+        same_trajectory = trajectories[shift:] == trajectories[:-shift]
+        ahead = np.zeros_like(returns)
+        ahead[:-shift] = np.where(same_trajectory, returns[shift:], 0.0)
+        returns += discount * ahead
+        discount *= discount
+        shift *= 2
+    return returns
+
+
+class TrajectoryBuffer:
+    # Every decision taken by the ants since the last policy update, stored as flat arrays instead of
+    # one autograd graph per decision. Step i was taken by ant ant_ids[i] in state states[i] and picked
+    # candidate chosen[i] of the action feature rows features[offsets[i]:offsets[i + 1]]. rewards[i] is
+    # NaN until the action ends. Each (episode, ant) pair is its own trajectory, so one buffer can
+    # span several episodes.
+    def __init__(self, capacity=1024):
+        self.capacity = capacity
+        self.size = 0
+        self.feature_rows = 0
+        self.episode = 0
+        self.trajectories = {}  # Key: (episode, ant id), Value: trajectory id
+        self.trajectory_count = 0
+        self.last_step = {}  # Key: trajectory id, Value: its latest step
+        self.states = None  # Allocated by the first append, once the state and feature sizes are known
+        self.features = None
+
+    def allocate(self, state_size, feature_size):
+        self.states = np.zeros((self.capacity, state_size), dtype=np.float32)
+        self.offsets = np.zeros(self.capacity + 1, dtype=np.int64)
+        self.chosen = np.zeros(self.capacity, dtype=np.int64)
+        self.rewards = np.full(self.capacity, np.nan)
+        self.ant_ids = np.zeros(self.capacity, dtype=np.int64)
+        self.trajectory_ids = np.zeros(self.capacity, dtype=np.int64)
+        self.features = np.zeros((8 * self.capacity, feature_size), dtype=np.float32)
+
+    def grow(self, capacity):
+        for name in ('states', 'chosen', 'rewards', 'ant_ids', 'trajectory_ids'):
+            array = getattr(self, name)
+            grown = np.full((capacity,) + array.shape[1:], np.nan) if name == 'rewards' else np.zeros((capacity,) + array.shape[1:], dtype=array.dtype)
+            grown[:self.size] = array[:self.size]
+            setattr(self, name, grown)
+        offsets = np.zeros(capacity + 1, dtype=np.int64)
+        offsets[:self.size + 1] = self.offsets[:self.size + 1]
+        self.offsets = offsets
+        self.capacity = capacity
+
+    def grow_features(self, rows):
+        grown = np.zeros((rows, self.features.shape[1]), dtype=np.float32)
+        grown[:self.feature_rows] = self.features[:self.feature_rows]
+        self.features = grown
+
+    def start_episode(self):
+        # Ant ids are reused by every episode; later decisions start new trajectories
+        self.episode += 1
+        self.last_step = {}
+
+    def append(self, ant_id, state, features, chosen):
+        # Record a decision: `features` is the (num_actions x feature_size) candidate matrix
+        if self.states is None:
+            self.allocate(len(state), features.shape[1])
+        if self.size == self.capacity:
+            self.grow(2 * self.capacity)
+        end = self.feature_rows + len(features)
+        if end > len(self.features):
+            self.grow_features(max(end, 2 * len(self.features)))
+        trajectory = self.trajectories.get((self.episode, ant_id))
+        if trajectory is None:
+            trajectory = self.trajectories[(self.episode, ant_id)] = self.trajectory_count
+            self.trajectory_count += 1
+        step = self.size
+        self.states[step] = state
+        self.features[self.feature_rows:end] = features
+        self.offsets[step + 1] = end
+        self.chosen[step] = chosen
+        self.rewards[step] = np.nan
+        self.ant_ids[step] = ant_id
+        self.trajectory_ids[step] = trajectory
+        self.last_step[trajectory] = step
+        self.feature_rows = end
+        self.size += 1
+
+    def store_reward(self, ant_id, reward):
+        # Reward the ant's latest decision of this episode, unless it already has one
+        step = self.last_step.get(self.trajectories.get((self.episode, ant_id)))
+        if step is not None and np.isnan(self.rewards[step]):
+            self.rewards[step] = reward
+
+    def rewarded_steps(self):
+        # Steps that received a reward, grouped by trajectory (in order of each trajectory's first
+        # decision) and in decision order within a trajectory
+        steps = np.flatnonzero(~np.isnan(self.rewards[:self.size]))
+        return steps[np.argsort(self.trajectory_ids[steps], kind='stable')]
+
+    def candidates(self, steps):
+        # (states, stacked candidate features, candidates per step) for the given steps
+        starts = self.offsets[steps]
+        counts = self.offsets[steps + 1] - starts
+        rows = np.repeat(starts - (np.cumsum(counts) - counts), counts) + np.arange(counts.sum())
+        return self.states[steps], self.features[rows], counts
+
+    def export(self):
+        # The rewarded steps as plain arrays, e.g. to ship from a rollout worker to the learner
+        if self.states is None:
+            return None
+        steps = self.rewarded_steps()
+        states, features, counts = self.candidates(steps)
+        return {
+            'states': states,
+            'features': features,
+            'counts': counts,
+            'chosen': self.chosen[steps],
+            'rewards': self.rewards[steps],
+            'ant_ids': self.ant_ids[steps],
+            'trajectory_ids': self.trajectory_ids[steps],
+        }
+
+    def extend(self, exported):
+        # Append steps from another buffer's export(). Their trajectories become new trajectories here,
+        # and since those steps are already rewarded, store_reward never touches them.
+        if exported is None or not len(exported['chosen']):
+            return
+        if self.states is None:
+            self.allocate(exported['states'].shape[1], exported['features'].shape[1])
+        steps = len(exported['chosen'])
+        capacity = self.capacity
+        while self.size + steps > capacity:
+            capacity *= 2
+        if capacity > self.capacity:
+            self.grow(capacity)
+        end = self.feature_rows + len(exported['features'])
+        if end > len(self.features):
+            self.grow_features(max(end, 2 * len(self.features)))
+        trajectories, trajectory_ids = np.unique(exported['trajectory_ids'], return_inverse=True)
+        new = slice(self.size, self.size + steps)
+        self.states[new] = exported['states']
+        self.features[self.feature_rows:end] = exported['features']
+        self.offsets[self.size + 1:self.size + steps + 1] = self.feature_rows + np.cumsum(exported['counts'])
+        self.chosen[new] = exported['chosen']
+        self.rewards[new] = exported['rewards']
+        self.ant_ids[new] = exported['ant_ids']
+        self.trajectory_ids[new] = self.trajectory_count + trajectory_ids
+        self.trajectory_count += len(trajectories)
+        self.feature_rows = end
+        self.size += steps
+
+    def clear(self):
+        self.size = 0
+        self.feature_rows = 0
+        self.trajectories = {}
+        self.trajectory_count = 0
+        self.last_step = {}
+
+    def __len__(self):
+        return self.size
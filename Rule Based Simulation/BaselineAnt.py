@@ -1,29 +1,73 @@
 # BaselineAnt.py
 
-import random
+import bisect
 import math
-import collections
 import numpy as np
 from constants import *
+import kernels
+from population import AntPopulation, population_field
+from knowledge import CHARACTERISTICS, CHARACTERISTIC_CODES, KnowledgeBase, LocationRegistry
+from rng_streams import RandomStreams
 
 class BaselineAnt:
-    def __init__(self, x, y, ant_id, is_false_broadcaster=False):
+    # Per-tick state is stored in the shared AntPopulation arrays (see population.py)
+    x = population_field('x')
+    y = population_field('y')
+    direction = population_field('direction')
+    health = population_field('health')
+    lifespan = population_field('lifespan')
+    target = population_field('target')
+    is_false_broadcaster = population_field('is_false_broadcaster')
+    action_in_progress = population_field('action_in_progress')
+    arrived_at_target = population_field('arrived_at_target')
+    has_reached_target = population_field('has_reached_target')
+    is_exploring_target = population_field('is_exploring_target')
+
+    # Everything else an ant holds; no per-instance __dict__
+    __slots__ = (
+        'population', 'index', 'knowledge', 'rng', 'id', 'sugarscape', 'current_time', 'turn_angle',
+        'initial_health', 'max_health', 'current_broadcast_characteristic', 'mean_interval',
+        'std_deviation', 'target_selection_interval', 'next_target_selection_time',
+        'confirmed_false_locations', 'confirmed_true_locations', 'false_broadcast_location',
+        'target_patch_center', 'just_ate_sugar', 'own_false_locations', 'frames_since_arrival',
+        'max_arrival_frames', 'health_at_action_start', 'current_action_type',
+        'selected_action_characteristics', 'last_location', 'last_broadcasts',
+    )
+
+    def __init__(self, x, y, ant_id, is_false_broadcaster=False, population=None, knowledge=None, rng=None):
+        self.population = population if population is not None else AntPopulation(1)
+        self.index = self.population.add()  # Slot in the population arrays
+        # communicated_targets and what this ant has sent to others live in the shared KnowledgeBase (see knowledge.py)
+        self.knowledge = knowledge if knowledge is not None else KnowledgeBase(LocationRegistry(), 1)
+        self.knowledge.ensure_ant(self.index)
         self.id = ant_id  # Unique identifier for the ant
+        self.sugarscape = None  # Reference to the Sugarscape instance
+
+        self.confirmed_false_locations = set()  # Set to store confirmed false locations
+        self.confirmed_true_locations = set()  # Set to store confirmed true locations
+        # Track false locations created by this ant if it is a false broadcaster
+        self.own_false_locations = set()
+        self.selected_action_characteristics = []  # Used for evaluation
+        # Key: location, Value: (characteristic, sim_time, whether everyone in reach was told) of the
+        # last broadcast of it that was actually sent
+        self.last_broadcasts = {}
+
+        self.reset(x, y, is_false_broadcaster, rng)
+
+    def reset(self, x, y, is_false_broadcaster=False, rng=None):
+        # Start a new episode at (x, y). SugarScape.reset calls this on the ants of the previous episode,
+        # which keep their population slot and containers.
+        self.rng = rng if rng is not None else RandomStreams()  # The SugarScape's random streams (see rng_streams.py)
         self.current_time = 0
         self.is_false_broadcaster = is_false_broadcaster
         self.x = x
         self.y = y
-        self.direction = random.uniform(0, 2 * math.pi)
+        self.direction = self.rng.spawn.uniform(0, 2 * math.pi)
         self.turn_angle = math.pi / 8
         self.health = INITIAL_HEALTH
         self.initial_health = INITIAL_HEALTH
         self.max_health = MAX_HEALTH
         self.target = None
-        # Use OrderedDict for communicated_targets to maintain order
-        self.communicated_targets = collections.OrderedDict()
-        # Key: (x, y), Value: {'accepted': count, 'rejected': count, 'confirmed': count}
-
-        self.already_communicated = {}  # Key: other_ant, Value: {location: characteristic}
         self.current_broadcast_characteristic = None  # Track current broadcast characteristic
 
         self.lifespan = 0
@@ -35,22 +79,21 @@ class BaselineAnt:
         # Use a normal distribution for the first target selection interval
         self.target_selection_interval = max(
             300,  # Minimum interval of 300 frames
-            int(random.gauss(self.mean_interval, self.std_deviation))
+            int(self.rng.spawn.gauss(self.mean_interval, self.std_deviation))
         )
         self.next_target_selection_time = self.target_selection_interval
 
-        self.confirmed_false_locations = set()  # Set to store confirmed false locations
-        self.confirmed_true_locations = set()  # Set to store confirmed true locations
+        self.confirmed_false_locations.clear()
+        self.confirmed_true_locations.clear()
+        self.last_broadcasts.clear()
 
-        self.sugarscape = None  # Reference to the Sugarscape instance
         self.false_broadcast_location = None  # Store the current false location being broadcast
         self.target_patch_center = None  # Store the center of the sugar patch for broadcasting
 
         self.is_exploring_target = False  # Initially not exploring
         self.just_ate_sugar = False
 
-        # Track false locations created by this ant if it is a false broadcaster
-        self.own_false_locations = set()
+        self.own_false_locations.clear()
 
         self.has_reached_target = False
 
@@ -62,7 +105,7 @@ class BaselineAnt:
 
         self.current_action_type = None
 
-        self.selected_action_characteristics = []  # Used for evaluation
+        self.selected_action_characteristics.clear()
 
         self.action_in_progress = False
 
@@ -73,11 +116,12 @@ class BaselineAnt:
         closest_sugar = None
         closest_distance = float('inf')
         target_changed = False
+        x, y = self.x, self.y
 
-        for sugar in sugar_patches:
+        for sugar in sugar_patches.near(self.index):  # Patches close enough to be worth the exact check
             if sugar['count'] > 0:  # Only consider patches with sugar
-                dx = sugar['x'] - self.x
-                dy = sugar['y'] - self.y
+                dx = sugar['x'] - x
+                dy = sugar['y'] - y
                 distance = math.hypot(dx, dy)
 
                 if distance < DETECTION_RADIUS and distance < closest_distance:
@@ -100,80 +144,47 @@ class BaselineAnt:
             # health_threshold = 0.9  # 90% of max health
 
             max_distance = math.hypot(GAME_WIDTH, HEIGHT)
-            viable_targets = []
-            total_weight = 0
-            action_characteristics_list = []
-
-            for location, counts in self.communicated_targets.items():
-                # Skip locations that are this ant's own false locations
-                if location in self.own_false_locations:
-                    continue
-
-                # Skip confirmed locations
-                if location in self.confirmed_false_locations or location in self.confirmed_true_locations:
-                    continue
-
-                dx = location[0] - self.x
-                dy = location[1] - self.y
-                distance = math.hypot(dx, dy)
-
-                if distance <= max_distance:
-                    confirmed = counts.get('confirmed', 0)
-                    accepted = counts.get('accepted', 0)
-                    rejected = counts.get('rejected', 0)
-                    # print("Rejected:", rejected)
-
-                    # Calculate score based on the rule-based function
-                    score = (confirmed + 0.5* accepted) / (rejected + 1) / (distance**2 + 1)  ## 
-                    viable_targets.append((location, score))
 
-                    # Collect action characteristics for evaluation
+            # Score every location the ant has been told about, in communicated_targets order, leaving out
+            # its own false locations and the ones it has confirmed true or false
+            candidates = self.communicated_targets.location_ids()
+            if len(candidates) < VECTORIZED_SCORING_MIN_TARGETS:
+                location_ids, distances, counts, cumulative_weights = self.score_targets(candidates.tolist(), max_distance)
+            else:
+                location_ids, distances, counts, cumulative_weights = self.score_targets_batched(candidates, max_distance)
+
+            if len(location_ids):
+                # Select a target based on weighted probabilities: the first whose running total reaches the draw
+                rand_value = self.rng.policy.uniform(0, float(cumulative_weights[-1]))
+                selected_idx = bisect.bisect_left(cumulative_weights, rand_value)
+                if selected_idx < len(location_ids):
+                    location = self.knowledge.locations.locations[location_ids[selected_idx]]
+                    self.target = location
+                    sugarscape.exploit_count += 1
+                    self.is_exploring_target = False  # Set to False as it's not an explore target
+                    self.broadcast_sugar_location('accepted')
+
+                    # Check if the accepted location is true or false
+                    if sugarscape.sugar_patches.has_center(location):
+                        sugarscape.true_positives += 1
+                    elif location in sugarscape.historical_false_locations:
+                        sugarscape.false_positives += 1
+
+                    # Record the action characteristics of the selected target for evaluation
                     characteristic_counts = {
-                        'confirmed': confirmed,
-                        'accepted': accepted,
-                        'rejected': rejected,
+                        characteristic: int(counts[selected_idx][CHARACTERISTIC_CODES[characteristic] - 1])
+                        for characteristic in ('confirmed', 'accepted', 'rejected')
                     }
                     predominant_characteristic = max(characteristic_counts, key=characteristic_counts.get)
-                    predominant_count = characteristic_counts[predominant_characteristic]
-                    is_false_location = location in sugarscape.historical_false_locations
-
-                    action_characteristics_list.append({
+                    self.selected_action_characteristics.append({
                         'type': 'target',
                         'location': location,
-                        'distance': distance,
-                        'counts': characteristic_counts.copy(),
+                        'distance': float(distances[selected_idx]),
+                        'counts': characteristic_counts,
                         'predominant_characteristic': predominant_characteristic,
-                        'predominant_count': predominant_count,
-                        'is_false_location': is_false_location,
+                        'predominant_count': characteristic_counts[predominant_characteristic],
+                        'is_false_location': location in sugarscape.historical_false_locations,
                     })
-                    total_weight += score
-            
-            if viable_targets:
-                # Select a target based on weighted probabilities
-                rand_value = random.uniform(0, total_weight)
-                cumulative_weight = 0
-                selected_idx = None
-                for idx, (location, weight) in enumerate(viable_targets):
-                    cumulative_weight += weight
-                    if rand_value <= cumulative_weight:
-                        self.target = location
-                        sugarscape.exploit_count += 1
-                        self.is_exploring_target = False  # Set to False as it's not an explore target
-                        self.broadcast_sugar_location('accepted')
-
-                        selected_idx = idx  # Save index to retrieve action characteristics
-
-                        # Check if the accepted location is true or false
-                        if location in [(patch['x'], patch['y']) for patch in sugarscape.sugar_patches]:
-                            sugarscape.true_positives += 1
-                        elif location in sugarscape.historical_false_locations:
-                            sugarscape.false_positives += 1
-                        break
-
-                # Append the action characteristics of the selected target
-                if selected_idx is not None:
-                    selected_action_char = action_characteristics_list[selected_idx]
-                    self.selected_action_characteristics.append(selected_action_char)
             else:
                 # If no viable targets, explore
                 self.explore()
@@ -189,8 +200,58 @@ class BaselineAnt:
         
             self.next_target_selection_time = self.current_time + self.target_selection_interval
 
-
-
+    def score_targets(self, location_ids, max_distance):
+        # Viable targets among location_ids with their distances, counts and running total of scores,
+        # one location at a time; cheaper than score_targets_batched for a handful of locations
+        knowledge = self.knowledge
+        counts_view = knowledge.views['counts']
+        targets, distances, counts, cumulative_weights = [], [], [], []
+        total = 0.0
+        for location_id in location_ids:
+            location = knowledge.locations.locations[location_id]
+            if location in self.own_false_locations or location in self.confirmed_false_locations or location in self.confirmed_true_locations:
+                continue
+            distance = math.hypot(location[0] - self.x, location[1] - self.y)
+            if distance <= max_distance:
+                row = [counts_view[self.index, location_id, i] for i in range(len(CHARACTERISTICS))]
+                confirmed = row[CHARACTERISTIC_CODES['confirmed'] - 1]
+                accepted = row[CHARACTERISTIC_CODES['accepted'] - 1]
+                rejected = row[CHARACTERISTIC_CODES['rejected'] - 1]
+                total += kernels.target_score(confirmed, accepted, rejected, distance)
+                targets.append(location_id)
+                distances.append(distance)
+                counts.append(row)
+                cumulative_weights.append(total)
+        return targets, distances, counts, cumulative_weights
+
+    def score_targets_batched(self, location_ids, max_distance):
+        # score_targets over arrays, scoring all the locations at once
+        knowledge = self.knowledge
+        registry = knowledge.locations
+        excluded = knowledge.confirmed_false[self.index].copy()
+        for location in self.own_false_locations | self.confirmed_true_locations:
+            location_id = registry.ids.get(location)
+            if location_id is not None and location_id < len(excluded):
+                excluded[location_id] = True
+        if kernels.ENABLED:
+            location_ids, distances, cumulative_weights = kernels.score_targets(
+                location_ids, excluded, registry.coordinates, knowledge.counts[self.index], self.x, self.y, max_distance,
+                CHARACTERISTIC_CODES['confirmed'] - 1, CHARACTERISTIC_CODES['accepted'] - 1, CHARACTERISTIC_CODES['rejected'] - 1,
+            )
+            return location_ids, distances, knowledge.counts[self.index, location_ids], cumulative_weights
+
+        location_ids = location_ids[~excluded[location_ids]]
+        offsets = registry.coordinates[location_ids] - (self.x, self.y)
+        distances = np.array(list(map(math.hypot, offsets[:, 0].tolist(), offsets[:, 1].tolist())))  # math.hypot rounds differently from np.hypot
+        within = distances <= max_distance
+        location_ids = location_ids[within]
+        distances = distances[within]
+
+        counts = knowledge.counts[self.index, location_ids]
+        confirmed = counts[:, CHARACTERISTIC_CODES['confirmed'] - 1]
+        accepted = counts[:, CHARACTERISTIC_CODES['accepted'] - 1]
+        rejected = counts[:, CHARACTERISTIC_CODES['rejected'] - 1]
+        return location_ids, distances, counts, np.cumsum(kernels.target_score(confirmed, accepted, rejected, distances))
 
     def explore(self):
         # Exploration logic: move randomly within the environment
@@ -213,52 +274,52 @@ class BaselineAnt:
             else:
                 return  # No valid location to broadcast
 
+        # Broadcasts only go out when they change something: a repeat of the last one is dropped
+        # unless an ant that may not have heard it has come within reach since
         location = (broadcast_x, broadcast_y)
-
-        # Broadcast to other ants within the communication radius
-        for other_ant in self.sugarscape.ants:
-            if other_ant != self:
-                dx = other_ant.x - self.x
-                dy = other_ant.y - self.y
-                dist = math.hypot(dx, dy)
-
-                if dist <= COMMUNICATION_RADIUS:
-                    if location in other_ant.confirmed_false_locations:
-                        continue  # Skip this location
-                    # Initialize 'already_communicated' entry for other_ant if not present
-                    if other_ant not in self.already_communicated:
-                        self.already_communicated[other_ant] = {}
-                    # Check if we've previously communicated this location to this ant
-                    previous_characteristic = self.already_communicated[other_ant].get(location)
-                    if previous_characteristic == characteristic:
-                        # Already communicated this characteristic to this ant for this location
-                        continue
-                    else:
-                        # Update other_ant's communicated_targets
-                        # Decrement count for previous characteristic if any
-                        if previous_characteristic:
-                            if location in other_ant.communicated_targets:
-                                if previous_characteristic in other_ant.communicated_targets[location]:
-                                    other_ant.communicated_targets[location][previous_characteristic] -= 1
-                                    if other_ant.communicated_targets[location][previous_characteristic] <= 0:
-                                        del other_ant.communicated_targets[location][previous_characteristic]
-                                    if not other_ant.communicated_targets[location]:
-                                        # Remove the location from communicated_targets
-                                        del other_ant.communicated_targets[location]
-                        # Increment count for new characteristic
-                        if location in other_ant.communicated_targets:
-                            # Update counts
-                            counts = other_ant.communicated_targets[location]
-                            counts[characteristic] = counts.get(characteristic, 0) + 1
-                            # Move the location to the end to reflect recent communication
-                            other_ant.communicated_targets.move_to_end(location)
-                        else:
-                            # Add new location
-                            other_ant.communicated_targets[location] = {characteristic: 1}
-                        # Update 'already_communicated'
-                        self.already_communicated[other_ant][location] = characteristic
+        last = self.last_broadcasts.get(location)
+        if last is not None and last[0] == characteristic and last[2] and self.sugarscape.nobody_new_in_reach(self.index, last[1]):
+            return
+
+        location_id = self.knowledge.locations.intern(location)
+        if self.sugarscape.message_queue is not None:
+            # Delivered when the tick ends; until then no broadcast of the location is a repeat
+            self.last_broadcasts.pop(location, None)
+            self.sugarscape.message_queue.add(self, location_id, location, characteristic)
+        else:
+            self.deliver_broadcast(location, location_id, characteristic, self.current_time)
+
+    def deliver_broadcast(self, location, location_id, characteristic, sim_time):
+        code = CHARACTERISTIC_CODES[characteristic]
+        if self.sugarscape.bulletin_board is not None:
+            # Everyone is in range: post once, receivers pick it up from the board
+            self.sugarscape.bulletin_board.post(self.index, location_id, code, sim_time)
+            self.last_broadcasts[location] = (characteristic, sim_time, True)
+            return
+
+        # Broadcast to other ants within the communication radius, skipping the ones that confirmed
+        # the location false or were already told the same characteristic by this ant
+        receivers = self.sugarscape.indices_near(self, COMMUNICATION_RADIUS)
+        self.knowledge.send(self.index, receivers, location_id, code, sim_time)
+        self.last_broadcasts[location] = (characteristic, sim_time, self.sugarscape.told_all_in_reach(self.index, location_id, code))
+
+    @property
+    def communicated_targets(self):
+        # Read-only view, {(x, y): {'accepted': count, 'rejected': count, 'confirmed': count}}
+        self.receive_pending_broadcasts()
+        return self.knowledge.view(self.index)
+
+    def receive_pending_broadcasts(self):
+        # Catch up on messages posted to the bulletin board since this ant last looked
+        if self.sugarscape is not None and self.sugarscape.bulletin_board is not None:
+            self.sugarscape.bulletin_board.deliver(self.index)
 
     def move(self, sugar_patches, sugarscape, sim_time):
+        self.think(sugar_patches, sugarscape, sim_time)
+        self.advance()
+
+    def think(self, sugar_patches, sugarscape, sim_time):
+        # Everything in a tick except the position/health update, which SugarScape can batch
         self.current_time = sim_time
 
         # Store the previous target before detecting sugar
@@ -314,18 +375,11 @@ class BaselineAnt:
                 while not valid_location_found and attempts < max_attempts:
                     # Generate a random location within the game area with padding
                     candidate_location = (
-                        random.randint(padding, GAME_WIDTH - padding),
-                        random.randint(padding, HEIGHT - padding),
+                        self.rng.patches.randint(padding, GAME_WIDTH - padding),
+                        self.rng.patches.randint(padding, HEIGHT - padding),
                     )
-                    valid_location = True
-                    # Check distance to all sugar patches
-                    for sugar in self.sugarscape.sugar_patches:
-                        dx = sugar['x'] - candidate_location[0]
-                        dy = sugar['y'] - candidate_location[1]
-                        distance = math.hypot(dx, dy)
-                        if distance < 150:   # Minimum distance away from any sugar patch
-                            valid_location = False
-                            break  # No need to check other sugar patches
+                    # Minimum distance away from any sugar patch
+                    valid_location = not self.sugarscape.sugar_patches.any_within(candidate_location[0], candidate_location[1], 150)
 
                     if valid_location:
                         valid_location_found = True
@@ -343,11 +397,14 @@ class BaselineAnt:
             else:
                 if self.current_time >= self.sugarscape.broadcast_times[self]:
                     # Reset communication for the old false location
-                    for other_ant in list(self.already_communicated.keys()):
-                        if self.false_broadcast_location in self.already_communicated[other_ant]:
-                            del self.already_communicated[other_ant][self.false_broadcast_location]
-                            if not self.already_communicated[other_ant]:
-                                del self.already_communicated[other_ant]
+                    location_id = self.knowledge.locations.intern(self.false_broadcast_location)
+                    if self.sugarscape.bulletin_board is not None:
+                        self.sugarscape.bulletin_board.retract(self.index, location_id)
+                    else:
+                        self.knowledge.forget_sent(self.index, location_id)
+                    if self.sugarscape.message_queue is not None:
+                        self.sugarscape.message_queue.discard(self.index, location_id)
+                    self.last_broadcasts.pop(self.false_broadcast_location, None)
                     self.false_broadcast_location = None  # Reset to generate a new false location in the next frame
                 else:
                     # Continue broadcasting the current false location
@@ -378,36 +435,37 @@ class BaselineAnt:
                 found_sugar = False
 
                 # Check if ant is within any sugar patch
-                for sugar in self.sugarscape.sugar_patches:
-                    dx = sugar['x'] - self.x
-                    dy = sugar['y'] - self.y
-                    distance_to_sugar = math.hypot(dx, dy)
-
-                    if distance_to_sugar <= sugar['radius'] and sugar['count'] > 0:
-                        found_sugar = True
-                        self.confirmed_true_locations.add(self.target)
-
-                        if not self.is_exploring_target and not self.has_reached_target:
-                            pass  # Placeholder for any additional logic
-
-                        if self.needs_to_eat():
-                            sugar['count'] -= 1
-                            if sugar['count'] <= 0:
-                                # Optionally remove or mark the sugar patch as depleted
-                                pass
+                sugar = self.sugarscape.sugar_patches.patch_at(self.index, self.x, self.y)
+                if sugar is not None:
+                    found_sugar = True
+                    self.confirmed_true_locations.add(self.target)
+
+                    if not self.is_exploring_target and not self.has_reached_target:
+                        pass  # Placeholder for any additional logic
+
+                    sugar_left = sugar['count']
+                    if self.needs_to_eat():
+                        sugar_left = self.sugarscape.sugar_patches.take(sugar, self)
+                        if sugar_left <= 0:
+                            # Optionally remove or mark the sugar patch as depleted
+                            pass
+                        if not self.sugarscape.double_buffered:
+                            # Otherwise SugarScape.commit feeds the ant if the unit is granted, so it
+                            # stays on the patch until it finds itself full
                             self.eat_sugar()
                             self.just_ate_sugar = True
-                        break
 
                 if not found_sugar:
+                    self.receive_pending_broadcasts()  # Messages posted before this point still count for this location
                     self.confirmed_false_locations.add(self.target)
+                    self.knowledge.confirm_false(self.index, self.knowledge.locations.intern(self.target))
                     # print("Added target ",self.target, "to confirmed false locations")
                     if not self.is_exploring_target and not self.has_reached_target:
                         pass  # Placeholder for any additional logic
 
                 # **Modified Logic:**
                 if found_sugar:
-                    if self.health >= self.initial_health or sugar['count'] <= 0:
+                    if self.health >= self.initial_health or sugar_left <= 0:
                         # Ant's health is replenished or sugar is depleted
                         self.last_location = self.target  # Save the last target location
 
@@ -435,7 +493,7 @@ class BaselineAnt:
             else:
                 self.direction = math.atan2(dy, dx)
         else:
-            self.direction += random.uniform(-self.turn_angle, self.turn_angle)
+            self.direction += self.rng.movement.uniform(-self.turn_angle, self.turn_angle)
             self.direction %= 2 * math.pi  # Ensure direction stays within 0 to 2π
 
         if self.arrived_at_target:
@@ -450,6 +508,8 @@ class BaselineAnt:
                     # Schedule next target selection
                     self.next_target_selection_time = self.current_time + self.target_selection_interval
 
+    def advance(self):
+        # Scalar version of AntPopulation.advance
         self.x += ANT_SPEED * math.cos(self.direction)
         self.y += ANT_SPEED * math.sin(self.direction)
         self.x = max(0, min(self.x, GAME_WIDTH))
@@ -472,13 +532,13 @@ class BaselineAnt:
     def is_alive(self):
         return self.health > 0
 
+    def ants_within(self, radius):
+        # Ants in sugarscape.ants within `radius` of this ant (itself included), via its neighbour structure
+        return self.sugarscape.ants_near(self, radius)
+
     def count_nearby_ants(self):
         count = 0
-        for other_ant in self.sugarscape.ants:
+        for other_ant in self.ants_within(DETECTION_RADIUS):
             if other_ant != self:
-                dx = other_ant.x - self.x
-                dy = other_ant.y - self.y
-                distance = math.hypot(dx, dy)
-                if distance <= DETECTION_RADIUS:
-                    count += 1
+                count += 1
         return count
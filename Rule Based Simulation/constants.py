@@ -1,5 +1,6 @@
 # constants.py
 import math
+import os
 
 
 GAME_WIDTH, HEIGHT = 800, 800
@@ -20,9 +21,29 @@ NEW_SUGAR_INTERVAL = int(10000 / MILLISECONDS_PER_FRAME)
 
 COMMUNICATION_RADIUS = 8000   # Change this to 80 for the face-to-face simulation
 DETECTION_RADIUS = 70
+WORLD_DIAGONAL = math.hypot(GAME_WIDTH, HEIGHT)  # Largest possible distance between two ants
 
 TARGET_SELECTION_INTERVAL = int(8000 / MILLISECONDS_PER_FRAME)
 
+# Engine settings
+VECTORIZED_ENGINE = False   # Move all ants with batched NumPy updates after they have all thought, instead of each right after its own turn; in face-to-face mode the others are then seen where they started the tick, changes results
+GRID_CELL_SIZE = DETECTION_RADIUS   # Cell size of the spatial grid used for communication/detection radius queries
+GRID_MIN_ANTS = 64   # Below this many ants radius queries scan every ant instead of using the grid
+VECTORIZED_SCORING_MIN_TARGETS = 8   # Below this many known locations BaselineAnt scores targets one at a time instead of as arrays
+NUMBA_KERNELS = True   # Run the array loops of a tick as numba-compiled kernels (kernels.py) when numba is installed; results are the same either way
+BULLETIN_BOARD = True   # Post broadcasts to a shared log when COMMUNICATION_RADIUS covers the whole world
+EVENT_SCHEDULER = False   # Ants walking to a fixed target skip their turns until their next event (event_scheduler.py); they keep their heading meanwhile, changes results
+EVENT_SCHEDULER_VALIDATE = False   # With EVENT_SCHEDULER, still give every ant every turn and check the sleeping ones met no event and kept to their course
+MESSAGE_QUEUE = False   # Hold broadcasts until the end of the tick and deliver them together (message_queue.py); changes results
+DOUBLE_BUFFERED = False   # Two-phase tick: ants decide from the state the tick started with, then their moves, meals and broadcasts are committed together; implies VECTORIZED_ENGINE and MESSAGE_QUEUE, changes results
+INTENT_THREADS = min(4, os.cpu_count() or 1)   # Threads that build the neighbour structures of a DOUBLE_BUFFERED tick from its snapshot; needs NUMBA_KERNELS, whose kernels release the GIL
+PARALLEL_MIN_ANTS = 128   # Below this many ants those structures are built on one thread
+
+# Evaluation settings
+EVALUATION_WORKERS = 1   # Processes the evaluation scripts spread episodes over; 1 runs in-process, 0 uses every core
+EVALUATION_SEED = 0   # Episode e of an evaluation is seeded with EVALUATION_SEED + e
+
+
 
 
 grid_size = int(math.sqrt(SUGAR_MAX))  # Grid size for sugar patch
@@ -1,8 +1,7 @@
 import pygame
-import sys
-import time
+import multiprocessing
 from constants import *
-from sugarscape import SugarScape
+from environment import SugarScapeEnv, open_display, handle_events
 import matplotlib.pyplot as plt
 import os
 import numpy as np
@@ -91,121 +90,105 @@ def plot_histograms(action_characteristics):
     plt.savefig('action_characteristics_histograms.png')
     print("Histograms saved as 'action_characteristics_histograms.png'")
 
-def main(render=False):
-    if render:
-        pygame.init()
-        screen = pygame.display.set_mode((WIDTH, HEIGHT))
-        pygame.display.set_caption("SugarScape Simulation with Analytics")
-        clock = pygame.time.Clock()
-        font = pygame.font.Font(None, 24)
+FIELDNAMES = ['Episode', 'Average Lifespan', 'True Location Selections', 'False Location Selections', 'Explore Actions', 'Target Actions']
+
+
+def run_episode(episode, num_episodes, episode_length, display=None):
+    # Run one evaluation episode and return its CSV row and the actions its ants selected.
+    # `display` is (screen, clock, font) when rendering
+    print(f"Starting Evaluation Episode {episode + 1}/{num_episodes}")
+
+    # Initialize the environment for each episode, with its own seed so the result does not depend on
+    # which process runs it or when
+    env = SugarScapeEnv.shared(episode_length=episode_length)
+    sugarscape = env.reset(EVALUATION_SEED + episode)
+
+    terminated = truncated = False
+    while not (terminated or truncated):
+        if display:
+            handle_events()
+
+        terminated, truncated = env.step()
+
+        if display:
+            env.render(display, 150)
+
+    # Early termination condition: the episode ended because no ants remain
+    if terminated:
+        print("All ants died. Ending episode early.")
+
+    # Collect action characteristics from all ants
+    action_characteristics_list = []
+    for ant in sugarscape.all_ants:
+        action_characteristics_list.extend(ant.selected_action_characteristics)
+        ant.selected_action_characteristics = []  # Reset for next episode
+
+    # Collect and print other metrics
+    analytics_data = sugarscape.get_analytics_data()
+    average_lifespan = analytics_data.get('Average Lifespan', 0)
+    true_positives = analytics_data.get('True Positives', 0)
+    false_positives = analytics_data.get('False Positives', 0)
+    print(f"Episode Time: {env.sim_time}")
+    print(f"Average Lifespan: {average_lifespan:.2f}")
+
+    # Count explore and target actions
+    total_actions = len(action_characteristics_list)
+    explore_actions = sum(1 for action in action_characteristics_list if action.get('type') == 'explore')
+    target_actions = total_actions - explore_actions
+
+    row = {
+        'Episode': episode + 1,
+        'Average Lifespan': average_lifespan,
+        'True Location Selections': true_positives,
+        'False Location Selections': false_positives,
+        'Explore Actions': explore_actions,
+        'Target Actions': target_actions
+    }
+    return row, action_characteristics_list
+
+
+def evaluate_episode(args):
+    # Pool task: one episode
+    return run_episode(*args)
+
+
+def main(render=False, workers=EVALUATION_WORKERS):
+    display = open_display() if render else None
 
     num_episodes = 500  # Define the number of evaluation episodes
     episode_length = 30000  # Define the length of each episode in time steps
 
     episode_lifespans = []  # For tracking average lifespans
 
-    action_characteristics_list = []
     all_action_characteristics = []  # To store all action characteristics across episodes
 
     # Set the CSV filename based on the model being evaluated
     csv_filename = 'F_baseline_evaluation_2.csv'  # You can change 'Baseline' to reflect your model's name
 
-    # Open the CSV file and write the headers
+    # Rendering runs in this process; otherwise episodes are shared out over a process pool. Either
+    # way results come back in episode order.
+    workers = workers or os.cpu_count()
+    tasks = [(episode, num_episodes, episode_length) for episode in range(num_episodes)]
+    pool = None
+    if render or workers == 1:
+        results = (run_episode(*task, display=display) for task in tasks)
+    else:
+        pool = multiprocessing.Pool(workers)
+        results = pool.imap(evaluate_episode, tasks)
+
+    # Write the headers, then each episode's row as soon as it and all earlier episodes are done
     with open(csv_filename, mode='w', newline='') as csv_file:
-        fieldnames = ['Episode', 'Average Lifespan', 'True Location Selections', 'False Location Selections', 'Explore Actions', 'Target Actions']
-        writer = csv.DictWriter(csv_file, fieldnames=fieldnames)
+        writer = csv.DictWriter(csv_file, fieldnames=FIELDNAMES)
         writer.writeheader()
-
-    for episode in range(num_episodes):
-        print(f"Starting Evaluation Episode {episode + 1}/{num_episodes}")
-
-        # Start timing the episode
-        episode_start_time = time.time()
-
-        # Initialize the environment for each episode
-        sugarscape = SugarScape()
-        sim_time = 0  # Initialize simulation time
-
-        running = True
-        while running and sim_time < episode_length:
-            if render:
-                for event in pygame.event.get():
-                    if event.type == pygame.QUIT:
-                        running = False
-                        pygame.quit()
-                        sys.exit()
-
-            sim_time += 1
-
-            sugarscape.update(sim_time)
-
-            if render:
-                game_surface = pygame.Surface((GAME_WIDTH, HEIGHT))
-                sugarscape.draw(game_surface)
-                screen.blit(game_surface, (0, 0))
-
-                analytics_surface = pygame.Surface((ANALYTICS_WIDTH, HEIGHT))
-                analytics_surface.fill(WHITE)
-                pygame.draw.line(analytics_surface, GRAY, (0, 0), (0, HEIGHT), 3)
-
-                analytics_data = sugarscape.get_analytics_data()
-                y_offset = 20
-                for key, value in analytics_data.items():
-                    text = font.render(f"{key}: {value}", True, BLACK)
-                    analytics_surface.blit(text, (10, y_offset))
-                    y_offset += 30
-
-                screen.blit(analytics_surface, (GAME_WIDTH, 0))
-
-                pygame.display.flip()
-                clock.tick(150)  # Limit the frame rate to 60 FPS
-
-            # Early termination condition: End the episode if fewer than 'min_ants_alive' remain
-            if len(sugarscape.ants) == 0:
-                print("All ants died. Ending episode early.")
-                break
-
-        # Collect action characteristics from all ants
-        for ant in sugarscape.all_ants:
-            action_characteristics_list.extend(ant.selected_action_characteristics)
-            ant.selected_action_characteristics = []  # Reset for next episode
-
-        # Append to all_action_characteristics
-        all_action_characteristics.extend(action_characteristics_list)
-
-        # End of episode timing
-        episode_end_time = time.time()
-        episode_duration = episode_end_time - episode_start_time
-
-        # Collect and print other metrics
-        analytics_data = sugarscape.get_analytics_data()
-        average_lifespan = analytics_data.get('Average Lifespan', 0)
-        true_positives = analytics_data.get('True Positives', 0)
-        false_positives = analytics_data.get('False Positives', 0)
-        print(f"Episode Time: {sim_time}")
-        print(f"Average Lifespan: {average_lifespan:.2f}")
-
-        episode_lifespans.append(average_lifespan)
-
-        # Count explore and target actions
-        total_actions = len(action_characteristics_list)
-        explore_actions = sum(1 for action in action_characteristics_list if action.get('type') == 'explore')
-        target_actions = total_actions - explore_actions
-
-        # Append the data to the CSV file
-        with open(csv_filename, mode='a', newline='') as csv_file:
-            writer = csv.DictWriter(csv_file, fieldnames=fieldnames)
-            writer.writerow({
-                'Episode': episode + 1,
-                'Average Lifespan': average_lifespan,
-                'True Location Selections': true_positives,
-                'False Location Selections': false_positives,
-                'Explore Actions': explore_actions,
-                'Target Actions': target_actions
-            })
-
-        # Reset action_characteristics_list for the next episode
-        action_characteristics_list = []
+        for row, action_characteristics_list in results:
+            writer.writerow(row)
+            csv_file.flush()
+            episode_lifespans.append(row['Average Lifespan'])
+            all_action_characteristics.extend(action_characteristics_list)
+
+    if pool is not None:
+        pool.close()
+        pool.join()
 
     # Compute and print the overall average lifespan
     total_average_lifespan = sum(episode_lifespans) / len(episode_lifespans)
@@ -0,0 +1,187 @@
+import math
+import numpy as np
+from constants import *
+
+try:
+    import numba
+except ImportError:
+    numba = None
+
+# Compiled loops for the array work of a tick. They are used when numba is importable and NUMBA_KERNELS
+# is on; otherwise their callers run NumPy code that gives the same results bit for bit, so numba only
+# changes the speed. Constants are passed in rather than read as globals, which numba would freeze into
+# its on-disk cache.
+ENABLED = NUMBA_KERNELS and numba is not None
+
+
+def kernel(function):
+    return numba.njit(cache=True, nogil=True)(function) if ENABLED else function
+
+
+@kernel
+def exact_product(a, b):
+    # a * b as an unevaluated sum of two doubles (Dekker)
+    a_high = a * 134217729.0
+    a_high -= a_high - a
+    b_high = b * 134217729.0
+    b_high -= b_high - b
+    product = a * b
+    return product, ((a_high * b_high - product) + a_high * (b - b_high) + (a - a_high) * b_high) + (a - a_high) * (b - b_high)
+
+
+@kernel
+def hypot(a, b):
+    # math.hypot(a, b) as CPython computes it: the squares are summed in extended precision and the root
+    # gets one correction step. numba's math.hypot is the C library's, which rounds differently
+    a = abs(a)
+    b = abs(b)
+    largest = max(a, b)
+    if a == 0.0 or b == 0.0 or math.isinf(largest) or math.isnan(largest):
+        return math.hypot(a, b)
+    scale = math.ldexp(1.0, -math.frexp(largest)[1])
+    total = 1.0
+    low = 0.0
+    rounding = 0.0
+    for value in (a * scale, b * scale):
+        square, square_low = exact_product(value, value)
+        new_total = total + square
+        rounding += (total - new_total) + square
+        total = new_total
+        low += square_low
+    root = math.sqrt(total - 1.0 + (low + rounding))
+    # Correct the root by what is left of the sum after taking its square away
+    square, square_low = exact_product(-root, root)
+    new_total = total + square
+    rounding += (total - new_total) + square
+    total = new_total
+    low += square_low
+    root += (total - 1.0 + (low + rounding)) / (2.0 * root)
+    return root / scale
+
+
+@kernel
+def advance(x, y, direction, health, lifespan, is_false_broadcaster, indices, speed, width, height, decrease, false_broadcaster_decrease):
+    # AntPopulation.advance for the ants at `indices`
+    for index in indices:
+        x[index] = min(max(x[index] + speed * math.cos(direction[index]), 0.0), width)
+        y[index] = min(max(y[index] + speed * math.sin(direction[index]), 0.0), height)
+        health[index] -= false_broadcaster_decrease if is_false_broadcaster[index] else decrease
+        lifespan[index] += 1
+
+
+@kernel
+def within(candidates, indices, xs, ys, x, y, radius):
+    # candidates[k] for which the point (xs[indices[k]], ys[indices[k]]) is within `radius` of (x, y)
+    kept = np.empty(len(candidates), dtype=candidates.dtype)
+    count = 0
+    for k in range(len(candidates)):
+        if math.hypot(xs[indices[k]] - x, ys[indices[k]] - y) <= radius:
+            kept[count] = candidates[k]
+            count += 1
+    return kept[:count]
+
+
+@kernel
+def cell_buckets(xs, ys, radius, grid_columns, grid_rows):
+    # The cell of each point on a grid of grid_columns x grid_rows cells of side `radius`, and the points
+    # bucketed by cell with each cell in increasing order: (cells, cell_starts, order)
+    count = len(xs)
+    cells = np.empty(count, dtype=np.intp)
+    for i in range(count):
+        column = min(max(int(xs[i] // radius), 0), grid_columns - 1)
+        row = min(max(int(ys[i] // radius), 0), grid_rows - 1)
+        cells[i] = row * grid_columns + column
+
+    cell_starts = np.zeros(grid_columns * grid_rows + 1, dtype=np.intp)
+    for i in range(count):
+        cell_starts[cells[i] + 1] += 1
+    for cell in range(grid_columns * grid_rows):
+        cell_starts[cell + 1] += cell_starts[cell]
+    order = np.empty(count, dtype=np.intp)
+    filled = cell_starts[:-1].copy()
+    for i in range(count):
+        order[filled[cells[i]]] = i
+        filled[cells[i]] += 1
+    return cells, cell_starts, order
+
+
+@kernel
+def neighbour_rows(xs, ys, radius, grid_columns, grid_rows, cells, cell_starts, order, first, last):
+    # Rows first to last - 1 of neighbour_lists, from the buckets cell_buckets made: their starts
+    # counted from 0 and their columns
+    starts = np.zeros(last - first + 1, dtype=np.intp)
+    columns = np.empty(max(16, 8 * (last - first)), dtype=np.intp)
+    total = 0
+    for i in range(first, last):
+        row = cells[i] // grid_columns
+        column = cells[i] % grid_columns
+        start = total
+        for cell_row in range(max(row - 1, 0), min(row + 2, grid_rows)):
+            for cell_column in range(max(column - 1, 0), min(column + 2, grid_columns)):
+                cell = cell_row * grid_columns + cell_column
+                for k in range(cell_starts[cell], cell_starts[cell + 1]):
+                    j = order[k]
+                    if math.hypot(xs[i] - xs[j], ys[i] - ys[j]) <= radius:
+                        if total == len(columns):
+                            grown = np.empty(2 * len(columns), dtype=np.intp)
+                            grown[:total] = columns[:total]
+                            columns = grown
+                        columns[total] = j
+                        total += 1
+        columns[start:total].sort()
+        starts[i - first + 1] = total
+    return starts, columns[:total].copy()
+
+
+@kernel
+def neighbour_lists(xs, ys, radius, grid_columns, grid_rows):
+    # spatial_grid.neighbour_lists over a grid of grid_columns x grid_rows cells of side `radius`
+    cells, cell_starts, order = cell_buckets(xs, ys, radius, grid_columns, grid_rows)
+    return neighbour_rows(xs, ys, radius, grid_columns, grid_rows, cells, cell_starts, order, 0, len(xs))
+
+
+@kernel
+def nearby_patches(xs, ys, patch_xs, patch_ys, reach):
+    # np.nonzero of the (point, patch) pairs closer than `reach`, as in SugarPatches.find_nearby
+    rows = np.empty(len(xs) * len(patch_xs), dtype=np.intp)
+    columns = np.empty(len(xs) * len(patch_xs), dtype=np.intp)
+    count = 0
+    for i in range(len(xs)):
+        for j in range(len(patch_xs)):
+            dx = patch_xs[j] - xs[i]
+            dy = patch_ys[j] - ys[i]
+            if dx * dx + dy * dy < reach * reach:
+                rows[count] = i
+                columns[count] = j
+                count += 1
+    return rows[:count], columns[:count]
+
+
+@kernel
+def target_score(confirmed, accepted, rejected, distance):
+    # BaselineAnt's rule for how much a location it has been told about is worth going to, from its
+    # counts there and its distance. Every way of scoring targets goes through it; without the
+    # kernels it also scores whole arrays at once
+    return (confirmed + 0.5 * accepted) / (rejected + 1) / (distance ** 2 + 1)
+
+
+@kernel
+def score_targets(location_ids, excluded, coordinates, counts, x, y, max_distance, confirmed, accepted, rejected):
+    # BaselineAnt.score_targets_batched: the location_ids not excluded and within max_distance, their
+    # distances and the running total of their scores
+    kept = np.empty(len(location_ids), dtype=location_ids.dtype)
+    distances = np.empty(len(location_ids))
+    cumulative_weights = np.empty(len(location_ids))
+    count = 0
+    total = 0.0
+    for location_id in location_ids:
+        if excluded[location_id]:
+            continue
+        distance = hypot(coordinates[location_id, 0] - x, coordinates[location_id, 1] - y)
+        if distance <= max_distance:
+            total += target_score(counts[location_id, confirmed], counts[location_id, accepted], counts[location_id, rejected], distance)
+            kept[count] = location_id
+            distances[count] = distance
+            cumulative_weights[count] = total
+            count += 1
+    return kept[:count], distances[:count], cumulative_weights[:count]
@@ -1,8 +1,6 @@
 import pygame
-import sys
 import time  # Add this import for timing
-from constants import *
-from sugarscape import SugarScape
+from environment import SugarScapeEnv, open_display, handle_events
 import matplotlib.pyplot as plt  # Import for plotting
 from rl_agent import AntRLAgent  # Add this import
 import os  # Import for directory handling
@@ -14,12 +12,7 @@ def moving_average(data, window_size):
 
 
 def main(render=False):
-    if render:
-        pygame.init()
-        screen = pygame.display.set_mode((WIDTH, HEIGHT))
-        pygame.display.set_caption("SugarScape Simulation with Analytics")
-        clock = pygame.time.Clock()
-        font = pygame.font.Font(None, 24)
+    display = open_display() if render else None
 
     # Initialize the RL agent once
     state_size = 4  # Ant's own state features
@@ -45,6 +38,8 @@ def main(render=False):
 
     action_characteristics_list = []
 
+    env = SugarScapeEnv(shared_agent, episode_length=episode_length, min_ants=3)
+
     for episode in range(num_episodes):
 
         print(f"Starting Episode {episode + 1}/{num_episodes}")
@@ -53,50 +48,24 @@ def main(render=False):
         episode_start_time = time.time()  # Start time of the episode
 
         # Initialize the environment for each episode
-        sugarscape = SugarScape(shared_agent)
-        sim_time = 0  # Initialize simulation time
+        sugarscape = env.reset()
 
         # Track the total reward for all ants
         total_rewards = []
 
-        running = True
-        while running and sim_time < episode_length:
+        terminated = truncated = False
+        while not (terminated or truncated):
             if render:  # Only check Pygame events when rendering is enabled
-                for event in pygame.event.get():
-                    if event.type == pygame.QUIT:
-                        running = False
-                        pygame.quit()
-                        sys.exit()
+                handle_events()
 
-            sim_time += 1
+            terminated, truncated = env.step()
 
-            sugarscape.update(sim_time)
-            
             if render:
-                game_surface = pygame.Surface((GAME_WIDTH, HEIGHT))
-                sugarscape.draw(game_surface)
-                screen.blit(game_surface, (0, 0))
-
-                analytics_surface = pygame.Surface((ANALYTICS_WIDTH, HEIGHT))
-                analytics_surface.fill(WHITE)
-                pygame.draw.line(analytics_surface, GRAY, (0, 0), (0, HEIGHT), 3)
-
-                analytics_data = sugarscape.get_analytics_data()
-                y_offset = 20
-                for key, value in analytics_data.items():
-                    text = font.render(f"{key}: {value}", True, BLACK)
-                    analytics_surface.blit(text, (10, y_offset))
-                    y_offset += 30
-
-                screen.blit(analytics_surface, (GAME_WIDTH, 0))
-
-                pygame.display.flip()
-                clock.tick(1000)
+                env.render(display, 1000)
 
-            # Early termination condition: End the episode if fewer than 'min_ants_alive' remain
-            if len(sugarscape.ants) < 3:
-                print("Fewer than 3 ants remaining. Ending episode early.")
-                break
+        # Early termination condition: End the episode if fewer than 'min_ants_alive' remain
+        if terminated:
+            print("Fewer than 3 ants remaining. Ending episode early.")
 
 
         # Collect rewards for all ants after the episode ends
@@ -140,7 +109,7 @@ def main(render=False):
         # You can collect metrics, adjust parameters, etc.
         analytics_data = sugarscape.get_analytics_data()
         average_lifespan = analytics_data.get('Average Lifespan', 0)
-        print(f"Episode Time: {sim_time}")
+        print(f"Episode Time: {env.sim_time}")
         print(f"Average Lifespan: {average_lifespan:.2f}")
         print(f"True Positives: {true_location_count}")
 
@@ -0,0 +1,45 @@
+from constants import *
+from knowledge import CHARACTERISTIC_CODES
+
+
+class MessageQueue:
+    # Broadcasts of one tick, delivered together when the tick ends. During a tick ants only read what
+    # earlier ticks delivered, so its outcome does not depend on the order the ants take their turns in.
+    # A sender repeating a location within the tick replaces its earlier message, and the messages are
+    # delivered sorted by (sender, location id) rather than in the order they were made.
+    # Ants are identified by their KnowledgeBase rows and locations by their LocationRegistry ids.
+    def __init__(self):
+        self.messages = {}  # Key: (sender, location_id), Value: (ant, location, characteristic)
+
+    def add(self, ant, location_id, location, characteristic):
+        self.messages[(ant.index, location_id)] = (ant, location, characteristic)
+
+    def discard(self, sender, location_id):
+        # Drop a pending message, e.g. when its sender retracts the location
+        self.messages.pop((sender, location_id), None)
+
+    def clear(self):
+        self.messages.clear()
+
+    def deliver(self, sugarscape, sim_time):
+        # Hand every pending message to the receivers its sender reaches now, as deliver_broadcast
+        # would one message at a time. With the bulletin board that is one post per message; otherwise
+        # the receivers each message changes are collected and their entries updated in one go
+        messages = sorted(self.messages.items(), key=lambda item: item[0])
+        self.messages.clear()
+        board = sugarscape.bulletin_board
+        if board is not None:
+            for (sender, location_id), (ant, location, characteristic) in messages:
+                board.post(sender, location_id, CHARACTERISTIC_CODES[characteristic], sim_time)
+                ant.last_broadcasts[location] = (characteristic, sim_time, True)
+            return
+
+        knowledge = sugarscape.knowledge
+        told = []
+        for (sender, location_id), (ant, location, characteristic) in messages:
+            code = CHARACTERISTIC_CODES[characteristic]
+            changed = knowledge.mark_sent(sender, sugarscape.indices_near(ant, COMMUNICATION_RADIUS), location_id, code)
+            if changed is not None:
+                told.append((changed[0], location_id, changed[1], code))
+            ant.last_broadcasts[location] = (characteristic, sim_time, sugarscape.told_all_in_reach(sender, location_id, code))
+        knowledge.receive_all(told, sim_time)
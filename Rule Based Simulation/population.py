@@ -0,0 +1,125 @@
+import heapq
+import numpy as np
+from constants import *
+import kernels
+
+
+def population_field(name):
+    # Property exposing one ant's slot of the AntPopulation array `name`, so ant.x,
+    # ant.health etc. keep working as views while the data lives in shared arrays
+    def fget(ant):
+        return ant.population.views[name][ant.index]
+
+    def fset(ant, value):
+        ant.population.arrays[name][ant.index] = value
+
+    return property(fget, fset)
+
+
+class AntPopulation:
+    # Struct-of-arrays storage for the per-ant state that changes every tick.
+    # Each ant owns one index; arrays are never compacted so indices stay valid for the episode.
+    def __init__(self, capacity=NUM_ANTS):
+        self.size = 0
+        self.capacity = 0
+        self.arrays = {
+            'x': np.zeros(0),
+            'y': np.zeros(0),
+            'direction': np.zeros(0),
+            'health': np.zeros(0),
+            'lifespan': np.zeros(0, dtype=np.int64),
+            'target': np.empty(0, dtype=object),  # (x, y) tuple or None, kept as the exact object assigned
+
+            # Action flags
+            'is_false_broadcaster': np.zeros(0, dtype=bool),
+            'action_in_progress': np.zeros(0, dtype=bool),
+            'arrived_at_target': np.zeros(0, dtype=bool),
+            'has_reached_target': np.zeros(0, dtype=bool),
+            'is_exploring_target': np.zeros(0, dtype=bool),
+        }
+        self.grow(capacity)
+
+    def __getattr__(self, name):
+        # population.x etc. give the underlying arrays
+        try:
+            return self.__dict__['arrays'][name]
+        except KeyError:
+            raise AttributeError(name) from None
+
+    def grow(self, capacity):
+        if capacity <= self.capacity:
+            return
+        for name, array in self.arrays.items():
+            if array.dtype == object:
+                grown = np.empty(capacity, dtype=object)
+            else:
+                grown = np.zeros(capacity, dtype=array.dtype)
+            grown[:self.size] = array[:self.size]
+            self.arrays[name] = grown
+        # Scalar reads go through memoryviews, which return plain Python values and are much
+        # cheaper to index than the arrays themselves
+        self.views = {name: (array if array.dtype == object else memoryview(array)) for name, array in self.arrays.items()}
+        self.capacity = capacity
+
+    def add(self):
+        # Reserve the next slot and return its index
+        if self.size == self.capacity:
+            self.grow(max(1, 2 * self.capacity))
+        index = self.size
+        self.size += 1
+        return index
+
+    def advance(self, indices):
+        # Batched equivalent of the end of Ant.move: step every given ant along its heading,
+        # clamp to the game area, decay health and age it by one tick
+        if kernels.ENABLED:
+            kernels.advance(self.x, self.y, self.direction, self.health, self.lifespan, self.is_false_broadcaster, indices,
+                            float(ANT_SPEED), float(GAME_WIDTH), float(HEIGHT), HEALTH_DECREASE_RATE, FALSE_BROADCASTER_HEALTH_DECREASE_RATE)
+            return
+        if len(indices) == self.size:
+            indices = slice(0, self.size)  # Nobody has died yet: work on views instead of gathered copies
+        direction = self.direction[indices]
+        x = self.x[indices] + ANT_SPEED * np.cos(direction)
+        y = self.y[indices] + ANT_SPEED * np.sin(direction)
+        self.x[indices] = np.clip(x, 0, GAME_WIDTH)
+        self.y[indices] = np.clip(y, 0, HEIGHT)
+
+        decrease = np.where(self.is_false_broadcaster[indices], FALSE_BROADCASTER_HEALTH_DECREASE_RATE, HEALTH_DECREASE_RATE)
+        self.health[indices] -= decrease
+        self.lifespan[indices] += 1
+
+
+class DeathQueue:
+    # When each ant of a population could die at the earliest, kept in a heap so SugarScape only checks
+    # the health of the ants that could have run out this tick rather than every ant every tick.
+    # Health falls by a fixed rate per tick and only ever goes up otherwise (eating), so
+    # health // rate ticks from now is a lower bound on an ant's death; an ant still alive at its
+    # check is simply pushed back with a new bound, which makes eating need no bookkeeping here.
+    def __init__(self, population):
+        self.population = population
+        self.checks = []  # Heap of (tick, population index)
+
+    def reset(self, indices):
+        # Start tracking the ants at `indices`, none of which has aged yet
+        self.checks = [(self.next_check(index, 0), index) for index in indices]
+        heapq.heapify(self.checks)
+
+    def next_check(self, index, sim_time):
+        # The ant's health has been checked at sim_time; the first tick at which it could be found
+        # dead, with a tick to spare for rounding in the repeated decay
+        views = self.population.views
+        rate = FALSE_BROADCASTER_HEALTH_DECREASE_RATE if views['is_false_broadcaster'][index] else HEALTH_DECREASE_RATE
+        return sim_time + max(1, int(views['health'][index] // rate) - 1)
+
+    def due(self, sim_time):
+        # Population indices of the tracked ants found dead at sim_time, in the order they fall due.
+        # They are no longer tracked afterwards.
+        dead = []
+        health = self.population.views['health']
+        while self.checks and self.checks[0][0] <= sim_time:
+            _, index = heapq.heappop(self.checks)
+            if health[index] > 0:
+                heapq.heappush(self.checks, (self.next_check(index, sim_time), index))
+            else:
+                dead.append(index)
+        return dead
@@ -1,13 +1,21 @@
-import random
 import pygame
 import math
 from constants import *
 # from ant import Ant
 import numpy as np
 from BaselineAnt import BaselineAnt
+from population import AntPopulation, DeathQueue
+from spatial_grid import SpatialGrid, neighbour_lists, shared_workers
+from bulletin_board import BulletinBoard
+from knowledge import KnowledgeBase, LocationRegistry
+from sugar_patches import SugarPatches
+from rng_streams import RandomStreams
+from event_scheduler import EventScheduler
+from message_queue import MessageQueue
+import kernels
 
 class SugarScape:
-    def __init__(self, shared_agent=None):
+    def __init__(self, shared_agent=None, vectorized=VECTORIZED_ENGINE, bulletin_board=BULLETIN_BOARD, seed=None, event_scheduler=EVENT_SCHEDULER, message_queue=MESSAGE_QUEUE, double_buffered=DOUBLE_BUFFERED):
         padding = 120  # Padding from the edges
         patch_size = int(math.sqrt(SUGAR_MAX)) * SQUARE_SIZE  # Size of the entire sugar patch
 
@@ -17,13 +25,61 @@ class SugarScape:
             (GAME_WIDTH - padding - patch_size // 2, HEIGHT - padding - patch_size // 2)  # Bottom right
         ]
 
+        self.vectorized = vectorized or double_buffered  # Batch movement/health updates across the population
+        # Ants take their turns against a snapshot of the start of the tick and their effects on each
+        # other are applied once all of them have had their turn (see commit)
+        self.double_buffered = double_buffered
+        self.use_bulletin_board = bulletin_board
+        self.population = AntPopulation(NUM_ANTS)
+        self.locations = LocationRegistry()  # Integer ids for every location ants talk about
+        self.knowledge = KnowledgeBase(self.locations, NUM_ANTS, track_time_received=False)  # What each ant has been told
+        self.sugar_patches = SugarPatches()
+        self.ant_grid = SpatialGrid()  # Positions of self.ants as of the start of the tick
+        self.neighbour_lists = {}  # Key: radius, Value: this tick's neighbour structure (see neighbours)
+        self.ant_positions = np.full(self.population.capacity, -1, dtype=np.intp)  # Population index -> position in self.ants
+        # Only needed when not every ant hears every other (see track_reach)
+        self.reach_changed = np.zeros(self.population.capacity, dtype=np.int64) if COMMUNICATION_RADIUS < WORLD_DIAGONAL else None
+        self.deaths = DeathQueue(self.population)  # When each living ant could run out of health
+        self.scheduler = EventScheduler(self.population.capacity) if event_scheduler else None  # Skips the uneventful ticks of ants
+        self.message_queue = MessageQueue() if message_queue or double_buffered else None  # Broadcasts waiting for the end of the tick
+        self.snapshot = None  # With double_buffered, (x, y) by population index as of the start of the tick
+        # With double_buffered, the threads neighbour structures are built on (see INTENT_THREADS)
+        self.workers = shared_workers() if double_buffered and kernels.ENABLED and INTENT_THREADS > 1 else None
+        self.held_false_locations = []  # With double_buffered, false locations broadcast this tick
+        self.all_ants = []  # Created by the first reset, then reused by every later one
+        self.reset(seed)
+
+    def reset(self, seed=None):
+        # Start a new episode. The ants, their population slots and the knowledge and patch arrays of
+        # the previous episode are reinitialised in place rather than allocated again.
+        self.rng = RandomStreams(seed)  # Named random streams of this episode (see rng_streams.py)
+        self.locations.clear()
+        self.knowledge.clear()
+        self.reach_pairs = np.zeros(0, dtype=np.int64)  # Pairs of ants within reach last tick (see track_reach)
+        if self.scheduler is not None:
+            self.scheduler.clear()
+        if self.message_queue is not None:
+            self.message_queue.clear()
+        self.snapshot = None
+        self.held_false_locations.clear()
+
         # Initialize ants
         # self.ants = [Ant(random.randint(0, GAME_WIDTH), random.randint(0, HEIGHT), shared_agent, ant_id=i) for i in range(NUM_ANTS)]
-        self.ants = [BaselineAnt(random.randint(0, GAME_WIDTH), random.randint(0, HEIGHT), ant_id=i) for i in range(NUM_ANTS)]
-
-        self.all_ants = self.ants.copy()  # Keep a copy of all ants
-
-        self.sugar_patches = self.initialize_sugar_patches()
+        if not self.all_ants:
+            self.all_ants = [BaselineAnt(self.rng.spawn.randint(0, GAME_WIDTH), self.rng.spawn.randint(0, HEIGHT), ant_id=i, population=self.population, knowledge=self.knowledge, rng=self.rng) for i in range(NUM_ANTS)]
+        else:
+            for ant in self.all_ants:
+                ant.reset(self.rng.spawn.randint(0, GAME_WIDTH), self.rng.spawn.randint(0, HEIGHT), rng=self.rng)
+
+        self.ants = self.all_ants.copy()  # Ants still alive; all_ants keeps every ant
+        self.ant_indices = np.array([ant.index for ant in self.ants], dtype=np.intp)  # Population slots of self.ants
+        self.ants_changed()
+        self.rebuild_ant_grid()
+        # When every ant is within communication range of every other, broadcasts go through a
+        # shared log instead of being copied into each receiver (see bulletin_board.py)
+        self.bulletin_board = BulletinBoard(self.knowledge, self.ant_indices.tolist()) if self.use_bulletin_board and COMMUNICATION_RADIUS >= WORLD_DIAGONAL else None
+
+        self.initialize_sugar_patches()
         self.consumed_sugar_count = 0
         self.dead_ants_count = 0
         self.next_sugar_time = NEW_SUGAR_INTERVAL
@@ -31,10 +87,11 @@ class SugarScape:
         self.total_lifespan_of_dead_ants = 0
 
         # Choose two false broadcaster ants
-        self.false_broadcasters = random.sample(self.ants, 2)  # NB: Change back to 3 if using 25 ants
+        self.false_broadcasters = self.rng.spawn.sample(self.ants, 2)  # NB: Change back to 3 if using 25 ants
          # Set the is_false_broadcaster flag to True for selected ants
         for ant in self.false_broadcasters:
             ant.is_false_broadcaster = True
+        self.deaths.reset(self.ant_indices.tolist())
 
         # Initialize broadcast times for each false broadcaster
         self.broadcast_times = {ant: 600 for ant in self.false_broadcasters}
@@ -60,7 +117,7 @@ class SugarScape:
 
 
     def initialize_sugar_patches(self):
-        patches = []
+        self.sugar_patches.clear()
         for (x, y) in self.sugar_spots:
             patch = {
                 'x': x,
@@ -68,23 +125,48 @@ class SugarScape:
                 'count': 70,  # Starting sugar count
                 'radius': SUGAR_PATCH_RADIUS
             }
-            patches.append(patch)
-        return patches
+            self.sugar_patches.append(patch)
 
 
     def update(self, sim_time):
         current_time = sim_time
-        alive_ants = []
-
-        for ant in self.ants:
-            if ant.is_alive():
-                ant.move(self.sugar_patches, self, sim_time)
-                alive_ants.append(ant)
+        self.neighbour_lists.clear()  # Ants have moved since the last tick
+        if self.double_buffered:
+            # Intent phase: what an ant reads of the others (positions, sugar left, false locations)
+            # stays as it is here until commit()
+            self.snapshot = (self.population.x.copy(), self.population.y.copy())
+            self.sugar_patches.hold()
+
+        # Only the ants whose death could be due are checked; self.ants is only rebuilt when some died
+        dead = self.deaths.due(sim_time)
+        alive = np.isin(self.ant_indices, dead, invert=True) if dead else np.ones(len(self.ant_indices), dtype=bool)
+
+        self.track_reach(sim_time)
+
+        # Ants the event scheduler has put to sleep skip their turn
+        awake = alive if self.scheduler is None else self.scheduler.start_tick(self, alive, sim_time)
+        turns = zip(self.ants, alive)
+        if self.scheduler is not None:
+            positions = np.flatnonzero(awake | ~alive).tolist()
+            turns = zip([self.ants[position] for position in positions], alive[positions])
+
+        # Sugar detection candidates for every ant at once; positions only change after an ant's detect_sugar
+        self.sugar_patches.find_nearby(self.ant_indices, self.population.x[self.ant_indices], self.population.y[self.ant_indices])
+
+        for ant, is_alive in turns:
+            if is_alive:
+                if self.vectorized:
+                    ant.think(self.sugar_patches, self, sim_time)
+                else:
+                    ant.move(self.sugar_patches, self, sim_time)
 
                 # Track false broadcast locations historically
                 if ant in self.false_broadcasters and ant.false_broadcast_location:
-                    self.false_broadcasters_locations.add(ant.false_broadcast_location)
-                    self.historical_false_locations.add(ant.false_broadcast_location)  # Track all false locations
+                    if self.double_buffered:
+                        self.held_false_locations.append(ant.false_broadcast_location)  # Other ants see it next tick
+                    else:
+                        self.false_broadcasters_locations.add(ant.false_broadcast_location)
+                        self.historical_false_locations.add(ant.false_broadcast_location)  # Track all false locations
                 
                 # self.lifespan_of_alive_ants.append(ant.lifespan)
 
@@ -93,7 +175,31 @@ class SugarScape:
                 self.total_lifespan_of_dead_ants += ant.lifespan
                 self.lifespan_of_dead_ants.append(ant.lifespan)  # Add to dead lifespans
 
-        self.ants = alive_ants
+        if self.scheduler is not None and not self.vectorized:
+            self.population.advance(self.ant_indices[alive & ~awake])  # The sleeping ants walk on along their heading
+
+        if self.bulletin_board is not None:
+            # Ants that died this tick still heard this tick's broadcasts; they stop listening now
+            for index in dead:
+                self.bulletin_board.unsubscribe(index)
+            self.bulletin_board.trim()
+
+        if dead:
+            self.ants = [ant for ant, is_alive in zip(self.ants, alive) if is_alive]
+            self.ant_indices = self.ant_indices[alive]
+            self.ants_changed()
+
+        if self.vectorized:
+            # Move, decay and age every surviving ant in one batch
+            self.population.advance(self.ant_indices)
+
+        if self.double_buffered:
+            self.commit()
+        if self.message_queue is not None:
+            self.message_queue.deliver(self, sim_time)  # From where the ants ended the tick
+        self.rebuild_ant_grid()
+        if self.scheduler is not None:
+            self.scheduler.end_tick(self, sim_time)
 
         if current_time >= self.next_sugar_time:
             self.add_new_sugar_patch()
@@ -101,6 +207,115 @@ class SugarScape:
 
 
 
+    def commit(self):
+        # Commit phase of a double_buffered tick, once the survivors have moved: feed the ants that got
+        # the sugar they took and record the false locations they broadcast. The broadcasts are delivered next.
+        self.snapshot = None
+        for ant in self.sugar_patches.release():
+            ant.eat_sugar()
+            ant.just_ate_sugar = True
+        self.false_broadcasters_locations.update(self.held_false_locations)
+        self.historical_false_locations.update(self.held_false_locations)
+        self.held_false_locations.clear()
+
+    def rebuild_ant_grid(self):
+        self.ant_grid.rebuild(self.population.x[self.ant_indices], self.population.y[self.ant_indices])
+
+    def positions_within(self, x, y, radius):
+        # Positions in self.ants of the ants within `radius` of (x, y). Candidates come from the spatial
+        # grid, which is rebuilt once per tick; an ant moves at most 2 * ANT_SPEED per tick, hence the margin.
+        if len(self.ant_indices) < GRID_MIN_ANTS:
+            candidates = np.arange(len(self.ant_indices))  # Too few ants for the grid to pay off
+        else:
+            candidates = self.ant_grid.query(x, y, radius + 2 * ANT_SPEED)
+        indices = self.ant_indices[candidates]
+        distances = np.hypot(self.population.x[indices] - x, self.population.y[indices] - y)
+        return candidates[distances <= radius]
+
+    def neighbours(self, radius):
+        # The tick's neighbour structure for `radius`, shared by every range query of the tick:
+        # (starts, columns) as neighbour_lists returns them over the positions in self.ants, holding
+        # the ants within radius + 4 * ANT_SPEED of each other when it was built. Every ant moves at
+        # most 2 * ANT_SPEED in a tick (an arrival, and its step in the one-at-a-time engine), so it
+        # keeps covering everyone within `radius` for the rest of the tick. Built on first use after
+        # start_tick or a death.
+        lists = self.neighbour_lists.get(radius)
+        if lists is None:
+            xs, ys = self.snapshot or (self.population.x, self.population.y)
+            lists = self.neighbour_lists[radius] = neighbour_lists(xs[self.ant_indices], ys[self.ant_indices], radius + 4 * ANT_SPEED, self.workers)
+        return lists
+
+    def positions_near(self, ant, radius):
+        # positions_within(ant.x, ant.y, radius) for one of self.ants, checking only its neighbours
+        position = self.ant_positions[ant.index]
+        if position < 0:
+            return self.positions_within(ant.x, ant.y, radius)  # Not one of self.ants
+        starts, columns = self.neighbours(radius)
+        candidates = columns[starts[position]:starts[position + 1]]
+        indices = self.ant_indices[candidates]
+        if self.snapshot is not None:
+            xs, ys = self.snapshot  # Where every ant, this one included, started the tick
+            x, y = xs[ant.index], ys[ant.index]
+        else:
+            xs, ys = self.population.x, self.population.y
+            x, y = ant.x, ant.y
+        if kernels.ENABLED:
+            return kernels.within(candidates, indices, xs, ys, x, y, float(radius))
+        distances = np.hypot(xs[indices] - x, ys[indices] - y)
+        return candidates[distances <= radius]
+
+    def ants_near(self, ant, radius):
+        # Ants in self.ants within `radius` of `ant`
+        if radius >= WORLD_DIAGONAL:
+            return list(self.ants)  # Every position in the game area is within range
+        return [self.ants[i] for i in self.positions_near(ant, radius).tolist()]
+
+    def indices_near(self, ant, radius):
+        # Population indices (knowledge rows) of the same ants as ants_near
+        if radius >= WORLD_DIAGONAL:
+            return self.ant_indices
+        return self.ant_indices[self.positions_near(ant, radius)]
+
+    def ants_changed(self):
+        # self.ants was rebuilt: map population indices to their new positions and drop the
+        # neighbour structure, which refers to the old ones
+        self.ant_positions[:] = -1
+        self.ant_positions[self.ant_indices] = np.arange(len(self.ant_indices))
+        self.neighbour_lists.clear()
+
+    def track_reach(self, sim_time):
+        # Enter-range detection for broadcasts when COMMUNICATION_RADIUS does not cover the world:
+        # an ant's reach is its neighbour structure for the communication radius, and reach_changed[i]
+        # the last tick some ant came into ant i's reach
+        if self.reach_changed is None:
+            return
+        starts, columns = self.neighbours(COMMUNICATION_RADIUS)
+        senders = np.repeat(self.ant_indices, np.diff(starts))
+        pairs = senders * self.population.capacity + self.ant_indices[columns]  # Sorted, as ant_indices is
+        if np.array_equal(pairs, self.reach_pairs):
+            return
+        known = np.zeros(len(pairs), dtype=bool)
+        if len(self.reach_pairs):
+            at = np.minimum(np.searchsorted(self.reach_pairs, pairs), len(self.reach_pairs) - 1)
+            known = self.reach_pairs[at] == pairs
+        self.reach_changed[senders[~known]] = sim_time
+        self.reach_pairs = pairs
+
+    def nobody_new_in_reach(self, sender, since):
+        # Whether no ant has come within reach of `sender` after tick `since`. When every ant is in
+        # range, receivers can only leave.
+        return self.reach_changed is None or self.reach_changed[sender] <= since
+
+    def told_all_in_reach(self, sender, location_id, code):
+        # Whether every ant within reach of `sender` this tick has been sent `code` for the location
+        if self.reach_changed is None:
+            return True
+        starts, columns = self.neighbours(COMMUNICATION_RADIUS)
+        position = self.ant_positions[sender]
+        sent = self.knowledge.sent[(sender, location_id)]
+        return bool((sent[self.ant_indices[columns[starts[position]:starts[position + 1]]]] == code).all())
+
+
     def add_new_sugar_patch(self):
         max_attempts = 100
         min_distance_sugar = 180  # Minimum distance from existing sugar patches
@@ -108,13 +323,11 @@ class SugarScape:
         padding = 20
 
         for attempt in range(max_attempts):
-            x = random.randint(padding + SUGAR_PATCH_RADIUS, GAME_WIDTH - padding - SUGAR_PATCH_RADIUS)
-            y = random.randint(padding + SUGAR_PATCH_RADIUS, HEIGHT - padding - SUGAR_PATCH_RADIUS)
+            x = self.rng.patches.randint(padding + SUGAR_PATCH_RADIUS, GAME_WIDTH - padding - SUGAR_PATCH_RADIUS)
+            y = self.rng.patches.randint(padding + SUGAR_PATCH_RADIUS, HEIGHT - padding - SUGAR_PATCH_RADIUS)
 
             # Check distance from existing sugar patches
-            too_close_sugar = any(
-                math.hypot(x - sugar['x'], y - sugar['y']) < min_distance_sugar for sugar in self.sugar_patches
-            )
+            too_close_sugar = self.sugar_patches.any_within(x, y, min_distance_sugar)
 
             # Check distance from historical false locations
             too_close_false = any(
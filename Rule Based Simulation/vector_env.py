@@ -0,0 +1,81 @@
+import multiprocessing
+import numpy as np
+
+
+def env_worker(remote, env_fn):
+    # Serve one env to a SubprocVectorEnv until a None arrives
+    env = env_fn()
+    for command, data in iter(remote.recv, None):
+        if command == 'reset':
+            env.reset(data)
+            remote.send(None)
+        elif command == 'step':
+            remote.send(env.step())
+        elif command == 'call':
+            function, args = data
+            remote.send(function(env, *args))
+    remote.close()
+
+
+class SubprocVectorEnv:
+    # Several SugarScapeEnvs (see environment.py), each in a process that lives as long as this object,
+    # so imports, agents and whatever else env_fn sets up are paid for once rather than every episode.
+    # env_fns are picklable callables returning the envs. step() plays one tick in every env that has
+    # not finished since its last reset, all in parallel; call() runs a function on every env in its
+    # process, e.g. to collect episode results.
+    def __init__(self, env_fns):
+        self.remotes = []
+        self.processes = []
+        for env_fn in env_fns:
+            remote, worker_remote = multiprocessing.Pipe()
+            process = multiprocessing.Process(target=env_worker, args=(worker_remote, env_fn), daemon=True)
+            process.start()
+            worker_remote.close()
+            self.remotes.append(remote)
+            self.processes.append(process)
+        self.num_envs = len(self.remotes)
+        self.terminated = np.zeros(self.num_envs, dtype=bool)
+        self.truncated = np.zeros(self.num_envs, dtype=bool)
+        self.stepping = []
+
+    def reset(self, seeds=None):
+        # Start a new episode in every env; seeds[i] seeds env i
+        if seeds is None:
+            seeds = [None] * self.num_envs
+        for remote, seed in zip(self.remotes, seeds):
+            remote.send(('reset', seed))
+        for remote in self.remotes:
+            remote.recv()
+        self.terminated[:] = False
+        self.truncated[:] = False
+
+    def step_async(self):
+        self.stepping = np.flatnonzero(~(self.terminated | self.truncated)).tolist()
+        for env in self.stepping:
+            self.remotes[env].send(('step', None))
+
+    def step_wait(self):
+        # (terminated, truncated) arrays over the envs; finished envs keep the flags they ended with
+        for env in self.stepping:
+            self.terminated[env], self.truncated[env] = self.remotes[env].recv()
+        self.stepping = []
+        return self.terminated.copy(), self.truncated.copy()
+
+    def step(self):
+        self.step_async()
+        return self.step_wait()
+
+    def done(self):
+        return bool((self.terminated | self.truncated).all())
+
+    def call(self, function, *args):
+        # [function(env, *args) for every env], each run in the env's process
+        for remote in self.remotes:
+            remote.send(('call', (function, args)))
+        return [remote.recv() for remote in self.remotes]
+
+    def close(self):
+        for remote in self.remotes:
+            remote.send(None)
+        for process in self.processes:
+            process.join()
@@ -0,0 +1,97 @@
+import json
+import os
+import sys
+
+# Runs seeded episodes of the simulation in the current directory and prints, as one JSON line, what
+# each of them ended with. Run from "RL Simulation" or "Rule Based Simulation":
+#   python episode.py SEED TICKS CONFIGS [CONSTANTS]
+# CONFIGS is a JSON list of SugarScape keyword arguments, plus settings of this script: "kernels":
+# false runs without the numba kernels, "reset_from": S plays an episode of seed S first and then
+# resets that world to SEED instead of making a new one, and "batched_with": [S, ...] plays SEED as the
+# first world of a BatchedSugarScape next to worlds of those seeds (the keyword arguments are then
+# BatchedSugarScape's) and, for the RL simulation, "sampling": true samples decisions from the torch
+# policy as training does instead of taking the NumPy policy's best action. CONSTANTS overrides
+# constants.py.
+sys.path.insert(0, os.getcwd())
+seed = int(sys.argv[1])
+ticks = int(sys.argv[2])
+configs = json.loads(sys.argv[3])
+overrides = json.loads(sys.argv[4]) if len(sys.argv) > 4 else {}
+
+import constants
+for name, value in overrides.items():
+    setattr(constants, name, value)
+
+import kernels
+from sugarscape import SugarScape
+
+if os.path.exists('rl_agent.py'):
+    from rl_agent import AntRLAgent
+    default_agent = AntRLAgent(9, backend='numpy')
+    default_agent.load_model('RL_Models/Broadcast_trained.pth')
+    sampling_agent = None  # Made on first use, as it imports torch
+
+    def make_world(seed, **kwargs):
+        return SugarScape(agent, seed=seed, **kwargs)
+else:
+    default_agent = None
+
+    def make_world(seed, **kwargs):
+        return SugarScape(seed=seed, **kwargs)
+
+
+def play(world, ticks):
+    for t in range(1, ticks + 1):
+        world.update(t)
+        if not world.ants:
+            break
+
+
+def outcome(world):
+    # What the episode ended with: the analytics, every ant's state and what every ant was told
+    return {
+        'analytics': {name: float(value) for name, value in world.get_analytics_data().items()},
+        'ants': [
+            [ant.id, float(ant.x), float(ant.y), float(ant.health), int(ant.lifespan), ant.target, ant.selected_action_characteristics]
+            for ant in world.all_ants
+        ],
+        'knowledge': [
+            sorted([list(location), sorted((name, float(value)) for name, value in counts.items())] for location, counts in ant.communicated_targets.items())
+            for ant in world.all_ants
+        ],
+    }
+
+
+enabled = kernels.ENABLED
+results = []
+for config in configs:
+    config = dict(config)
+    kernels.ENABLED = enabled and config.pop('kernels', True)
+    agent = default_agent
+    if config.pop('sampling', False):
+        if sampling_agent is None:
+            sampling_agent = AntRLAgent(9)
+            sampling_agent.load_model('RL_Models/Broadcast_trained.pth')
+            sampling_agent.is_eval = False
+        agent = sampling_agent
+    reset_from = config.pop('reset_from', None)
+    batched_with = config.pop('batched_with', None)
+    if batched_with is not None:
+        from batched_sugarscape import BatchedSugarScape
+        worlds = BatchedSugarScape(agent, [seed] + batched_with, **config)
+        for t in range(1, ticks + 1):
+            worlds.update(t)
+            if worlds.done():
+                break
+        world = worlds.worlds[0]
+    elif reset_from is None:
+        world = make_world(seed, **config)
+    else:
+        world = make_world(reset_from, **config)
+        play(world, ticks)
+        world.reset(seed)
+    if batched_with is None:
+        play(world, ticks)
+    results.append(outcome(world))
+kernels.ENABLED = enabled
+print(json.dumps(results))
@@ -0,0 +1,140 @@
+import math
+import os
+import sys
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+
+# Checks of every numba kernel against the NumPy code its caller runs without numba, on random
+# inputs: they must agree bit for bit. Run from "RL Simulation" or "Rule Based Simulation":
+#   python kernel_checks.py CHECK
+# Each folder has its own copy of the kernels, compiled with cache=True, so the two copies are only
+# ever loaded in separate processes.
+sys.path.insert(0, os.getcwd())
+
+import constants
+import kernels
+import population
+import spatial_grid
+
+
+def random_points(rng, count, width, height):
+    xs = rng.uniform(0, width, count)
+    ys = rng.uniform(0, height, count)
+    if count:
+        # Points on cell borders and on top of each other
+        xs[:count // 4] = np.round(xs[:count // 4] / 10) * 10
+        ys[:count // 8] = xs[:count // 8]
+    return xs, ys
+
+
+def check_advance():
+    rng = np.random.default_rng(1)
+    for _ in range(50):
+        size = int(rng.integers(1, 300))
+        populations = [population.AntPopulation(size), population.AntPopulation(size)]
+        state = {
+            'x': rng.uniform(-5, constants.GAME_WIDTH + 5, size),
+            'y': rng.uniform(-5, constants.HEIGHT + 5, size),
+            'direction': rng.uniform(0, 2 * math.pi, size),
+            'health': rng.uniform(0, 100, size),
+            'lifespan': rng.integers(0, 1000, size),
+            'is_false_broadcaster': rng.random(size) < 0.2,
+        }
+        indices = np.flatnonzero(rng.random(size) < 0.7)
+        for ants, enabled in zip(populations, (True, False)):
+            ants.size = size
+            for name, values in state.items():
+                ants.arrays[name][:size] = values
+            kernels.ENABLED = enabled
+            ants.advance(indices)
+        kernels.ENABLED = True
+        for name in state:
+            assert np.array_equal(populations[0].arrays[name][:size], populations[1].arrays[name][:size]), name
+
+
+def check_neighbour_lists():
+    rng = np.random.default_rng(2)
+    workers = ThreadPoolExecutor(4)
+    spatial_grid.PARALLEL_MIN_ANTS = 0
+    for _ in range(100):
+        xs, ys = random_points(rng, int(rng.integers(0, 400)), constants.GAME_WIDTH, constants.HEIGHT)
+        radius = float(rng.choice([10.0, 70.0, 98.0, 300.0]))
+        kernels.ENABLED = False
+        starts, columns = spatial_grid.neighbour_lists(xs, ys, radius)
+        kernels.ENABLED = True
+        for pool in (None, workers):
+            compiled_starts, compiled_columns = spatial_grid.neighbour_lists(xs, ys, radius, pool)
+            assert np.array_equal(starts, compiled_starts)
+            assert np.array_equal(columns, compiled_columns)
+    workers.shutdown()
+
+
+def check_within():
+    rng = np.random.default_rng(3)
+    for _ in range(200):
+        xs, ys = random_points(rng, int(rng.integers(1, 300)), 750, 750)
+        indices = np.flatnonzero(rng.random(len(xs)) < 0.5)
+        candidates = rng.permutation(len(indices))
+        x, y = float(rng.uniform(0, 750)), float(rng.uniform(0, 750))
+        radius = float(rng.choice([10.0, 70.0, 80.0]))
+        expected = candidates[np.hypot(xs[indices] - x, ys[indices] - y) <= radius]
+        assert np.array_equal(kernels.within(candidates, indices, xs, ys, x, y, radius), expected)
+
+
+def check_nearby_patches():
+    rng = np.random.default_rng(4)
+    for _ in range(200):
+        xs, ys = random_points(rng, int(rng.integers(0, 100)), 750, 750)
+        patch_xs, patch_ys = random_points(rng, int(rng.integers(0, 20)), 750, 750)
+        reach = float(rng.uniform(10, 200))
+        dx = patch_xs - xs[:, None]
+        dy = patch_ys - ys[:, None]
+        rows, columns = np.nonzero(dx * dx + dy * dy < reach * reach)
+        compiled_rows, compiled_columns = kernels.nearby_patches(xs, ys, patch_xs, patch_ys, reach)
+        assert np.array_equal(rows, compiled_rows)
+        assert np.array_equal(columns, compiled_columns)
+
+
+def check_hypot():
+    rng = np.random.default_rng(5)
+    a = np.concatenate([rng.integers(-750, 750, 20000) - rng.uniform(0, 750, 20000), rng.uniform(-1, 1, 20000) * 10.0 ** rng.uniform(-8, 8, 20000), [0.0, -0.0, 3.0]])
+    b = np.concatenate([rng.integers(-750, 750, 20000) - rng.uniform(0, 750, 20000), rng.uniform(-1, 1, 20000) * 10.0 ** rng.uniform(-8, 8, 20000), [0.0, 4.0, 0.0]])
+    for x, y in zip(a.tolist(), b.tolist()):
+        assert kernels.hypot(x, y) == math.hypot(x, y), (x, y)
+
+
+def check_score_targets():
+    # BaselineAnt.score_targets_batched without the kernel
+    rng = np.random.default_rng(6)
+    for _ in range(200):
+        locations = int(rng.integers(1, 100))
+        coordinates = rng.integers(0, 750, (locations, 2)).astype(float)
+        counts = rng.integers(0, 5, (locations, 3)).astype(np.int32)
+        excluded = rng.random(locations) < 0.2
+        location_ids = rng.permutation(locations)[:int(rng.integers(0, locations + 1))]
+        x, y = float(rng.uniform(0, 750)), float(rng.uniform(0, 750))
+        max_distance = float(rng.uniform(100, 1100))
+
+        kept = location_ids[~excluded[location_ids]]
+        offsets = coordinates[kept] - (x, y)
+        distances = np.array(list(map(math.hypot, offsets[:, 0].tolist(), offsets[:, 1].tolist())))
+        within = distances <= max_distance
+        kept = kept[within]
+        distances = distances[within]
+        confirmed, accepted, rejected = counts[kept, 2], counts[kept, 0], counts[kept, 1]
+        scores = kernels.target_score.py_func(confirmed, accepted, rejected, distances)
+
+        compiled = kernels.score_targets(location_ids, excluded, coordinates, counts, x, y, max_distance, 2, 0, 1)
+        assert np.array_equal(compiled[0], kept)
+        assert np.array_equal(compiled[1], distances)
+        assert np.array_equal(compiled[2], np.cumsum(scores))
+
+
+CHECKS = {name[len('check_'):]: function for name, function in list(globals().items()) if name.startswith('check_')}
+
+if __name__ == '__main__':
+    if not kernels.ENABLED:
+        print('kernels disabled')
+        sys.exit(2)
+    CHECKS[sys.argv[1]]()
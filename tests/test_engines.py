@@ -0,0 +1,150 @@
+import json
+import os
+import subprocess
+import sys
+
+import pytest
+
+# The engine switches only change how a tick is computed, so a seeded episode must end the same way
+# (analytics, ant state and knowledge) whichever of them are on. Each simulation runs in its own
+# process through episode.py, as both folders have modules of the same names.
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+SIMULATIONS = ['RL Simulation', 'Rule Based Simulation']
+MODES = {'broadcast': {}, 'face to face': {'COMMUNICATION_RADIUS': 80}}
+
+
+def run_episodes(simulation, configs, constants=None, seed=3, ticks=3000):
+    # {name: outcome} of an episode for each of the named episode.py configs
+    names = list(configs)
+    command = [
+        sys.executable, os.path.join(ROOT, 'tests', 'episode.py'), str(seed), str(ticks),
+        json.dumps([configs[name] for name in names]), json.dumps(constants or {}),
+    ]
+    result = subprocess.run(command, cwd=os.path.join(ROOT, simulation), capture_output=True, text=True)
+    assert result.returncode == 0, result.stderr
+    return dict(zip(names, json.loads(result.stdout.splitlines()[-1])))
+
+
+def assert_same_episodes(outcomes, reference='default'):
+    for name, outcome in outcomes.items():
+        assert outcome == outcomes[reference], '%s differs from %s' % (name, reference)
+
+
+@pytest.mark.parametrize('simulation', SIMULATIONS)
+def test_batched_moves(simulation):
+    # In face-to-face mode the batched engine sees the others where they started the tick, so it
+    # only matches the one-ant-at-a-time loop when broadcasts reach everyone
+    assert_same_episodes(run_episodes(simulation, {
+        'default': {},
+        'batched moves': {'vectorized': True},
+    }))
+
+
+@pytest.mark.parametrize('simulation', SIMULATIONS)
+def test_bulletin_board(simulation):
+    # With every ant in range, broadcasts go through the bulletin board, which must tell each ant what
+    # copying every broadcast into every receiver tells it
+    assert_same_episodes(run_episodes(simulation, {
+        'default': {},
+        'no bulletin board': {'bulletin_board': False},
+        'batched moves': {'vectorized': True},
+        'batched moves, no bulletin board': {'vectorized': True, 'bulletin_board': False},
+    }))
+
+
+@pytest.mark.parametrize('simulation', SIMULATIONS)
+@pytest.mark.parametrize('mode', MODES)
+def test_reset(simulation, mode):
+    # A world reset in place after an episode of another seed plays the episode a new world plays
+    outcomes = run_episodes(simulation, {
+        'default': {},
+        'reset': {'reset_from': 4},
+        'batched moves': {'vectorized': True},
+        'batched moves, reset': {'vectorized': True, 'reset_from': 4},
+    }, MODES[mode])
+    assert outcomes['reset'] == outcomes['default']
+    assert outcomes['batched moves, reset'] == outcomes['batched moves']
+
+
+@pytest.mark.parametrize('simulation', SIMULATIONS)
+@pytest.mark.parametrize('mode', MODES)
+def test_kernels(simulation, mode):
+    outcomes = run_episodes(simulation, {
+        'default': {},
+        'no kernels': {'kernels': False},
+        'batched moves': {'vectorized': True},
+        'batched moves, no kernels': {'vectorized': True, 'kernels': False},
+    }, MODES[mode])
+    assert outcomes['no kernels'] == outcomes['default']
+    assert outcomes['batched moves, no kernels'] == outcomes['batched moves']
+
+
+@pytest.mark.parametrize('simulation', SIMULATIONS)
+@pytest.mark.parametrize('mode', MODES)
+def test_double_buffered(simulation, mode):
+    # The double-buffered tick changes results, but not with the kernels or from a reused world
+    assert_same_episodes(run_episodes(simulation, {
+        'default': {'double_buffered': True},
+        'no kernels': {'double_buffered': True, 'kernels': False},
+        'reset': {'double_buffered': True, 'reset_from': 4},
+    }, MODES[mode]))
+
+
+@pytest.mark.parametrize('simulation', SIMULATIONS)
+def test_double_buffered_threads(simulation):
+    # Enough ants for the neighbour structures to be built on the shared thread pool
+    constants = dict(MODES['face to face'], NUM_ANTS=150)
+    threaded = run_episodes(simulation, {'default': {'double_buffered': True}}, dict(constants, INTENT_THREADS=3), ticks=500)
+    serial = run_episodes(simulation, {'default': {'double_buffered': True}}, dict(constants, INTENT_THREADS=1), ticks=500)
+    assert threaded == serial
+
+
+@pytest.mark.parametrize('mode', MODES)
+def test_target_scoring(mode):
+    # BaselineAnt scores targets one at a time, as arrays or with the kernel, always alike
+    configs = {'default': {}, 'no kernels': {'kernels': False}}
+    scalar = run_episodes('Rule Based Simulation', configs, dict(MODES[mode], VECTORIZED_SCORING_MIN_TARGETS=10 ** 9))
+    batched = run_episodes('Rule Based Simulation', configs, dict(MODES[mode], VECTORIZED_SCORING_MIN_TARGETS=0))
+    assert_same_episodes(dict(scalar, **{'batched ' + name: outcome for name, outcome in batched.items()}))
+
+
+@pytest.mark.parametrize('simulation', SIMULATIONS)
+@pytest.mark.parametrize('mode', MODES)
+def test_message_queue(simulation, mode):
+    # Queued broadcasts change results, but not with the way the end of the tick delivers them
+    assert_same_episodes(run_episodes(simulation, {
+        'default': {'message_queue': True},
+        'no bulletin board': {'message_queue': True, 'bulletin_board': False},
+        'no kernels': {'message_queue': True, 'kernels': False},
+    }, MODES[mode]))
+
+
+@pytest.mark.parametrize('simulation', SIMULATIONS)
+@pytest.mark.parametrize('mode', MODES)
+def test_event_scheduler(simulation, mode):
+    # Validating, the scheduler gives every ant every turn, so the episode is the per-tick one, and it
+    # raises if a sleeping ant met an event or left its course
+    validated = run_episodes(simulation, {
+        'default': {},
+        'validated': {'event_scheduler': True},
+    }, dict(MODES[mode], EVENT_SCHEDULER_VALIDATE=True))
+    assert_same_episodes(validated)
+    # Skipping turns changes results, but not with the kernels
+    assert_same_episodes(run_episodes(simulation, {
+        'default': {'event_scheduler': True},
+        'no kernels': {'event_scheduler': True, 'kernels': False},
+    }, MODES[mode]))
+
+
+@pytest.mark.parametrize('mode', MODES)
+@pytest.mark.parametrize('sampling', [False, True])
+def test_batched_worlds(mode, sampling):
+    # Each world of a BatchedSugarScape plays the episode it plays on its own, with its own policy stream
+    outcomes = run_episodes('RL Simulation', {
+        'alone': {'vectorized': True, 'sampling': sampling},
+        'batched': {'batched_with': [4, 5], 'sampling': sampling},
+        'alone, batched decisions': {'vectorized': True, 'batched_decisions': True, 'sampling': sampling},
+        'batched, batched decisions': {'batched_with': [4, 5], 'batched_decisions': True, 'sampling': sampling},
+    }, MODES[mode])
+    assert outcomes['batched'] == outcomes['alone']
+    assert outcomes['batched, batched decisions'] == outcomes['alone, batched decisions']
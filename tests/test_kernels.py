@@ -0,0 +1,22 @@
+import os
+import subprocess
+import sys
+
+import pytest
+
+pytest.importorskip('numba')
+
+# The checks of kernel_checks.py, each in its own process in the simulation folder it checks
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+SIMULATIONS = ['RL Simulation', 'Rule Based Simulation']
+CHECKS = ['advance', 'neighbour_lists', 'within', 'nearby_patches', 'hypot', 'score_targets']
+
+
+@pytest.mark.parametrize('check', CHECKS)
+@pytest.mark.parametrize('simulation', SIMULATIONS)
+def test_kernel(simulation, check):
+    command = [sys.executable, os.path.join(ROOT, 'tests', 'kernel_checks.py'), check]
+    result = subprocess.run(command, cwd=os.path.join(ROOT, simulation), capture_output=True, text=True)
+    if result.returncode == 2:
+        pytest.skip('NUMBA_KERNELS is off')
+    assert result.returncode == 0, result.stderr